@@ -9,6 +9,9 @@ import os
 import datetime
 import json
 import random
+import model_store
+import universe
+import trading_calendar
 
 # ===========================
 # ⚙️ 策略設定 (階梯式動態止盈版)
@@ -37,11 +40,7 @@ LOOK_BACK = 60
 PREDICT_DAYS = 10   
 RETRAIN_EVERY_N_DAYS = 20
 
-TICKERS = [
-    'NVDA', 'TSLA', 'AMZN', 'MSFT', 'GOOGL', 'META', 'AAPL', 
-    'AMD', 'INTC', 'QCOM', 'AVGO', 'MU',                     
-    'JPM', 'V', 'DIS', 'NFLX', 'COST', 'PEP', 'KO', 'JNJ'    
-]
+TICKERS = universe.get_tickers("core20")
 
 DATA_DIR = "data"
 MODEL_DIR = "saved_models"
@@ -136,18 +135,9 @@ def predict_future_roi(ticker, current_date, full_data):
         return -999
 
 def save_system_state(run_id):
-    # 保存到 saved_models/latest (方便網頁讀取)
-    save_path = os.path.join(MODEL_DIR, "latest")
-    if not os.path.exists(save_path): os.makedirs(save_path)
-    
-    print(f"\n💾 正在保存模型至: {save_path} ...")
-    
-    count = 0
-    for ticker, info in model_cache.items():
-        model = info['model']
-        model_file = os.path.join(save_path, f"{ticker}.keras")
-        model.save(model_file)
-        count += 1
+    # 保存為新快照並原子切換 latest (方便網頁讀取)
+    print(f"\n💾 正在保存模型快照: {run_id} ...")
+    models = {ticker: info['model'] for ticker, info in model_cache.items()}
         
     config = {
         "LOOK_BACK": LOOK_BACK,
@@ -155,10 +145,9 @@ def save_system_state(run_id):
         "MIN_ROI_THRESHOLD": MIN_ROI_THRESHOLD,
         "TICKERS": TICKERS
     }
-    with open(os.path.join(save_path, "config.json"), "w") as f:
-        json.dump(config, f, indent=4)
+    snapshot_dir = model_store.save_snapshot(models, config, snapshot_id=run_id)
         
-    print(f"✅ 成功保存 {count} 個智能模型！")
+    print(f"✅ 成功保存 {len(models)} 個智能模型！({snapshot_dir})")
 
 def run_backtest():
     print(f"🚀 啟動回測...")
@@ -176,7 +165,12 @@ def run_backtest():
     portfolio = {"cash": INITIAL_CASH, "holdings": None} 
     trade_log = []
     balance_history = []
-    dates = pd.date_range(start=START_DATE, end=END_DATE, freq='B')
+    # 📅 只迭代有 K 線的交易日，當天有資料的股票事先整理好
+    dates = trading_calendar.sessions(full_data, START_DATE, END_DATE)
+    if len(dates) == 0:
+        print("❌ 回測區間內沒有任何 K 線資料")
+        return
+    on_date = trading_calendar.members(full_data, dates, TICKERS)
     next_trade_date = dates[0]
     
     total_steps = len(dates)
@@ -185,10 +179,7 @@ def run_backtest():
         date_str = current_date.strftime("%Y-%m-%d")
         if idx % 10 == 0: print(f"📅 {date_str} ({idx}/{total_steps})", end='\r')
 
-        market_prices = {}
-        for t in TICKERS:
-            if t in full_data and current_date in full_data[t].index:
-                market_prices[t] = full_data[t].loc[current_date]['Close']
+        market_prices = {t: full_data[t].loc[current_date]['Close'] for t in on_date[current_date]}
         
         if not market_prices: continue
         
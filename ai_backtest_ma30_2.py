@@ -1,367 +1,496 @@
-import numpy as np
-import pandas as pd
-import yfinance as yf
-from sklearn.preprocessing import MinMaxScaler
-from tensorflow.keras.models import Sequential, load_model
-from tensorflow.keras.layers import LSTM, Dense, Input, Dropout
-import tensorflow as tf
-import os
-import datetime
-import json
-import random
-import ta
-# 報酬率100%+
-# tab4
-# ===========================
-# ⚙️ 策略設定 (Top 3 動能 + MA30 確認 + 無限奔跑)
-# ===========================
-INITIAL_CASH = 10000
-START_DATE = "2025-01-01"
-END_DATE = datetime.datetime.now().strftime("%Y-%m-%d")
-TRANSACTION_FEE = 2.0  
-
-BUY_PROB_THRESHOLD = 0.55
-TARGET_ROI_CLASS = 0.03 
-
-TIME_STOP_DAYS = 20       
-ATR_STOP_LOSS_MULTIPLIER = 2.5 
-# 🔥 [回歸寬鬆] 移除緊縮止損，讓獲利奔跑
-# ATR_TRAILING_MULTIPLIER = 1.5 
-
-STRONG_DROP_TOLERANCE = 0.05 
-WEAK_DROP_TOLERANCE = 0.025  
-
-ALLOCATION_PCT = 0.33 
-TOP_N_MOMENTUM = 3 
-STOP_LOSS_COOLDOWN_DAYS = 10
-
-# MA30 濾網
-MA30_BREAKOUT_BUFFER = 1.01 
-
-LOOK_BACK = 60      
-PREDICT_DAYS = 10   
-RETRAIN_EVERY_N_DAYS = 20
-
-# 🔥 [剔除弱勢股] 移除 INTC，保留強勢科技股
-TICKERS = [
-    'NVDA', 'TSLA', 'AMZN', 'MSFT', 'GOOGL', 'META', 'AAPL', 
-    'AMD', 'QCOM', 'AVGO', 'MU',                     
-    'JPM', 'V', 'DIS', 'NFLX', 'COST', 'PEP', 'KO', 'JNJ'    
-]
-
-MARKET_INDEX = 'QQQ' 
-
-DATA_DIR = "data"
-MODEL_DIR = "saved_models"
-if not os.path.exists(DATA_DIR): os.makedirs(DATA_DIR)
-if not os.path.exists(MODEL_DIR): os.makedirs(MODEL_DIR)
-
-seed_value = 42
-os.environ['PYTHONHASHSEED'] = str(seed_value)
-random.seed(seed_value)
-np.random.seed(seed_value)
-tf.random.set_seed(seed_value)
-
-model_cache = {} 
-
-def add_technical_indicators(df):
-    df['RSI'] = ta.momentum.rsi(df['Close'], window=14)
-    macd = ta.trend.MACD(df['Close'])
-    df['MACD'] = macd.macd()
-    df['ATR'] = ta.volatility.average_true_range(df['High'], df['Low'], df['Close'], window=14)
-    df['EMA20'] = ta.trend.ema_indicator(df['Close'], window=20)
-    df['EMA60'] = ta.trend.ema_indicator(df['Close'], window=60)
-    
-    # MA30
-    df['MA30'] = ta.trend.sma_indicator(df['Close'], window=30)
-    df['MA30_Slope'] = df['MA30'].diff()
-    df['Price_Change'] = df['Close'].diff()
-    
-    df.fillna(method='bfill', inplace=True)
-    return df
-
-def prepare_data(df, look_back):
-    if len(df) < look_back + PREDICT_DAYS + 10: return None, None, None, None
-    features = ['Close', 'Volume', 'RSI', 'MACD', 'ATR', 'MA30'] 
-    data = df[features].values
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    scaled_data = scaler.fit_transform(data)
-    
-    x_train, y_train = [], []
-    start_idx = max(look_back, len(scaled_data) - 500) 
-    
-    for i in range(start_idx, len(scaled_data) - PREDICT_DAYS):
-        x_train.append(scaled_data[i-look_back:i])
-        current_close = df['Close'].iloc[i]
-        future_high = df['Close'].iloc[i+1 : i+1+PREDICT_DAYS].max()
-        actual_roi = (future_high - current_close) / current_close
-        
-        if actual_roi > TARGET_ROI_CLASS:
-            y_train.append(1)
-        else:
-            y_train.append(0)
-        
-    x_train, y_train = np.array(x_train), np.array(y_train)
-    if len(x_train) == 0: return None, None, None, None
-    return x_train, y_train, scaler, scaled_data
-
-def build_model(input_shape):
-    model = Sequential()
-    model.add(Input(shape=input_shape))
-    model.add(LSTM(100, return_sequences=True))
-    model.add(Dropout(0.2))
-    model.add(LSTM(50, return_sequences=False))
-    model.add(Dropout(0.2))
-    model.add(Dense(32, activation='relu'))
-    model.add(Dense(1, activation='sigmoid'))
-    model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
-    return model
-
-def predict_signal(ticker, current_date, full_data):
-    try:
-        if ticker not in full_data: return 0.0
-        df = full_data[ticker]
-        mask = df.index < current_date
-        past_df = df.loc[mask]
-        if len(past_df) < LOOK_BACK + 20: return 0.0
-
-        x_train, y_train, scaler, scaled_data = prepare_data(past_df, LOOK_BACK)
-        if x_train is None: return 0.0
-
-        global model_cache
-        model_info = model_cache.get(ticker)
-        model = None
-        needs_training = False
-
-        if model_info is None:
-            model = build_model((x_train.shape[1], x_train.shape[2]))
-            needs_training = True
-        else:
-            model = model_info['model']
-            last_train = model_info['last_train_date']
-            days_diff = (current_date - last_train).days
-            if days_diff >= RETRAIN_EVERY_N_DAYS:
-                needs_training = True
-        
-        if needs_training:
-            model.fit(x_train, y_train, batch_size=32, epochs=10, verbose=0)
-            model_cache[ticker] = {'model': model, 'last_train_date': current_date}
-        
-        last_sequence = scaled_data[-LOOK_BACK:]
-        curr_input = last_sequence.reshape(1, LOOK_BACK, scaled_data.shape[1])
-        prob = model.predict(curr_input, verbose=0)[0][0]
-        return float(prob)
-        
-    except Exception as e:
-        return 0.0
-
-def save_system_state(run_id):
-    save_path = os.path.join(MODEL_DIR, "latest")
-    if not os.path.exists(save_path): os.makedirs(save_path)
-    count = 0
-    for ticker, info in model_cache.items():
-        model = info['model']
-        model_file = os.path.join(save_path, f"{ticker}.keras")
-        model.save(model_file)
-        count += 1
-    config = {
-        "LOOK_BACK": LOOK_BACK,
-        "PREDICT_DAYS": PREDICT_DAYS,
-        "MIN_ROI_THRESHOLD": 0, 
-        "TICKERS": TICKERS
-    }
-    with open(os.path.join(save_path, "config.json"), "w") as f:
-        json.dump(config, f, indent=4)
-    print(f"✅ 成功保存 {count} 個智能分類模型！")
-
-def run_backtest():
-    print(f"🚀 啟動回測 (Top 3 動能 + MA30確認 + 無限奔跑)...")
-    
-    full_data = {}
-    download_start = (datetime.datetime.strptime(START_DATE, "%Y-%m-%d") - datetime.timedelta(days=1000)).strftime("%Y-%m-%d")
-    
-    print("📥 下載個股數據...")
-    for t in TICKERS:
-        try:
-            df = yf.download(t, start=download_start, end=END_DATE, progress=False)
-            if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
-            if not df.empty: 
-                df = add_technical_indicators(df)
-                full_data[t] = df
-        except: pass
-
-    print("📥 下載大盤數據 (QQQ)...")
-    market_df = yf.download(MARKET_INDEX, start=download_start, end=END_DATE, progress=False)
-    if isinstance(market_df.columns, pd.MultiIndex): market_df.columns = market_df.columns.get_level_values(0)
-    market_df = add_technical_indicators(market_df)
-
-    portfolio = {"cash": INITIAL_CASH, "holdings": []} 
-    trade_log = []
-    balance_history = []
-    dates = pd.date_range(start=START_DATE, end=END_DATE, freq='B')
-    next_trade_date = dates[0]
-    cooldown_list = {} 
-    
-    total_steps = len(dates)
-
-    for idx, current_date in enumerate(dates):
-        date_str = current_date.strftime("%Y-%m-%d")
-        if idx % 10 == 0: print(f"📅 {date_str} ({idx}/{total_steps})", end='\r')
-
-        market_prices = {}
-        momentum_scores = [] 
-
-        for t in TICKERS:
-            if t in full_data and current_date in full_data[t].index:
-                market_prices[t] = full_data[t].loc[current_date]['Close']
-                
-                # 計算動能分數 (Price / EMA60)
-                ema60 = full_data[t].loc[current_date]['EMA60']
-                if ema60 > 0:
-                    score = market_prices[t] / ema60
-                    momentum_scores.append((t, score))
-        
-        if not market_prices: continue
-        
-        # 🔥 第一層：只取前三名強勢股 (Relative Strength)
-        momentum_scores.sort(key=lambda x: x[1], reverse=True)
-        top_tickers = [x[0] for x in momentum_scores[:TOP_N_MOMENTUM]]
-        
-        # --- 賣出檢查 ---
-        for h in portfolio["holdings"][:]: 
-            ticker = h["Ticker"]
-            if ticker in market_prices:
-                curr_price = market_prices[ticker]
-                ema20 = full_data[ticker].loc[current_date]['EMA20']
-                
-                if curr_price > h["Highest"]: h["Highest"] = curr_price
-                
-                entry_price = h["Entry"]
-                highest_price = h["Highest"]
-                atr_stop_price = h.get("ATR_Stop_Price", 0)
-                
-                pnl_pct = (curr_price - entry_price) / entry_price
-                drop_from_peak = (curr_price - highest_price) / highest_price
-                held_days = (current_date - h["BuyDate"]).days
-                
-                sell_reason = None
-                is_strong = curr_price > ema20
-                
-                # 🔥 [回歸寬鬆] 不主動止盈，只在趨勢反轉時賣出
-                if curr_price <= atr_stop_price:
-                    sell_reason = f"🛑 ATR止損"
-                    cooldown_list[ticker] = current_date + datetime.timedelta(days=STOP_LOSS_COOLDOWN_DAYS)
-                else:
-                    if is_strong:
-                        if drop_from_peak <= -STRONG_DROP_TOLERANCE: sell_reason = f"📉 強勢回調"
-                    else:
-                        if drop_from_peak <= -WEAK_DROP_TOLERANCE: sell_reason = f"🏃 弱勢反彈"
-                
-                if not sell_reason and held_days >= TIME_STOP_DAYS: sell_reason = f"⏰ 到期"
-                
-                if sell_reason:
-                    gross_revenue = h["Shares"] * curr_price
-                    net_revenue = gross_revenue - TRANSACTION_FEE
-                    total_cost = (h["Shares"] * h["Entry"]) + TRANSACTION_FEE
-                    net_profit = net_revenue - total_cost
-                    net_profit_pct = (net_profit / total_cost) * 100
-                    
-                    portfolio["cash"] += net_revenue 
-                    portfolio["holdings"].remove(h)
-                    
-                    trade_log.append({
-                        "Date": date_str, "Action": "SELL", "Ticker": ticker, "Price": curr_price, 
-                        "Reason": sell_reason, "Profit_USD": net_profit, "Profit_Pct": net_profit_pct, "Balance": portfolio["cash"]
-                    })
-                    profit_emoji = "🟢" if net_profit > 0 else "🔴"
-                    trend_tag = "🔥" if is_strong else "❄️"
-                    print(f"\n[{date_str}] 賣出 {ticker} {trend_tag}: {sell_reason}")
-                    print(f"   └── {profit_emoji} 淨損益: ${net_profit:.2f} ({net_profit_pct:.2f}%) | 目前資產: ${portfolio['cash']:.2f}")
-
-        # --- 買入檢查 ---
-        if len(portfolio["holdings"]) < 3 and current_date >= next_trade_date:
-            
-            is_market_bullish = False
-            if current_date in market_df.index:
-                if market_df.loc[current_date]['Close'] > market_df.loc[current_date]['EMA60']:
-                    is_market_bullish = True
-            
-            if is_market_bullish:
-                current_holdings_tickers = [h['Ticker'] for h in portfolio["holdings"]]
-                
-                best_ticker, best_prob = None, 0.0
-                for t in top_tickers: # 只看 Top 3
-                    if t in current_holdings_tickers: continue 
-                    if t in cooldown_list:
-                        if current_date < cooldown_list[t]: continue
-                        else: del cooldown_list[t]
-                    
-                    # 🔥 第二層：MA30 確認 (Absolute Trend)
-                    # 確保龍頭股不是處於下跌修正中
-                    ma30 = full_data[t].loc[current_date]['MA30']
-                    ma30_slope = full_data[t].loc[current_date]['MA30_Slope']
-                    curr_p = market_prices[t]
-                    
-                    # 條件：MA30 向上 且 股價站上 MA30
-                    if ma30_slope > 0 and curr_p > (ma30 * MA30_BREAKOUT_BUFFER):
-                        prob = predict_signal(t, current_date, full_data)
-                        if prob > best_prob:
-                            best_prob = prob
-                            best_ticker = t
-                
-                if best_prob > BUY_PROB_THRESHOLD and best_ticker:
-                    current_price = market_prices[best_ticker]
-                    current_atr = full_data[best_ticker].loc[current_date]['ATR']
-                    
-                    total_equity = portfolio["cash"]
-                    for h in portfolio["holdings"]:
-                        if h["Ticker"] in market_prices:
-                            total_equity += h["Shares"] * market_prices[h["Ticker"]]
-                    
-                    invest_budget = total_equity * ALLOCATION_PCT
-                    if invest_budget > portfolio["cash"]: invest_budget = portfolio["cash"]
-                    
-                    available_cash_for_trade = invest_budget - TRANSACTION_FEE
-                    
-                    if available_cash_for_trade > current_price:
-                        shares = available_cash_for_trade / current_price
-                        portfolio["cash"] -= (shares * current_price + TRANSACTION_FEE)
-                        
-                        atr_stop_price = current_price - (current_atr * ATR_STOP_LOSS_MULTIPLIER)
-                        
-                        new_holding = {
-                            "Ticker": best_ticker, 
-                            "Shares": shares, 
-                            "Entry": current_price, 
-                            "Highest": current_price, 
-                            "BuyDate": current_date,
-                            "Probability": best_prob,
-                            "ATR_Stop_Price": atr_stop_price
-                        }
-                        portfolio["holdings"].append(new_holding)
-                        
-                        trade_log.append({
-                            "Date": date_str, "Action": "BUY", "Ticker": best_ticker, "Price": current_price, 
-                            "Reason": f"Top3+MA30+AI {best_prob*100:.1f}%", "Profit_USD": 0, "Profit_Pct": 0, "Balance": portfolio["cash"]
-                        })
-                        print(f"\n[{date_str}] 🚀 冠軍買入 {best_ticker} (勝率 {best_prob*100:.1f}%) | 倉位: 33%")
-            
-            if len(portfolio["holdings"]) == 0:
-                next_trade_date = current_date + datetime.timedelta(days=1)
-
-        equity = portfolio["cash"]
-        for h in portfolio["holdings"]:
-            if h["Ticker"] in market_prices:
-                equity += h["Shares"] * market_prices[h["Ticker"]]
-        balance_history.append({"Date": date_str, "Equity": equity})
-
-    run_id = datetime.datetime.now().strftime("%Y%m%d_%H%M")
-    final_equity = balance_history[-1]['Equity']
-    print(f"\n🏁 最終資產: ${final_equity:.2f} | 總報酬: {(final_equity - INITIAL_CASH) / INITIAL_CASH * 100:.1f}%")
-    
-    pd.DataFrame(trade_log).to_csv(os.path.join(DATA_DIR, "ai_backtest_ma30_log.csv"), index=False)
-    pd.DataFrame(balance_history).to_csv(os.path.join(DATA_DIR, "ai_backtest_ma30_balance.csv"), index=False)
-    save_system_state(run_id) 
-
-if __name__ == "__main__":
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from tensorflow.keras.models import Sequential, load_model
+from tensorflow.keras.layers import LSTM, Dense, Input, Dropout
+import tensorflow as tf
+import os
+import sys
+import datetime
+import json
+import random
+import ta
+import model_store
+import ai_training
+import feature_panel
+import scaling
+import distill
+import profiler
+import universe
+import ranking
+import checkpoint
+import event_log
+import trading_calendar
+import sim_kernel
+# 報酬率100%+
+# tab4
+# ===========================
+# ⚙️ 策略設定 (Top 3 動能 + MA30 確認 + 無限奔跑)
+# ===========================
+INITIAL_CASH = 10000
+START_DATE = "2025-01-01"
+END_DATE = datetime.datetime.now().strftime("%Y-%m-%d")
+TRANSACTION_FEE = 2.0  
+
+BUY_PROB_THRESHOLD = 0.55
+TARGET_ROI_CLASS = 0.03 
+
+TIME_STOP_DAYS = 20       
+ATR_STOP_LOSS_MULTIPLIER = 2.5 
+# 🔥 [回歸寬鬆] 移除緊縮止損，讓獲利奔跑
+# ATR_TRAILING_MULTIPLIER = 1.5 
+
+STRONG_DROP_TOLERANCE = 0.05 
+WEAK_DROP_TOLERANCE = 0.025  
+
+ALLOCATION_PCT = 0.33 
+TOP_N_MOMENTUM = 3 
+STOP_LOSS_COOLDOWN_DAYS = 10
+
+# MA30 濾網
+MA30_BREAKOUT_BUFFER = 1.01 
+
+LOOK_BACK = 60      
+FEATURES = ['Close', 'Volume', 'RSI', 'MACD', 'ATR', 'MA30']
+PREDICT_DAYS = 10   
+RETRAIN_EVERY_N_DAYS = 20
+LSTM_UNITS = (100, 50)   # 兩層 LSTM 的單元數 (hyper_search.py 會搜尋這組)
+
+# 🔥 [剔除弱勢股] 移除 INTC，保留強勢科技股 (清單定義在 universe.json，可用 UNIVERSE=sp500 切換)
+TICKERS = universe.get_tickers("ma30")
+
+MARKET_INDEX = 'QQQ' 
+
+DATA_DIR = "data"
+MODEL_DIR = "saved_models"
+if not os.path.exists(DATA_DIR): os.makedirs(DATA_DIR)
+if not os.path.exists(MODEL_DIR): os.makedirs(MODEL_DIR)
+
+seed_value = 42
+os.environ['PYTHONHASHSEED'] = str(seed_value)
+random.seed(seed_value)
+np.random.seed(seed_value)
+tf.random.set_seed(seed_value)
+
+model_cache = {} 
+scaler_cache = {}   # 每檔股票逐日累積的 min/max，predict_signal 查表取當天的縮放參數
+prob_table = {}     # (日期, 股票) -> 勝率；每次重訓後整段凍結期一次算好，日迴圈只查表
+drift_log = []
+
+CHECKPOINT_NAME = "ai_backtest_ma30"
+
+def checkpoint_config():
+    # 這些設定改變時，舊的檢查點就不能接續
+    return {"START_DATE": START_DATE, "INITIAL_CASH": INITIAL_CASH, "TICKERS": TICKERS, "LOOK_BACK": LOOK_BACK,
+            "BUY_PROB_THRESHOLD": BUY_PROB_THRESHOLD, "TOP_N_MOMENTUM": TOP_N_MOMENTUM, "MA30_BREAKOUT_BUFFER": MA30_BREAKOUT_BUFFER, "RETRAIN_EVERY_N_DAYS": RETRAIN_EVERY_N_DAYS,
+            "RETRAIN_MODE": ai_training.RETRAIN_MODE, "SIGNAL_BACKEND": distill.BACKEND, "SIM_KERNEL": sim_kernel.ENABLED}
+
+def add_technical_indicators(df):
+    df['RSI'] = ta.momentum.rsi(df['Close'], window=14)
+    macd = ta.trend.MACD(df['Close'])
+    df['MACD'] = macd.macd()
+    df['ATR'] = ta.volatility.average_true_range(df['High'], df['Low'], df['Close'], window=14)
+    df['EMA20'] = ta.trend.ema_indicator(df['Close'], window=20)
+    df['EMA60'] = ta.trend.ema_indicator(df['Close'], window=60)
+    
+    # MA30
+    df['MA30'] = ta.trend.sma_indicator(df['Close'], window=30)
+    df['MA30_Slope'] = df['MA30'].diff()
+    df['Price_Change'] = df['Close'].diff()
+    
+    df.fillna(method='bfill', inplace=True)
+    return df
+
+def prepare_data(df, look_back, as_dataset=False, cutoff=None, scaler=None, target_roi=TARGET_ROI_CLASS):
+    # as_dataset=True 時 x_train 回傳 tf.data.Dataset (視窗延遲切片)，y_train 仍是標籤陣列
+    # 標籤由 feature_panel.add_labels 事先算好 (沒有時當場算)，這裡只切片；cutoff 為訓練截止日
+    # scaler: 查表得到的縮放參數 (scaling.at)，沒給時用整段 df fit；回傳的 scaled_data 只含視窗用到的最後一段
+    if len(df) < look_back + PREDICT_DAYS + 10: return None, None, None, None
+    data = df[FEATURES].values
+    if scaler is None: scaler = scaling.fit(data, FEATURES)
+    
+    x_train = []
+    start_idx = max(look_back, len(data) - 500) 
+    # 只縮放視窗用得到的最後一段 (最早的視窗從 start_idx - look_back 開始)
+    first = start_idx - look_back
+    scaled_data = scaling.transform(scaler, data[first:])
+    
+    end_idx = len(data) - PREDICT_DAYS
+    if not as_dataset:
+        for i in range(start_idx, end_idx):
+            x_train.append(scaled_data[i-first-look_back:i-first])
+    y_train = feature_panel.label_slice(df, start_idx, end_idx, PREDICT_DAYS, target_roi, cutoff)
+    x_train = np.array(x_train)
+    if len(y_train) == 0: return None, None, None, None
+    if as_dataset:
+        x_train = ai_training.make_window_dataset(scaled_data, y_train, look_back, look_back, batch_size=32)
+    return x_train, y_train, scaler, scaled_data
+
+def build_model(input_shape, units=LSTM_UNITS):
+    model = Sequential()
+    model.add(Input(shape=input_shape))
+    model.add(LSTM(units[0], return_sequences=True))
+    model.add(Dropout(0.2))
+    model.add(LSTM(units[1], return_sequences=False))
+    model.add(Dropout(0.2))
+    model.add(Dense(32, activation='relu'))
+    model.add(Dense(1, activation='sigmoid'))
+    model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+    return model
+
+def predict_signal(ticker, current_date, full_data):
+    try:
+        if ticker not in full_data: return 0.0
+        prob = prob_table.get((current_date, ticker))
+        if prob is not None: return prob
+        df = full_data[ticker]
+        mask = df.index < current_date
+        past_df = df.loc[mask]
+        if len(past_df) < LOOK_BACK + 20: return 0.0
+
+        global model_cache
+        model_info = model_cache.get(ticker)
+        running = scaler_cache.get(ticker)
+        needs_training = model_info is None or (current_date - model_info['last_train_date']).days >= RETRAIN_EVERY_N_DAYS
+        
+        if needs_training:
+            # warm 模式的微調樣本很少，直接用 NumPy；完整重訓才走 tf.data
+            use_dataset = ai_training.USE_TF_DATA and (model_info is None or not ai_training.is_warm_mode()) and not distill.is_student_backend()
+            with profiler.timer("prepare_data"):
+                scaler = scaling.at(running, len(past_df)) if running else None
+                x_train, y_train, scaler, scaled_data = prepare_data(past_df, LOOK_BACK, as_dataset=use_dataset, cutoff=current_date, scaler=scaler)
+            if x_train is None: return 0.0
+
+            profiler.count("retrain")
+            teacher_info = {}
+            with profiler.timer("model.fit"):
+                dates = ai_training.window_dates(past_df.index, len(y_train), PREDICT_DAYS)
+                if distill.is_student_backend():
+                    # 🎓 老師 (LSTM) 久久才重訓一次，這裡只用老師的軟標籤訓練小型學生模型
+                    teacher_info = distill.retrain(model_info, build_model, x_train, y_train, current_date)
+                    model = teacher_info.pop('model')
+                else:
+                    model = model_info['model'] if model_info is not None else build_model((LOOK_BACK, scaled_data.shape[1]))
+                    if model_info is not None and ai_training.is_warm_mode():
+                        # 🔁 增量微調：只學上次訓練之後新增的視窗 (+ 回放舊樣本)
+                        ai_training.incremental_fit(model, x_train, y_train, dates, model_info['last_label_date'])
+                        if ai_training.DRIFT_REPORT:
+                            x_eval = np.concatenate([x_train[-RETRAIN_EVERY_N_DAYS:], scaled_data[-LOOK_BACK:][np.newaxis]])
+                            drift = ai_training.full_refit_drift(model, build_model, x_train, y_train, x_eval, BUY_PROB_THRESHOLD)
+                            drift_log.append({"Date": current_date.strftime("%Y-%m-%d"), "Ticker": ticker, **drift})
+                    elif use_dataset:
+                        model.fit(x_train, epochs=10, shuffle=False, verbose=0) # 資料集本身已用固定種子洗牌
+                    else:
+                        model.fit(x_train, y_train, batch_size=32, epochs=10, verbose=0)
+            model_cache[ticker] = {'model': model, 'last_train_date': current_date, 'last_label_date': dates[-1], 'scaler': scaler, **teacher_info}
+        
+        # 模型在下次重訓前不會變: 從今天到凍結期結束的每一天一次批次算完 (從檢查點接續時也是從今天補算)
+        days = ai_training.block_days(current_date, model_cache[ticker]['last_train_date'], RETRAIN_EVERY_N_DAYS, calendar=df.index)
+        profiler.count("predict_block")
+        with profiler.timer("model.predict"):
+            probs = ai_training.score_block(model_cache[ticker]['model'], df, FEATURES, days, LOOK_BACK, running)
+        prob_table.update({(d, ticker): p for d, p in probs.items()})
+        return probs[current_date]
+        
+    except Exception as e:
+        return 0.0
+
+def save_system_state(run_id):
+    # 寫入新快照後才原子切換 latest，掃描器不會讀到寫一半的模型
+    models = {ticker: info['model'] for ticker, info in model_cache.items()}
+    scalers = {ticker: scaling.to_json(info['scaler']) for ticker, info in model_cache.items() if info.get('scaler')}
+    config = {
+        "LOOK_BACK": LOOK_BACK,
+        "PREDICT_DAYS": PREDICT_DAYS,
+        "MIN_ROI_THRESHOLD": 0, 
+        "TICKERS": TICKERS
+    }
+    snapshot_dir = model_store.save_snapshot(models, config, snapshot_id=run_id, ref=model_store.STRATEGY_REFS["ma30"], scalers=scalers)
+    print(f"✅ 成功保存 {len(models)} 個智能分類模型！({snapshot_dir})")
+    return snapshot_dir
+
+def download_data(download_start):
+    print(f"📥 下載個股數據 ({len(TICKERS)} 檔)...")
+    raw_data = universe.download_universe(TICKERS, download_start, END_DATE)
+    
+    # 🌐 第一階段：整個面板一次算出每天的篩選結果，只有進過短名單的股票才跑完整指標
+    full_data = {}
+    if raw_data:
+        stage = universe.stage_one(universe.close_panel(raw_data))
+        shortlist = universe.shortlisted_tickers(universe.momentum_top_n(stage, TOP_N_MOMENTUM) & universe.ma30_trend(stage, MA30_BREAKOUT_BUFFER), START_DATE, END_DATE)
+        for t, df in raw_data.items():
+            if t in shortlist: full_data[t] = add_technical_indicators(df)
+            else: full_data[t] = universe.stage_one_frame(stage, t, ['Close', 'EMA60', 'MA30', 'MA30_Slope'])
+        print(f"🌐 第一階段篩選: {len(shortlist)}/{len(raw_data)} 檔進入 LSTM 評分")
+
+    print("📥 下載大盤數據 (QQQ)...")
+    market_df = yf.download(MARKET_INDEX, start=download_start, end=END_DATE, progress=False)
+    if isinstance(market_df.columns, pd.MultiIndex): market_df.columns = market_df.columns.get_level_values(0)
+    market_df = add_technical_indicators(market_df)
+    return full_data, market_df
+
+def load_inputs():
+    # 個股 / 大盤資料、訓練標籤與逐日縮放範圍 (sim_kernel 同步多個策略時也直接用這份)
+    download_start = (datetime.datetime.strptime(START_DATE, "%Y-%m-%d") - datetime.timedelta(days=1000)).strftime("%Y-%m-%d")
+    
+    # 🧱 有共享特徵面板時直接 mmap 讀取，不再下載與重算指標
+    full_data = feature_panel.load_full_data(TICKERS + [MARKET_INDEX])
+    if full_data and MARKET_INDEX in full_data:
+        print(f"🧱 使用共享特徵面板 {feature_panel.PANEL_DIR} ({len(full_data) - 1} 檔個股)")
+        market_df = full_data.pop(MARKET_INDEX)
+    else:
+        with profiler.timer("download"):
+            full_data, market_df = download_data(download_start)
+
+    # 🏷️ 每檔股票的訓練標籤與逐日累積的縮放範圍只算一次，predict_signal 每次只切片 / 查表
+    with profiler.timer("labels"):
+        scaler_cache.clear()
+        prob_table.clear()
+        for t, df in full_data.items():
+            feature_panel.add_labels(df, PREDICT_DAYS, TARGET_ROI_CLASS)
+            if all(f in df.columns for f in FEATURES): scaler_cache[t] = scaling.expanding(df[FEATURES].values, FEATURES)
+    return full_data, market_df
+
+def run_backtest(inputs=None):
+    print(f"🚀 啟動回測 (Top 3 動能 + MA30確認 + 無限奔跑)...")
+    
+    # inputs: 已經載入的 load_inputs() 結果 (例如先填好勝率表再回測)
+    full_data, market_df = inputs or load_inputs()
+
+    portfolio = {"cash": INITIAL_CASH, "holdings": []} 
+    trade_log = []
+    balance_history = []
+    # 📅 交易日 = 個股與大盤 K 線日期的聯集 (不再跑休市的工作日)
+    dates = trading_calendar.sessions(list(full_data.values()) + [market_df], START_DATE, END_DATE)
+    if len(dates) == 0:
+        print("❌ 回測區間內沒有任何 K 線資料")
+        return
+    next_trade_date = dates[0]
+    cooldown_list = {} 
+    
+    # 🏆 每天的動能 Top N 事先整個面板一次算好，迴圈內只做查表
+    with profiler.timer("ranking"):
+        rank = ranking.from_full_data(full_data, TICKERS, TOP_N_MOMENTUM)
+
+    # ⏯️ 有檢查點時從上次最後處理的交易日之後接著跑，不必從 START_DATE 重播與重訓
+    state = checkpoint.load(CHECKPOINT_NAME, checkpoint_config())
+    if state and not checkpoint.prices_match(state, ranking.prices_on(rank, state["last_date"])):
+        print("⚠️ 持倉股票的歷史價格已被修正，改為完整回放。")
+        state = None
+    if state:
+        portfolio, cooldown_list, next_trade_date = state["portfolio"], state["cooldown_list"], state["next_trade_date"]
+        model_cache.clear()
+        model_cache.update(checkpoint.restore_model_cache(state["model_snapshot"], state["model_meta"]))
+        dates = dates[dates > state["last_date"]]
+        print(f"⏯️ 從檢查點接續 ({state['last_date']:%Y-%m-%d} 之後，{len(dates)} 個交易日，{len(model_cache)} 個模型)")
+    last_date = state["last_date"] if state else None
+
+    # 📝 交易與資產邊跑邊寫進事件日誌，中途當機也保得住已經跑完的部分
+    log_file = os.path.join(DATA_DIR, "ai_backtest_ma30_log.csv")
+    balance_file = os.path.join(DATA_DIR, "ai_backtest_ma30_balance.csv")
+    drift_file = os.path.join(DATA_DIR, "ai_backtest_ma30_drift.csv")
+    if state:
+        event_log.truncate_after(log_file, last_date.strftime("%Y-%m-%d"))
+        event_log.truncate_after(balance_file, last_date.strftime("%Y-%m-%d"))
+    log_stream = event_log.open_stream(log_file, reset=not state)
+    balance_stream = event_log.open_stream(balance_file, reset=not state)
+
+    if sim_kernel.ENABLED and len(dates):
+        # ⚡ SIM_KERNEL=1: 勝率表先沿固定排程一次填好 (每天動能前 N 名都評分，重訓時點與持倉無關)，
+        # 每日的 ATR 止損 / 移動停利 / 到期與買進規則改由編譯核心跑完 (portfolio / cooldown_list 會更新成跑完後的狀態)
+        with profiler.timer("prob_table"):
+            ai_training.fill_prob_table(predict_signal, prob_table, rank, dates, full_data)
+        with profiler.timer("sim_kernel"):
+            model = sim_kernel.ai_model(sys.modules[__name__], full_data, market_df, rank)
+            trade_log, balance_history = sim_kernel.run_ai("ma30", model, dates, portfolio, cooldown_list)
+        for row in trade_log: event_log.append(log_stream, row)
+        for row in balance_history: event_log.append(balance_stream, row)
+        if balance_history:
+            last_date = pd.Timestamp(balance_history[-1]["Date"])
+            # 只有接續時才會用到；比最後處理日晚一天以內的值效果都一樣
+            if not portfolio["holdings"]: next_trade_date = last_date + datetime.timedelta(days=1)
+        dates = dates[:0]   # 下面的逐日迴圈不必再跑
+    
+    total_steps = len(dates)
+
+    for idx, current_date in enumerate(dates):
+        profiler.lap("day_loop")
+        date_str = current_date.strftime("%Y-%m-%d")
+        if idx % 10 == 0: print(f"📅 {date_str} ({idx}/{total_steps})", end='\r')
+
+        market_prices = ranking.prices_on(rank, current_date)
+        if not market_prices: continue
+        last_date = current_date
+        
+        # 🔥 第一層：只取前三名強勢股 (Relative Strength，動能分數 = Price / EMA60)
+        top_tickers = ranking.top_tickers(rank, current_date)
+        
+        # --- 賣出檢查 ---
+        for h in portfolio["holdings"][:]: 
+            ticker = h["Ticker"]
+            if ticker in market_prices:
+                curr_price = market_prices[ticker]
+                ema20 = full_data[ticker].loc[current_date]['EMA20']
+                
+                if curr_price > h["Highest"]: h["Highest"] = curr_price
+                
+                entry_price = h["Entry"]
+                highest_price = h["Highest"]
+                atr_stop_price = h.get("ATR_Stop_Price", 0)
+                
+                pnl_pct = (curr_price - entry_price) / entry_price
+                drop_from_peak = (curr_price - highest_price) / highest_price
+                held_days = (current_date - h["BuyDate"]).days
+                
+                sell_reason = None
+                is_strong = curr_price > ema20
+                
+                # 🔥 [回歸寬鬆] 不主動止盈，只在趨勢反轉時賣出
+                if curr_price <= atr_stop_price:
+                    sell_reason = f"🛑 ATR止損"
+                    cooldown_list[ticker] = current_date + datetime.timedelta(days=STOP_LOSS_COOLDOWN_DAYS)
+                else:
+                    if is_strong:
+                        if drop_from_peak <= -STRONG_DROP_TOLERANCE: sell_reason = f"📉 強勢回調"
+                    else:
+                        if drop_from_peak <= -WEAK_DROP_TOLERANCE: sell_reason = f"🏃 弱勢反彈"
+                
+                if not sell_reason and held_days >= TIME_STOP_DAYS: sell_reason = f"⏰ 到期"
+                
+                if sell_reason:
+                    gross_revenue = h["Shares"] * curr_price
+                    net_revenue = gross_revenue - TRANSACTION_FEE
+                    total_cost = (h["Shares"] * h["Entry"]) + TRANSACTION_FEE
+                    net_profit = net_revenue - total_cost
+                    net_profit_pct = (net_profit / total_cost) * 100
+                    
+                    portfolio["cash"] += net_revenue 
+                    portfolio["holdings"].remove(h)
+                    
+                    trade_log.append({
+                        "Date": date_str, "Action": "SELL", "Ticker": ticker, "Price": curr_price, 
+                        "Reason": sell_reason, "Profit_USD": net_profit, "Profit_Pct": net_profit_pct, "Balance": portfolio["cash"]
+                    })
+                    event_log.append(log_stream, trade_log[-1])
+                    profit_emoji = "🟢" if net_profit > 0 else "🔴"
+                    trend_tag = "🔥" if is_strong else "❄️"
+                    print(f"\n[{date_str}] 賣出 {ticker} {trend_tag}: {sell_reason}")
+                    print(f"   └── {profit_emoji} 淨損益: ${net_profit:.2f} ({net_profit_pct:.2f}%) | 目前資產: ${portfolio['cash']:.2f}")
+
+        # --- 買入檢查 ---
+        if len(portfolio["holdings"]) < 3 and current_date >= next_trade_date:
+            
+            is_market_bullish = False
+            if current_date in market_df.index:
+                if market_df.loc[current_date]['Close'] > market_df.loc[current_date]['EMA60']:
+                    is_market_bullish = True
+            
+            if is_market_bullish:
+                current_holdings_tickers = [h['Ticker'] for h in portfolio["holdings"]]
+                
+                best_ticker, best_prob = None, 0.0
+                for t in top_tickers: # 只看 Top 3
+                    if t in current_holdings_tickers: continue 
+                    if t in cooldown_list:
+                        if current_date < cooldown_list[t]: continue
+                        else: del cooldown_list[t]
+                    
+                    # 🔥 第二層：MA30 確認 (Absolute Trend)
+                    # 確保龍頭股不是處於下跌修正中
+                    ma30 = full_data[t].loc[current_date]['MA30']
+                    ma30_slope = full_data[t].loc[current_date]['MA30_Slope']
+                    curr_p = market_prices[t]
+                    
+                    # 條件：MA30 向上 且 股價站上 MA30
+                    if ma30_slope > 0 and curr_p > (ma30 * MA30_BREAKOUT_BUFFER):
+                        profiler.count("predict_signal")
+                        prob = predict_signal(t, current_date, full_data)
+                        if prob > best_prob:
+                            best_prob = prob
+                            best_ticker = t
+                
+                if best_prob > BUY_PROB_THRESHOLD and best_ticker:
+                    current_price = market_prices[best_ticker]
+                    current_atr = full_data[best_ticker].loc[current_date]['ATR']
+                    
+                    total_equity = portfolio["cash"]
+                    for h in portfolio["holdings"]:
+                        if h["Ticker"] in market_prices:
+                            total_equity += h["Shares"] * market_prices[h["Ticker"]]
+                    
+                    invest_budget = total_equity * ALLOCATION_PCT
+                    if invest_budget > portfolio["cash"]: invest_budget = portfolio["cash"]
+                    
+                    available_cash_for_trade = invest_budget - TRANSACTION_FEE
+                    
+                    if available_cash_for_trade > current_price:
+                        shares = available_cash_for_trade / current_price
+                        portfolio["cash"] -= (shares * current_price + TRANSACTION_FEE)
+                        
+                        atr_stop_price = current_price - (current_atr * ATR_STOP_LOSS_MULTIPLIER)
+                        
+                        new_holding = {
+                            "Ticker": best_ticker, 
+                            "Shares": shares, 
+                            "Entry": current_price, 
+                            "Highest": current_price, 
+                            "BuyDate": current_date,
+                            "Probability": best_prob,
+                            "ATR_Stop_Price": atr_stop_price
+                        }
+                        portfolio["holdings"].append(new_holding)
+                        
+                        trade_log.append({
+                            "Date": date_str, "Action": "BUY", "Ticker": best_ticker, "Price": current_price, 
+                            "Reason": f"Top3+MA30+AI {best_prob*100:.1f}%", "Profit_USD": 0, "Profit_Pct": 0, "Balance": portfolio["cash"]
+                        })
+                        event_log.append(log_stream, trade_log[-1])
+                        print(f"\n[{date_str}] 🚀 冠軍買入 {best_ticker} (勝率 {best_prob*100:.1f}%) | 倉位: 33%")
+            
+            if len(portfolio["holdings"]) == 0:
+                next_trade_date = current_date + datetime.timedelta(days=1)
+
+        equity = portfolio["cash"]
+        for h in portfolio["holdings"]:
+            if h["Ticker"] in market_prices:
+                equity += h["Shares"] * market_prices[h["Ticker"]]
+        balance_history.append({"Date": date_str, "Equity": equity})
+        event_log.append(balance_stream, balance_history[-1])
+
+    profiler.lap("day_loop", last=True)
+    event_log.close(log_stream)
+    event_log.close(balance_stream)
+
+    if not balance_history:
+        print("\n✅ 沒有新的交易日，回測結果已是最新。")
+        return
+
+    run_id = datetime.datetime.now().strftime("%Y%m%d_%H%M")
+    final_equity = balance_history[-1]['Equity']
+    print(f"\n🏁 最終資產: ${final_equity:.2f} | 總報酬: {(final_equity - INITIAL_CASH) / INITIAL_CASH * 100:.1f}%")
+    
+    # 接續模式只把新的一段接在檔案後面
+    if state: checkpoint.append_rows(drift_file, drift_log)
+    elif drift_log: pd.DataFrame(drift_log).to_csv(drift_file, index=False)
+    if drift_log:
+        drift_df = pd.DataFrame(drift_log)
+        print(f"🔁 Warm vs 完整重訓: 平均機率差 {drift_df['Mean_Abs_Diff'].mean()*100:.2f}% | 訊號翻轉率 {drift_df['Signal_Flip_Rate'].mean()*100:.1f}%")
+    with profiler.timer("save_models"):
+        snapshot_dir = save_system_state(run_id) 
+
+    held = {h["Ticker"] for h in portfolio["holdings"]}
+    checkpoint.save(CHECKPOINT_NAME, {
+        "config": checkpoint_config(),
+        "last_date": last_date,
+        "portfolio": portfolio,
+        "cooldown_list": cooldown_list,
+        "next_trade_date": next_trade_date,
+        "model_snapshot": snapshot_dir,
+        "model_meta": checkpoint.model_meta(model_cache),
+        "last_prices": {t: p for t, p in ranking.prices_on(rank, last_date).items() if t in held},
+    })
+    profiler.write_report(os.path.join(DATA_DIR, "ai_backtest_ma30_profile.json"))
+
+if __name__ == "__main__":
+    profiler.enable_from_env()
     run_backtest()
\ No newline at end of file
@@ -1,12 +1,16 @@
 import numpy as np
 import pandas as pd
 import yfinance as yf
-from sklearn.preprocessing import MinMaxScaler
-from tensorflow.keras.models import Sequential
+from tensorflow.keras.models import Sequential, load_model
 from tensorflow.keras.layers import LSTM, Dense, Input
 import os
 import json
 import datetime
+import model_store
+import ai_training
+import scaling
+import universe
+import signals_store
 
 # ===========================
 # ⚙️ 統一參數 (與回測一致)
@@ -14,20 +18,22 @@ import datetime
 DATA_DIR = "data"
 if not os.path.exists(DATA_DIR): os.makedirs(DATA_DIR)
 
-TICKERS = [
-    'NVDA', 'TSLA', 'AMZN', 'MSFT', 'GOOGL', 'META', 'AAPL', 
-    'AMD', 'INTC', 'QCOM', 'AVGO', 'MU',                     
-    'JPM', 'V', 'DIS', 'NFLX', 'COST', 'PEP', 'KO', 'JNJ'    
-]
+TICKERS = universe.get_tickers("core20")
 
 LOOK_BACK = 60
 FORECAST_DAYS = 10 
 EPOCHS = 20 # 預測未來時我們可以訓練久一點，讓線條更準
+ENGINE_REF = "engine" # 引擎模型的快照指標 (warm 模式從這裡接續訓練)
 
-def prepare_data(df, look_back):
+def prepare_data(df, look_back, as_dataset=False):
     data = df.filter(['Close']).values
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    scaled_data = scaler.fit_transform(data)
+    scaled_data, scaler = scaling.fit_transform(data, ['Close'])
+    
+    if as_dataset:
+        # tf.data 版本：視窗在訓練時才切，標籤就是下一天的收盤價
+        y_train = scaled_data[look_back:, 0]
+        x_train = ai_training.make_window_dataset(scaled_data, y_train, look_back, look_back, batch_size=16)
+        return x_train, y_train, scaler, scaled_data
     
     x_train, y_train = [], []
     for i in range(look_back, len(scaled_data)):
@@ -47,9 +53,33 @@ def build_model(input_shape):
     model.compile(optimizer='adam', loss='mean_squared_error')
     return model
 
+def forecast_prices(model, scaled_data, scaler):
+    curr_input = scaled_data[-LOOK_BACK:].reshape(1, LOOK_BACK, 1)
+    predicted_prices_scaled = []
+    
+    for _ in range(FORECAST_DAYS):
+        pred = model.predict(curr_input, verbose=0)
+        predicted_prices_scaled.append(pred[0, 0])
+        curr_input = np.append(curr_input[:, 1:, :], [[pred[0]]], axis=1)
+    
+    return scaling.inverse_transform(scaler, np.array(predicted_prices_scaled)).tolist()
+
+def load_previous_models():
+    # 讀取上一次引擎快照，回傳 (模型目錄, 各股票最後訓練到的日期)
+    snapshot_dir = model_store.resolve_ref(ENGINE_REF)
+    if not snapshot_dir: return None, {}
+    config_path = os.path.join(snapshot_dir, "config.json")
+    if not os.path.exists(config_path): return None, {}
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    return snapshot_dir, config.get("Train_Dates", {})
+
 def run_ai_analysis():
-    print(f"🧠 AI 預測引擎啟動 (個別訓練 LookBack={LOOK_BACK})...")
+    print(f"🧠 AI 預測引擎啟動 (個別訓練 LookBack={LOOK_BACK}, 模式={ai_training.RETRAIN_MODE})...")
     results = []
+    trained_models = {}
+    train_dates = {}
+    prev_dir, prev_train_dates = load_previous_models() if ai_training.is_warm_mode() else (None, {})
     
     # 設定下載起點 (往前推 2 年)
     start_date = (datetime.datetime.now() - datetime.timedelta(days=730)).strftime("%Y-%m-%d")
@@ -63,24 +93,29 @@ def run_ai_analysis():
             if len(df) < 100: continue
 
             # 1. 個別準備數據 (確保每個股票有自己的標準)
-            x_train, y_train, scaler, scaled_data = prepare_data(df, LOOK_BACK)
+            prev_model_path = os.path.join(prev_dir, f"{ticker}.keras") if prev_dir else None
+            is_warm = prev_model_path is not None and os.path.exists(prev_model_path) and ticker in prev_train_dates
+            use_dataset = ai_training.USE_TF_DATA and not is_warm
+            x_train, y_train, scaler, scaled_data = prepare_data(df, LOOK_BACK, as_dataset=use_dataset)
             
             # 2. 個別訓練模型 (這是避免 1.65% 複製貼上的關鍵)
-            model = build_model((x_train.shape[1], 1))
-            model.fit(x_train, y_train, batch_size=16, epochs=EPOCHS, verbose=0)
+            dates = ai_training.window_dates(df.index, len(y_train), 0)
+            if is_warm:
+                # 🔁 warm 模式：接續上次的模型，只用新增的交易日 (+ 回放) 微調
+                model = load_model(prev_model_path)
+                n_fit = ai_training.incremental_fit(model, x_train, y_train, dates, pd.Timestamp(prev_train_dates[ticker]), batch_size=16)
+                print(f"   🔁 增量訓練 {n_fit} 筆樣本")
+            elif use_dataset:
+                model = build_model((LOOK_BACK, 1))
+                model.fit(x_train, epochs=EPOCHS, shuffle=False, verbose=0) # 資料集本身已用固定種子洗牌
+            else:
+                model = build_model((LOOK_BACK, 1))
+                model.fit(x_train, y_train, batch_size=16, epochs=EPOCHS, verbose=0)
+            trained_models[ticker] = model
+            train_dates[ticker] = dates[-1].strftime("%Y-%m-%d")
             
-            # 3. 預測未來
-            last_sequence = scaled_data[-LOOK_BACK:]
-            curr_input = last_sequence.reshape(1, LOOK_BACK, 1)
-            predicted_prices_scaled = []
-            
-            for _ in range(FORECAST_DAYS):
-                pred = model.predict(curr_input, verbose=0)
-                predicted_prices_scaled.append(pred[0, 0])
-                curr_input = np.append(curr_input[:, 1:, :], [[pred[0]]], axis=1)
-            
-            # 4. 還原價格與計算 ROI
-            predicted_prices = scaler.inverse_transform(np.array(predicted_prices_scaled).reshape(-1, 1)).flatten().tolist()
+            # 3. 預測未來 + 4. 還原價格與計算 ROI
+            predicted_prices = forecast_prices(model, scaled_data, scaler)
             current_price = float(df['Close'].iloc[-1])
             max_future = max(predicted_prices)
             roi = (max_future - current_price) / current_price * 100
@@ -88,14 +123,25 @@ def run_ai_analysis():
             # 5. 抓取歷史數據 (畫圖用)
             history_prices = df['Close'].iloc[-60:].values.tolist()
 
-            results.append({
+            result = {
                 "Ticker": ticker,
                 "Current_Price": current_price,
                 "Predicted_Max": max_future,
                 "Potential_ROI": roi,
                 "Forecast_Curve": predicted_prices,
                 "History_Curve": history_prices
-            })
+            }
+            
+            if ai_training.is_warm_mode() and ai_training.DRIFT_REPORT:
+                # 對照組：同一份資料完整重訓，看 warm 模式的預測偏了多少
+                full_model = build_model((LOOK_BACK, 1))
+                full_x, full_y, _, _ = prepare_data(df, LOOK_BACK)
+                full_model.fit(full_x, full_y, batch_size=16, epochs=EPOCHS, verbose=0)
+                full_roi = (max(forecast_prices(full_model, scaled_data, scaler)) - current_price) / current_price * 100
+                result["ROI_Full_Refit"] = full_roi
+                print(f"   🔁 完整重訓 ROI: {full_roi:.2f}% (差異 {roi - full_roi:+.2f}%)")
+
+            results.append(result)
             print(f"   ✅ 預測 ROI: {roi:.2f}%")
             
         except Exception as e:
@@ -110,8 +156,12 @@ def run_ai_analysis():
         "all_rankings": results
     }
     
-    with open(os.path.join(DATA_DIR, "ai_lab_result.json"), "w") as f:
-        json.dump(output, f)
+    # 曲線存成 float32 二進位 (.sig)，JSON 照舊輸出給舊的讀取端
+    signals_store.write(os.path.join(DATA_DIR, "ai_lab_result.json"), output)
+    
+    if trained_models:
+        engine_config = {"LOOK_BACK": LOOK_BACK, "FORECAST_DAYS": FORECAST_DAYS, "Train_Dates": train_dates}
+        model_store.save_snapshot(trained_models, engine_config, snapshot_id=f"engine_{datetime.datetime.now().strftime('%Y%m%d_%H%M')}", ref=ENGINE_REF)
     
     print("🎉 分析全部完成！結果已更新。")
 
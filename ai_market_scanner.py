@@ -6,21 +6,29 @@ import tensorflow as tf
 # 這能完美避開 M1/M2 晶片在載入 LSTM 模型預測時的 mps.slice 底層崩潰問題，且單筆預測速度更快。
 tf.config.set_visible_devices([], 'GPU')
 
-import numpy as np
-import pandas as pd
 import yfinance as yf
-from sklearn.preprocessing import MinMaxScaler
-from tensorflow.keras.models import load_model
 import datetime
 import json
 import ta
+import model_store
+import profiler
+import universe
+import ranking
+import event_log
+import signals_store
+import scaling
+import quantize
 
 # ===========================
 # ⚙️ 掃描器設定
 # ===========================
-MODEL_DIR = "saved_models/latest"
+# 透過 refs/ma30 指到 MA30 策略目前的快照 (特徵與 prepare_live_data / 補訓練一致)；快照寫入後就不會再被修改
+# 還沒有 ma30 ref 的舊倉庫才退回 latest
+MODEL_DIR = model_store.find_latest_model_dir(model_store.SCANNER_REF) or model_store.find_latest_model_dir() or "saved_models/latest"
 MARKET_INDEX = 'QQQ'
 OUTPUT_FILE = "data/latest_signals.json"
+SIGNAL_LOG_FILE = "data/scanner_signal_log.csv"   # 每次掃描出的訊號邊掃邊追加 (歷史紀錄)
+LAZY_TRAIN_DAYS = 1000   # 股票池中還沒有模型的股票，進入短名單時才用這段歷史補訓練
 
 def add_technical_indicators(df):
     df['RSI'] = ta.momentum.rsi(df['Close'], window=14)
@@ -35,17 +43,63 @@ def add_technical_indicators(df):
     df.fillna(method='bfill', inplace=True)
     return df
 
-def prepare_live_data(df, look_back):
-    features = ['Close', 'Volume', 'RSI', 'MACD', 'ATR', 'MA30']
+def prepare_live_data(df, look_back, scaler=None):
+    # 有快照裡的訓練縮放參數就直接沿用 (特徵也照模型訓練時的順序)；舊快照沒有時才用這段資料重新 fit
+    features = scaler["features"] if scaler and scaler.get("features") else ['Close', 'Volume', 'RSI', 'MACD', 'ATR', 'MA30']
     data = df[features].values
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    scaled_data = scaler.fit_transform(data)
+    if scaler is None: scaler = scaling.fit(data, features)
     
     # 只取最後 look_back 天的數據進行預測
-    last_sequence = scaled_data[-look_back:]
-    curr_input = last_sequence.reshape(1, look_back, scaled_data.shape[1])
+    last_sequence = scaling.transform(scaler, data[-look_back:])
+    curr_input = last_sequence.reshape(1, look_back, len(features))
     return curr_input
 
+def strategy_hits(df, prob, in_top3):
+    # 兩個策略的進場條件 (掃描與量化對照報告共用)，回傳命中的策略名稱
+    curr_price = df['Close'].iloc[-1]
+    ma30 = df['MA30'].iloc[-1]
+    ma30_slope = df['MA30_Slope'].iloc[-1]
+    price_change = df['Price_Change'].iloc[-1]
+    hits = []
+    # 🎯 策略 1: Top 3 動能 + MA30 確認 (機率 > 55%)
+    if in_top3 and ma30_slope > 0 and curr_price > (ma30 * 1.01) and prob >= 0.55:
+        hits.append("strategy_1_top3")
+    # 🎯 策略 2: MA30 強力突破 + 5% 緩衝 (機率 > 55%)
+    if ma30_slope > 0 and price_change > 0 and curr_price > (ma30 * 1.05) and prob >= 0.55:
+        hits.append("strategy_2_ma30")
+    return hits
+
+def lazy_train_missing_models(full_data, config):
+    # 大股票池不會事先為每檔股票訓練模型: 候選股缺模型時才補訓練，
+    # 存成以目前快照為底的新快照 (既有模型硬連結沿用)，回傳要讀取的模型資料夾
+    missing = [t for t in full_data if not os.path.exists(os.path.join(MODEL_DIR, f"{t}.keras"))]
+    if not missing: return MODEL_DIR
+
+    import ai_backtest_ma30_2 as trainer
+    print(f"🏋️ {len(missing)} 檔候選股還沒有模型，補訓練中: {missing}")
+    train_start = (datetime.datetime.now() - datetime.timedelta(days=LAZY_TRAIN_DAYS)).strftime("%Y-%m-%d")
+    with profiler.timer("download"):
+        history = universe.download_universe(missing, train_start, auto_adjust=True)
+
+    lazy_models, lazy_scalers = {}, {}
+    for t, df in history.items():
+        df = trainer.add_technical_indicators(df)
+        # hyper_search.py 匯出的快照會記錄搜尋到的參數，補訓練的模型要照同一組參數，快照裡的模型才一致
+        x_train, y_train, scaler, scaled_data = trainer.prepare_data(df, config["LOOK_BACK"],
+                                                                     target_roi=config.get("TARGET_ROI_CLASS", trainer.TARGET_ROI_CLASS))
+        if x_train is None: continue
+        model = trainer.build_model((config["LOOK_BACK"], scaled_data.shape[1]), tuple(config.get("LSTM_UNITS", trainer.LSTM_UNITS)))
+        with profiler.timer("model.fit"):
+            model.fit(x_train, y_train, batch_size=32, epochs=config.get("EPOCHS", 10), verbose=0)
+        lazy_models[t] = model
+        lazy_scalers[t] = scaling.to_json(scaler)
+    if not lazy_models: return MODEL_DIR
+
+    new_config = dict(config)
+    new_config["TICKERS"] = list(config["TICKERS"]) + [t for t in lazy_models if t not in config["TICKERS"]]
+    return model_store.save_snapshot(lazy_models, new_config, snapshot_id=f"lazy_{datetime.datetime.now().strftime('%Y%m%d_%H%M')}",
+                                     ref=model_store.SCANNER_REF, base_dir=MODEL_DIR, scalers=lazy_scalers)
+
 def scan_market():
     print(f"🚀 啟動 AI 雙引擎市場掃描 ({datetime.date.today()})...")
     
@@ -58,7 +112,8 @@ def scan_market():
     with open(config_path, "r") as f:
         config = json.load(f)
         
-    TICKERS = config["TICKERS"]
+    # UNIVERSE=sp500 時改掃整個股票池；預設沿用模型快照內的清單
+    TICKERS = universe.get_tickers(None, os.environ["UNIVERSE"]) if os.environ.get("UNIVERSE") else config["TICKERS"]
     LOOK_BACK = config["LOOK_BACK"]
     
     # 下載數據 (多抓一點確保指標計算正確)
@@ -89,32 +144,36 @@ def scan_market():
         print("⚠️ 大盤狀態: 空頭 (QQQ < EMA60)，建議空手或輕倉")
 
     # 3. 掃描個股
+    print(f"📥 批次下載 {len(TICKERS)} 檔個股數據...")
+    with profiler.timer("download"):
+        raw_data = universe.download_universe(TICKERS, start_date, auto_adjust=True)
+    # 🔥 [防呆] 確保數據長度足夠
+    raw_data = {t: df for t, df in raw_data.items() if len(df) >= LOOK_BACK + 20}
+    if not raw_data:
+        print("❌ 沒有任何個股數據，本次掃描終止。")
+        return
+
+    # 第一階段: 只用收盤價對整個股票池算動能與 MA30 條件，挑出候選股
+    with profiler.timer("stage_one"):
+        stage = universe.stage_one(universe.close_panel(raw_data))
+        latest = {k: v.ffill().iloc[-1] for k, v in stage.items()}
+        momentum = stage["Momentum"].ffill().iloc[[-1]]
+        top_3_tickers = ranking.top_tickers(ranking.build_ranking(momentum, 3), momentum.index[-1])
+        trend = (latest["MA30_Slope"] > 0)
+        s1_pass = trend & (latest["Close"] > latest["MA30"] * 1.01) & latest["Close"].index.isin(top_3_tickers)
+        s2_pass = trend & (latest["Price_Change"] > 0) & (latest["Close"] > latest["MA30"] * 1.05)
+    candidates = [t for t in raw_data if s1_pass.get(t, False) or s2_pass.get(t, False)]
+    print(f"🔎 第一階段篩選: {len(raw_data)} 檔 -> {len(candidates)} 檔候選")
+
+    # 第二階段: 只有候選股才計算完整指標
     full_data = {}
-    momentum_scores = []
-    
-    for t in TICKERS:
-        try:
-            df = yf.download(t, start=start_date, progress=False, auto_adjust=True, multi_level_index=False)
-        except:
-            continue
+    for t in candidates:
+        with profiler.timer("indicators"):
+            full_data[t] = add_technical_indicators(raw_data[t])
 
-        # 🔥 [防呆] 確保數據不為空且長度足夠
-        if df.empty or len(df) < LOOK_BACK + 20: 
-            continue
+    model_dir = lazy_train_missing_models(full_data, config)
+    scalers = model_store.load_scalers(model_dir)
 
-        df = add_technical_indicators(df)
-        full_data[t] = df
-        # ... (後面的代碼保持不變)
-        
-        # 計算動能分數
-        ema60 = df['EMA60'].iloc[-1]
-        if ema60 > 0:
-            score = df['Close'].iloc[-1] / ema60
-            momentum_scores.append((t, score))
-
-    momentum_scores.sort(key=lambda x: x[1], reverse=True)
-    top_3_tickers = [x[0] for x in momentum_scores[:3]]
-    
     signals = {
         "scan_time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "market_bullish": is_market_bullish,
@@ -123,20 +182,22 @@ def scan_market():
     }
 
     print("\n🧠 正在進行 AI 預測...")
+    signal_stream = event_log.open_stream(SIGNAL_LOG_FILE)
     for t, df in full_data.items():
         curr_price = df['Close'].iloc[-1]
         ma30 = df['MA30'].iloc[-1]
-        ma30_slope = df['MA30_Slope'].iloc[-1]
-        price_change = df['Price_Change'].iloc[-1]
         
-        # 載入模型並預測
-        model_path = os.path.join(MODEL_DIR, f"{t}.keras")
+        # 載入模型並預測 (快照啟用量化且通過對照報告時走 TFLite)
+        model_path = os.path.join(model_dir, f"{t}.keras")
         if not os.path.exists(model_path): continue
         
         try:
-            model = load_model(model_path, compile=False)
-            curr_input = prepare_live_data(df, LOOK_BACK)
-            prob = float(model.predict(curr_input, verbose=0)[0][0])
+            with profiler.timer("load_model"):
+                predict = quantize.load_predictor(model_dir, t)
+            with profiler.timer("prepare_data"):
+                curr_input = prepare_live_data(df, LOOK_BACK, scalers.get(t))
+            with profiler.timer("model.predict"):
+                prob = float(predict(curr_input)[0])
         except Exception as e:
             # print(f"預測 {t} 時發生錯誤: {e}")
             continue
@@ -148,28 +209,23 @@ def scan_market():
             "ma30_distance": round((curr_price - ma30) / ma30 * 100, 1)
         }
 
-        # 🎯 策略 1: Top 3 動能 + MA30 確認 (機率 > 55%)
-        if t in top_3_tickers and ma30_slope > 0 and curr_price > (ma30 * 1.01):
-            if prob >= 0.55:
-                signals["strategy_1_top3"].append(signal_info)
-
-        # 🎯 策略 2: MA30 強力突破 + 5% 緩衝 (機率 > 55%)
-        if ma30_slope > 0 and price_change > 0 and curr_price > (ma30 * 1.05):
-            if prob >= 0.55:
-                signals["strategy_2_ma30"].append(signal_info)
+        for strategy in strategy_hits(df, prob, t in top_3_tickers):
+            signals[strategy].append(signal_info)
+            event_log.append(signal_stream, {"Scan_Time": signals["scan_time"], "Strategy": strategy, **signal_info})
+    event_log.close(signal_stream)
 
     # 排序：勝率高的排前面
     signals["strategy_1_top3"].sort(key=lambda x: x["probability"], reverse=True)
     signals["strategy_2_ma30"].sort(key=lambda x: x["probability"], reverse=True)
 
-    # 輸出成 JSON 供網頁使用
-    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-    with open(OUTPUT_FILE, "w") as f:
-        json.dump(signals, f, indent=4)
+    # 輸出成 JSON + .sig 供網頁使用 (原子寫入，網頁不會讀到寫一半的檔案)
+    signals_store.write(OUTPUT_FILE, signals)
         
     print(f"\n✅ 掃描完成！結果已保存至 {OUTPUT_FILE}")
     print(f"🏅 策略 1 (Top 3) 推薦: {[s['ticker'] for s in signals['strategy_1_top3']]}")
     print(f"💥 策略 2 (MA30突破) 推薦: {[s['ticker'] for s in signals['strategy_2_ma30']]}")
+    profiler.write_report(os.path.join(os.path.dirname(OUTPUT_FILE), "scanner_profile.json"))
 
 if __name__ == "__main__":
+    profiler.enable_from_env()
     scan_market()
\ No newline at end of file
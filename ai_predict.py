@@ -1,12 +1,13 @@
 import numpy as np
 import pandas as pd
 import yfinance as yf
-from sklearn.preprocessing import MinMaxScaler
-from tensorflow.keras.models import load_model
 import os
 import json
-import glob
 import datetime
+import model_store
+import signals_store
+import scaling
+import quantize
 
 # ===========================
 # 🔮 實戰預測腳本 (JSON 修復版)
@@ -15,20 +16,13 @@ MODEL_BASE_DIR = "saved_models"
 DATA_DIR = "data"
 
 def find_latest_model_dir():
-    # 優先找 latest 資料夾
-    latest = os.path.join(MODEL_BASE_DIR, "latest")
-    if os.path.exists(latest): return latest
-    
-    # 否則找最新的
-    dirs = glob.glob(os.path.join(MODEL_BASE_DIR, "*"))
-    if not dirs: return None
-    return max(dirs, key=os.path.getmtime)
+    # 直接讀 refs/latest 指標 (O(1))；沒有快照時才退回舊的 latest 資料夾 / 最新資料夾
+    return model_store.find_latest_model_dir()
 
 def prepare_data(df, look_back):
     if len(df) < look_back: return None, None
     data = df.filter(['Close']).values
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    scaled_data = scaler.fit_transform(data)
+    scaled_data, scaler = scaling.fit_transform(data, ['Close'])
     last_sequence = scaled_data[-look_back:].reshape(1, look_back, 1)
     return last_sequence, scaler
 
@@ -58,7 +52,7 @@ def run_prediction():
             model_path = os.path.join(model_dir, f"{t}.keras")
             if not os.path.exists(model_path): continue
             
-            model = load_model(model_path)
+            predict = quantize.load_predictor(model_dir, t)   # 快照啟用量化時走 TFLite
             # 抓取最近 1.5 年數據以確保有足夠的 Lookback
             df = yf.download(t, period="2y", progress=False)
             if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
@@ -71,11 +65,11 @@ def run_prediction():
             preds = []
             curr_input = input_seq
             for _ in range(predict_days):
-                pred = model.predict(curr_input, verbose=0)
-                preds.append(pred[0, 0])
-                curr_input = np.append(curr_input[:, 1:, :], [[pred[0]]], axis=1)
+                pred = predict(curr_input)
+                preds.append(pred[0])
+                curr_input = np.append(curr_input[:, 1:, :], [[pred[:1]]], axis=1)
                 
-            real_preds = scaler.inverse_transform(np.array(preds).reshape(-1, 1)).flatten()
+            real_preds = scaling.inverse_transform(scaler, np.array(preds))
             
             # 🔥 強制轉型為 Python 原生 float (解決 JSON error)
             current_price = float(df['Close'].iloc[-1])
@@ -107,8 +101,8 @@ def run_prediction():
         "all_rankings": results
     }
     
-    with open(os.path.join(DATA_DIR, "ai_lab_result.json"), "w") as f:
-        json.dump(output, f)
+    # 曲線存成 float32 二進位 (.sig)，JSON 照舊輸出給舊的讀取端
+    signals_store.write(os.path.join(DATA_DIR, "ai_lab_result.json"), output)
     
     print("🎉 預測完成！結果已更新。")
 
@@ -0,0 +1,135 @@
+import os
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import EarlyStopping
+
+# ===========================
+# 🔁 增量訓練 (Warm-Start)
+# ===========================
+# RETRAIN_MODE=full  -> 每次重訓都用全部視窗重新 fit (原本的行為，回測結果可重現)
+# RETRAIN_MODE=warm  -> 只用上次訓練後新增的視窗 + 少量舊視窗回放來微調快取模型
+# DRIFT_REPORT=1     -> warm 模式下同時做一次完整重訓，記錄兩者訊號差異 (會變慢，只在驗證時開)
+RETRAIN_MODE = os.environ.get("RETRAIN_MODE", "full").lower()
+DRIFT_REPORT = os.environ.get("DRIFT_REPORT", "0") == "1"
+# USE_TF_DATA=1 -> 完整重訓改用 tf.data 管線，訓練時才從 scaled_data 切視窗，不先複製出 (N, LOOK_BACK, F) 陣列
+USE_TF_DATA = os.environ.get("USE_TF_DATA", "0") == "1"
+
+REPLAY_RATIO = 1.0      # 每個新視窗搭配幾個隨機舊視窗，避免模型只記得最近的行情
+VAL_TAIL = 5            # 最後幾個新視窗保留做 early stopping 驗證
+WARM_MAX_EPOCHS = 10
+WARM_PATIENCE = 2
+WARM_SEED = 42
+
+
+def is_warm_mode():
+    return RETRAIN_MODE == "warm"
+
+
+def window_dates(index, n_windows, end_offset):
+    # prepare_data 產生的視窗是連續的最後 n_windows 個，最後一個位置在 len(index) - end_offset - 1
+    end = len(index) - end_offset
+    return index[end - n_windows:end]
+
+
+def make_window_dataset(scaled_data, labels, look_back, start_idx, batch_size=32, shuffle=True, seed=WARM_SEED):
+    # 第 k 個樣本 = scaled_data[start_idx + k - look_back : start_idx + k]，標籤 = labels[k]
+    # 資料集裡只流動「視窗編號」，每個 batch 用一次 gather 切出視窗，所以記憶體只有原始陣列一份
+    data = tf.constant(scaled_data, dtype=tf.float32)
+    targets = tf.constant(labels)
+    offsets = tf.range(start_idx - look_back, start_idx, dtype=tf.int64)
+
+    n = len(labels)
+    dataset = tf.data.Dataset.range(n).cache()
+    if shuffle: dataset = dataset.shuffle(n, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+
+    def gather_windows(k):
+        rows = k[:, tf.newaxis] + offsets[tf.newaxis, :]
+        return tf.gather(data, rows), tf.gather(targets, k)
+
+    dataset = dataset.map(gather_windows, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def block_days(start_date, last_train_date, retrain_every_n_days, calendar=None):
+    # 重訓後模型凍結的那段交易日: (d - last_train_date).days < retrain_every_n_days 都沿用同一個模型
+    # calendar: 有 K 線的交易日 (trading_calendar)，給了就不替休市日打分
+    import pandas as pd
+    end = last_train_date + pd.Timedelta(days=retrain_every_n_days - 1)
+    if calendar is None: days = pd.date_range(start_date, end, freq='B')
+    else: days = calendar[(calendar >= start_date) & (calendar <= end)]
+    return pd.DatetimeIndex([start_date]).union(days)
+
+
+def score_block(model, df, features, days, look_back, running=None, batch_size=256):
+    # 一次 predict 算完整段凍結期每天的機率；第 d 天的輸入 = d 之前最後 look_back 列，
+    # 用「d 之前的資料」fit 的縮放參數 (與逐日呼叫 prepare_data 相同)
+    import scaling
+    data = df[features].values
+    ends = df.index.searchsorted(days)   # d 之前有幾列
+    windows = []
+    for n in ends:
+        scaler = scaling.at(running, n) if running else scaling.fit(data[:n], features)
+        windows.append(scaling.transform(scaler, data[n - look_back:n]))
+    probs = model.predict(np.stack(windows), batch_size=batch_size, verbose=0)[:, 0]
+    return dict(zip(days, probs.astype(float)))
+
+
+def fill_prob_table(predict_signal, prob_table, rank, dates, full_data):
+    # 沿固定排程把 (日期, 股票) 勝率表填滿: 每天動能前 N 名都評分，與持倉 / 冷卻 / 大盤濾網無關，
+    # 重訓時點因此不受交易路徑影響，同一張表可以給 sim_kernel 的多個實例 (不同區間、共用資金池) 一起查。
+    # predict_signal 沒寫進表的格子 (資料不足等) 記成它回傳的值，之後的日迴圈不會再觸發訓練
+    import ranking
+    for d in dates:
+        for t in ranking.top_tickers(rank, d):
+            if (d, t) not in prob_table: prob_table[(d, t)] = predict_signal(t, d, full_data)
+    return prob_table
+
+
+def incremental_fit(model, x_train, y_train, dates, last_label_date, batch_size=32, verbose=0):
+    # 回傳實際用來訓練的樣本數；0 代表沒有新資料，模型維持不變
+    new_idx = np.flatnonzero(dates > last_label_date)
+    if len(new_idx) == 0: return 0
+    old_idx = np.flatnonzero(dates <= last_label_date)
+
+    rng = np.random.default_rng(WARM_SEED)
+    n_replay = min(len(old_idx), int(len(new_idx) * REPLAY_RATIO))
+    replay_idx = rng.choice(old_idx, n_replay, replace=False) if n_replay > 0 else np.array([], dtype=int)
+
+    # 新視窗夠多時，把最新的一段切出來當驗證集 (時間序列不能隨機切)
+    if len(new_idx) > VAL_TAIL * 2:
+        val_idx = new_idx[-VAL_TAIL:]
+        fit_idx = np.concatenate([replay_idx, new_idx[:-VAL_TAIL]])
+        callbacks = [EarlyStopping(monitor='val_loss', patience=WARM_PATIENCE, restore_best_weights=True)]
+        validation_data = (x_train[val_idx], y_train[val_idx])
+    else:
+        fit_idx = np.concatenate([replay_idx, new_idx])
+        callbacks, validation_data = [], None
+
+    fit_idx = np.sort(fit_idx)
+    epochs = WARM_MAX_EPOCHS if validation_data is not None else max(1, WARM_MAX_EPOCHS // 3)
+    model.fit(x_train[fit_idx], y_train[fit_idx], batch_size=batch_size, epochs=epochs,
+              validation_data=validation_data, callbacks=callbacks, verbose=verbose)
+    return len(fit_idx)
+
+
+def measure_drift(warm_pred, full_pred, threshold):
+    # warm_pred / full_pred: 同一批輸入的預測值 (機率或價格)
+    warm_pred = np.asarray(warm_pred, dtype=float).ravel()
+    full_pred = np.asarray(full_pred, dtype=float).ravel()
+    diff = np.abs(warm_pred - full_pred)
+    flips = (warm_pred > threshold) != (full_pred > threshold)
+    return {
+        "Mean_Abs_Diff": float(diff.mean()),
+        "Max_Abs_Diff": float(diff.max()),
+        "Signal_Flip_Rate": float(flips.mean()),
+    }
+
+
+def full_refit_drift(warm_model, build_fn, x_train, y_train, x_eval, threshold, epochs=10, batch_size=32):
+    # 用同一份資料從零完整重訓，拿來對照 warm 模型的訊號偏移
+    full_model = build_fn((x_train.shape[1], x_train.shape[2]))
+    full_model.fit(x_train, y_train, batch_size=batch_size, epochs=epochs, verbose=0)
+    warm_pred = warm_model.predict(x_eval, verbose=0)
+    full_pred = full_model.predict(x_eval, verbose=0)
+    return measure_drift(warm_pred, full_pred, threshold)
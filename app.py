@@ -1,8 +1,10 @@
 import streamlit as st
 import pandas as pd
-import json
 import os
 import datetime
+import altair as alt
+import dashboard_data
+import event_log
 
 st.set_page_config(page_title="AI 投資戰情室", layout="wide", page_icon="📈")
 st.title("📈 Jonathan's AI Investment Dashboard")
@@ -39,6 +41,43 @@ DF_CONFIG = {
 # ==========================================
 # 共用顯示函數 (減少重複代碼)
 # ==========================================
+def render_robustness(prefix):
+    # 🎲 robustness.py 的蒙地卡羅結果: 最終資產 / 最大回撤的百分位數與資產百分位帶
+    report = dashboard_data.load_report(os.path.join(DATA_DIR, f"{prefix}_robustness.json"))
+    if not report: return
+    method = "每日報酬 block bootstrap" if report["method"] == "block" else "交易重抽"
+    with st.expander(f"🎲 蒙地卡羅穩健度 ({method}，{report['n_resamples']:,} 次)"):
+        final, dd = report["final_equity"], report["max_drawdown_pct"]
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("最終資產 P5", f"${final['p5']:,.0f}")
+        c2.metric("最終資產 P50", f"${final['p50']:,.0f}", f"實際 ${report['actual']['final_equity']:,.0f}", delta_color="off")
+        c3.metric("最大回撤 P5 (最差 5%)", f"{dd['p5']:.1f}%", f"實際 {report['actual']['max_drawdown_pct']:.1f}%", delta_color="off")
+        c4.metric("虧損機率", f"{report['prob_loss']*100:.1f}%")
+        bands = pd.DataFrame(report["bands"], index=report["steps"])
+        st.line_chart(bands)
+        st.caption(f"產生時間: {report['generated_at']}")
+
+def render_rolling_study(strategy_prefix):
+    # 🔁 rolling_study.py: 每個交易日起跑 x 各種持有期間的報酬分布與熱度圖
+    report = dashboard_data.load_report(os.path.join(DATA_DIR, "vulture_rolling_study.json"))
+    strategy = {"vulture": "classic", "super_vulture": "super"}.get(strategy_prefix)
+    if not report or strategy not in report["strategies"]: return
+    per_horizon = report["strategies"][strategy]
+    with st.expander("🔁 滾動起點研究 (每一天起跑的報酬分布)"):
+        summary = pd.DataFrame({f"{h} 天": per_horizon[str(h)]["summary"] for h in report["horizons"]}).T
+        summary["win_rate"] = summary["win_rate"] * 100
+        st.dataframe(summary.rename(columns={"mean": "平均%", "win_rate": "勝率%", "worst_drawdown_pct": "最差回撤%",
+                                             "avg_trades": "平均交易數", "n_starts": "起點數"}).round(1),
+                     use_container_width=True)
+        rows = [{"起跑日": report["dates"][i], "持有天數": h, "報酬%": r}
+                for h in report["horizons"] for i, r in enumerate(per_horizon[str(h)]["returns_pct"])]
+        heatmap = alt.Chart(pd.DataFrame(rows)).mark_rect().encode(
+            x=alt.X("起跑日:T"), y=alt.Y("持有天數:O"),
+            color=alt.Color("報酬%:Q", scale=alt.Scale(scheme="redyellowgreen", domainMid=0)),
+            tooltip=["起跑日:T", "持有天數:O", "報酬%:Q"])
+        st.altair_chart(heatmap, use_container_width=True)
+        st.caption(f"產生時間: {report['generated_at']}")
+
 def render_strategy_view(strategy_prefix, strategy_title, strategy_desc):
     st.header(strategy_title)
     st.caption(strategy_desc)
@@ -58,12 +97,9 @@ def render_strategy_view(strategy_prefix, strategy_title, strategy_desc):
     l_file = os.path.join(DATA_DIR, f"{strategy_prefix}_{period_key}_log.csv")
     
     # 顯示資產曲線
-    if os.path.exists(b_file):
-        df = pd.read_csv(b_file)
+    df = dashboard_data.load_balance(b_file)
+    if df is not None:
         if not df.empty:
-            df['Date'] = pd.to_datetime(df['Date'])
-            df = df.set_index('Date')
-            
             final_eq = df.iloc[-1]['Equity']
             # AI 策略的初始資金是 10000，其他是 1000，這裡做個簡單判斷
             init_cash = 10000 if "ai" in strategy_prefix else 1000
@@ -81,14 +117,15 @@ def render_strategy_view(strategy_prefix, strategy_title, strategy_desc):
             
             if roi < -20: st.error("⚠️ 警告：此策略在該年份遭受重創。")
             elif roi > 20: st.success("✅ 表現優異！")
+            render_robustness(f"{strategy_prefix}_{period_key}")
         else:
             st.warning("數據為空。")
     else:
         st.info(f"找不到數據檔案：{b_file}")
 
     # 顯示交易紀錄
-    if os.path.exists(l_file):
-        df_log = pd.read_csv(l_file)
+    df_log = dashboard_data.load_log(l_file)
+    if df_log is not None:
         if not df_log.empty:
             with st.expander(f"📜 查看 {selected_label} 詳細交易紀錄"):
                 st.dataframe(
@@ -99,6 +136,8 @@ def render_strategy_view(strategy_prefix, strategy_title, strategy_desc):
         else:
             st.info("無交易紀錄。")
 
+    render_rolling_study(strategy_prefix)
+
 # ==========================================
 # 載入最新的 AI 掃描結果
 # ==========================================
@@ -108,10 +147,9 @@ scan_time = "尚未掃描"
 
 LATEST_SIGNALS_FILE = os.path.join(DATA_DIR, "latest_signals.json")
 if os.path.exists(LATEST_SIGNALS_FILE):
-    with open(LATEST_SIGNALS_FILE, 'r') as f:
-        ai_signals = json.load(f)
-        market_status = ai_signals.get('market_bullish')
-        scan_time = ai_signals.get('scan_time', 'N/A')
+    ai_signals = dashboard_data.load_signals(LATEST_SIGNALS_FILE)
+    market_status = ai_signals.get('market_bullish')
+    scan_time = ai_signals.get('scan_time', 'N/A')
 
 def display_market_status():
     st.write(f"📅 **最後掃描時間:** `{scan_time}`")
@@ -164,11 +202,9 @@ with tab3:
     bt_bal_file = os.path.join(DATA_DIR, "ai_backtest_balance.csv")
     bt_log_file = os.path.join(DATA_DIR, "ai_backtest_log.csv")
     
-    if os.path.exists(bt_bal_file):
-        df_bal = pd.read_csv(bt_bal_file)
+    df_bal = dashboard_data.load_balance(bt_bal_file)
+    if df_bal is not None:
         if not df_bal.empty:
-            df_bal['Date'] = pd.to_datetime(df_bal['Date'])
-            df_bal = df_bal.set_index('Date')
             final_eq = df_bal.iloc[-1]['Equity']
             roi = (final_eq - 10000) / 10000 * 100
             
@@ -176,10 +212,12 @@ with tab3:
             c1.metric("回測總資產", f"${final_eq:,.2f}")
             c2.metric("總報酬率", f"{roi:.1f}%")
             st.line_chart(df_bal['Equity'])
+            render_robustness("ai_backtest")
             
             with st.expander("查看詳細交易紀錄"):
-                if os.path.exists(bt_log_file):
-                    st.dataframe(pd.read_csv(bt_log_file).sort_index(ascending=False), use_container_width=True)
+                df_log = dashboard_data.load_log(bt_log_file)
+                if df_log is not None:
+                    st.dataframe(df_log.sort_index(ascending=False), use_container_width=True)
 
 # ==========================================
 # Tab 4: AI MA30 突破戰法 (策略 2)
@@ -203,11 +241,9 @@ with tab4:
     bt_bal_file_ma30 = os.path.join(DATA_DIR, "ai_backtest_ma30_balance.csv") 
     bt_log_file_ma30 = os.path.join(DATA_DIR, "ai_backtest_ma30_log.csv")     
     
-    if os.path.exists(bt_bal_file_ma30):
-        df_bal = pd.read_csv(bt_bal_file_ma30)
+    df_bal = dashboard_data.load_balance(bt_bal_file_ma30)
+    if df_bal is not None:
         if not df_bal.empty:
-            df_bal['Date'] = pd.to_datetime(df_bal['Date'])
-            df_bal = df_bal.set_index('Date')
             final_eq = df_bal.iloc[-1]['Equity']
             roi = (final_eq - 10000) / 10000 * 100
             
@@ -215,10 +251,12 @@ with tab4:
             c1.metric("回測總資產", f"${final_eq:,.2f}")
             c2.metric("總報酬率", f"{roi:.1f}%")
             st.line_chart(df_bal['Equity'])
+            render_robustness("ai_backtest_ma30")
             
             with st.expander("查看詳細交易紀錄"):
-                if os.path.exists(bt_log_file_ma30):
-                    st.dataframe(pd.read_csv(bt_log_file_ma30).sort_index(ascending=False), use_container_width=True)
+                df_log = dashboard_data.load_log(bt_log_file_ma30)
+                if df_log is not None:
+                    st.dataframe(df_log.sort_index(ascending=False), use_container_width=True)
     else:
         st.info(f"尚未找到 MA30 版本的歷史績效檔案 ({bt_bal_file_ma30})。請先執行回測程式並將結果輸出為此檔名。")
 
@@ -238,9 +276,10 @@ with tab5:
         act = c3.selectbox("動作", ["BUY", "SELL"])
         p = c1.number_input("價格", min_value=0.0)
         if st.form_submit_button("提交"):
-            new = pd.DataFrame([{"Date": d, "Ticker": t, "Action": act, "Price": p}])
-            new.to_csv(MANUAL_LOG, mode='a', header=False, index=False)
+            # 上鎖追加 + fsync，不會和讀取端或其他寫入者互相踩到
+            event_log.append_row(MANUAL_LOG, {"Date": d, "Ticker": t, "Action": act, "Price": p})
             st.rerun()
             
-    if os.path.exists(MANUAL_LOG):
-        st.dataframe(pd.read_csv(MANUAL_LOG), use_container_width=True)
\ No newline at end of file
+    df_manual = dashboard_data.load_log(MANUAL_LOG)
+    if df_manual is not None:
+        st.dataframe(df_manual, use_container_width=True)
\ No newline at end of file
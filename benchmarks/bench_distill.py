@@ -0,0 +1,122 @@
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+import io
+import sys
+import json
+import time
+import tempfile
+import argparse
+import contextlib
+import subprocess
+
+# ===========================
+# 🎓 老師 (LSTM) vs 學生 (1D-Conv) 基準測試
+# ===========================
+# 每個後端在獨立子行程執行 (SIGNAL_BACKEND 在 import 時讀取)，比較:
+#   訓練時間 / 單筆與整段凍結期的推論延遲 / 合成行情回測的最終資產
+# 用法: python benchmarks/bench_distill.py --tickers 6 --sim-days 150
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+N_DAYS = 700
+LATENCY_SAMPLES = 20
+
+
+def timed(fn, repeat=1):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def run_backend(backend, n_tickers, sim_days):
+    import synthetic_market
+    import feature_panel
+    import event_log
+    import distill
+    import ai_backtest_2
+
+    market = {t: feature_panel.add_technical_indicators(df.copy()) for t, df in synthetic_market.make_market(n_tickers, N_DAYS).items()}
+    index_df = synthetic_market.make_index(N_DAYS)
+    index_df['EMA60'] = index_df['Close'].ewm(span=60, adjust=False).mean()
+
+    # 訓練 / 推論: 第一檔股票的完整訓練視窗
+    df = feature_panel.add_labels(next(iter(market.values())).copy(), ai_backtest_2.PREDICT_DAYS, ai_backtest_2.TARGET_ROI_CLASS)
+    x_train, y_train, _, _ = ai_backtest_2.prepare_data(df, ai_backtest_2.LOOK_BACK)
+    shape = (x_train.shape[1], x_train.shape[2])
+    holder = {}
+
+    def train():
+        if backend == "student":
+            holder["model"] = distill.fit_student(holder["teacher"], x_train, y_train)
+        else:
+            holder["model"] = ai_backtest_2.build_model(shape)
+            holder["model"].fit(x_train, y_train, batch_size=32, epochs=10, verbose=0)
+
+    if backend == "student":
+        holder["teacher"] = ai_backtest_2.build_model(shape)
+        holder["teacher"].fit(x_train, y_train, batch_size=32, epochs=10, verbose=0)
+    train_sec = timed(train)
+    model = holder["model"]
+    single_ms = timed(lambda: model.predict(x_train[-1:], verbose=0), LATENCY_SAMPLES) * 1000
+    block_ms = timed(lambda: model.predict(x_train[-15:], verbose=0), LATENCY_SAMPLES) * 1000
+
+    # 回測: 與 run_benchmarks 的 ai_backtest_year 相同的換資料方式，輸出寫到暫存資料夾
+    workdir = tempfile.mkdtemp(prefix="bench_distill_")
+    os.chdir(workdir)
+    dates = index_df.index
+    ai_backtest_2.DATA_DIR = workdir
+    ai_backtest_2.TICKERS = list(market.keys())
+    ai_backtest_2.START_DATE = dates[-sim_days].strftime("%Y-%m-%d")
+    ai_backtest_2.END_DATE = dates[-1].strftime("%Y-%m-%d")
+    ai_backtest_2.download_data = lambda download_start: (dict(market), index_df.copy())
+    ai_backtest_2.save_system_state = lambda run_id: workdir
+    with contextlib.redirect_stdout(io.StringIO()):
+        backtest_sec = timed(ai_backtest_2.run_backtest)
+    balance = event_log.read_table(os.path.join(workdir, "ai_backtest_balance.csv"))
+    trades = event_log.read_table(os.path.join(workdir, "ai_backtest_log.csv"))
+    final_equity = float(balance["Equity"].iloc[-1])
+
+    return {
+        "backend": backend,
+        "params": int(model.count_params()),
+        "train_sec": round(train_sec, 2),
+        "predict_1_ms": round(single_ms, 2),
+        "predict_block_ms": round(block_ms, 2),
+        "backtest_sec": round(backtest_sec, 1),
+        "final_equity": round(final_equity, 2),
+        "return_pct": round((final_equity - ai_backtest_2.INITIAL_CASH) / ai_backtest_2.INITIAL_CASH * 100, 2),
+        "trades": int(len(trades)) if trades is not None else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="老師 vs 學生模型基準測試")
+    parser.add_argument("--tickers", type=int, default=6)
+    parser.add_argument("--sim-days", type=int, default=150)
+    parser.add_argument("--backend", choices=["lstm", "student"], help="(內部使用) 只跑單一後端")
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(run_backend(args.backend, args.tickers, args.sim_days)))
+        return
+
+    results = []
+    for backend in ("lstm", "student"):
+        cmd = [sys.executable, os.path.abspath(__file__), "--backend", backend,
+               "--tickers", str(args.tickers), "--sim-days", str(args.sim_days)]
+        env = dict(os.environ, SIGNAL_BACKEND=backend, FULL_REPLAY="1")
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True, cwd=ROOT_DIR, env=env).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{'後端':<9}{'參數量':>9}{'訓練(s)':>9}{'單筆(ms)':>10}{'整段(ms)':>10}{'回測(s)':>9}{'最終資產':>11}{'報酬%':>8}{'交易數':>7}")
+    for r in results:
+        print(f"{r['backend']:<9}{r['params']:>9}{r['train_sec']:>9}{r['predict_1_ms']:>10}{r['predict_block_ms']:>10}"
+              f"{r['backtest_sec']:>9}{r['final_equity']:>11}{r['return_pct']:>8}{r['trades']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+
+# ===========================
+# 📊 tf.data vs NumPy 訓練管線基準測試
+# ===========================
+# 每種模式在獨立子行程執行，峰值 RSS (ru_maxrss) 才不會互相污染。
+# 用法: python benchmarks/bench_tf_data.py --rows 5000 --features 6 --epochs 2
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+LOOK_BACK = 60
+BATCH_SIZE = 32
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 回傳 KB，macOS 回傳 bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_mode(mode, rows, features, epochs):
+    import numpy as np
+    import ai_training
+    from ai_backtest_2 import build_model
+
+    rng = np.random.default_rng(42)
+    scaled_data = rng.random((rows, features)).astype(np.float32)
+    labels = (rng.random(rows - LOOK_BACK) > 0.5).astype(np.int64)
+    model = build_model((LOOK_BACK, features))
+
+    t0 = time.perf_counter()
+    if mode == "numpy":
+        # 與 prepare_data 相同：先把所有視窗複製成 (N, LOOK_BACK, F)
+        x_train = np.array([scaled_data[i-LOOK_BACK:i] for i in range(LOOK_BACK, rows)])
+        build_sec = time.perf_counter() - t0
+        model.fit(x_train, labels, batch_size=BATCH_SIZE, epochs=epochs, verbose=0)
+    else:
+        dataset = ai_training.make_window_dataset(scaled_data, labels, LOOK_BACK, LOOK_BACK, batch_size=BATCH_SIZE)
+        build_sec = time.perf_counter() - t0
+        model.fit(dataset, epochs=epochs, shuffle=False, verbose=0)
+    total_sec = time.perf_counter() - t0
+
+    return {
+        "mode": mode,
+        "samples": int(len(labels)),
+        "build_sec": round(build_sec, 3),
+        "total_sec": round(total_sec, 3),
+        "samples_per_sec": round(len(labels) * epochs / total_sec, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tf.data vs NumPy 訓練管線基準測試")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--features", type=int, default=6)
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--mode", choices=["numpy", "tfdata"], help="(內部使用) 只跑單一模式")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.rows, args.features, args.epochs)))
+        return
+
+    results = []
+    for mode in ("numpy", "tfdata"):
+        cmd = [sys.executable, os.path.abspath(__file__), "--mode", mode,
+               "--rows", str(args.rows), "--features", str(args.features), "--epochs", str(args.epochs)]
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True, cwd=ROOT_DIR).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{'模式':<8}{'樣本數':>8}{'建窗(s)':>10}{'總耗時(s)':>12}{'樣本/秒':>12}{'峰值RSS(MB)':>14}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['samples']:>8}{r['build_sec']:>10}{r['total_sec']:>12}{r['samples_per_sec']:>12}{r['peak_rss_mb']:>14}")
+
+
+if __name__ == "__main__":
+    main()
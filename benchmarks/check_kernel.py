@@ -0,0 +1,133 @@
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+import io
+import sys
+import shutil
+import tempfile
+import argparse
+import contextlib
+
+import numpy as np
+
+# ===========================
+# ⚡ sim_kernel 與 Python 日迴圈的逐筆比對
+# ===========================
+# 用合成行情各跑一次原本的逐日迴圈與 SIM_KERNEL 核心，比對寫出的交易 / 權益 CSV 是否逐位元組相同:
+#   禿鷹 classic / super: run_backtest.run_simulation
+#   Top 3 / MA30:         ai_backtest_2 / ai_backtest_ma30_2 的 run_backtest (兩邊查同一張預先填好的勝率表，不訓練模型)，
+#                         兩邊另外都分兩段跑 (第二段從檢查點接續)，確認持股 / 冷卻狀態的互轉
+# 有任何不同時以非 0 結束。NUMBA_DISABLE_JIT=1 可以檢查沒裝 numba 時的純 Python 路徑。
+#   python benchmarks/check_kernel.py
+#   python benchmarks/check_kernel.py --tickers 20 --days 600
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic_market
+
+SIM_DAYS = 250
+PROB_SEED = 0
+
+
+def same_files(dir_a, dir_b, names):
+    bad = []
+    for name in names:
+        with open(os.path.join(dir_a, name), "rb") as fa, open(os.path.join(dir_b, name), "rb") as fb:
+            if fa.read() != fb.read(): bad.append(name)
+    return bad
+
+
+def run_quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def check_vulture(market, start, end, workdir):
+    import run_backtest
+    import sim_kernel
+    run_backtest.TICKERS = list(market)
+    run_backtest.data_cache.clear()
+    run_backtest.data_cache.update(market)
+    dirs = {}
+    for engine in ("python", "kernel"):
+        sim_kernel.ENABLED = engine == "kernel"
+        run_backtest.DATA_DIR = dirs[engine] = os.path.join(workdir, f"vulture_{engine}")
+        os.makedirs(dirs[engine], exist_ok=True)
+        for s in sim_kernel.STRATEGIES:
+            run_quiet(run_backtest.run_simulation, s, start, end, s, resume=False)
+    names = [f"{s}_{suffix}.csv" for s in sim_kernel.STRATEGIES for suffix in ("log", "balance")]
+    return {"classic/super": same_files(dirs["python"], dirs["kernel"], names)}
+
+
+def check_ai(module, market, index_df, dates, workdir):
+    import checkpoint
+    import sim_kernel
+    module.TICKERS = list(market)
+    module.START_DATE, module.END_DATE = dates[0].strftime("%Y-%m-%d"), dates[-1].strftime("%Y-%m-%d")
+    module.download_data = lambda download_start: ({t: df.copy() for t, df in market.items()}, index_df.copy())
+    module.DATA_DIR = workdir
+    inputs = run_quiet(module.load_inputs)
+    # 兩邊查同一張表: 所有 (交易日, 股票) 先填好隨機勝率，日迴圈與核心都不會觸發訓練
+    rng = np.random.default_rng(PROB_SEED)
+    module.prob_table.update({(d, t): float(p) for d in dates for t, p in zip(market, rng.uniform(0.3, 0.8, len(market)))})
+    prefix = module.CHECKPOINT_NAME
+    names = [f"{prefix}_log.csv", f"{prefix}_balance.csv"]
+
+    def run(engine, data_dir, end=None, resume=False):
+        sim_kernel.ENABLED = engine == "kernel"
+        module.DATA_DIR = data_dir
+        module.END_DATE = (end or dates[-1]).strftime("%Y-%m-%d")
+        os.makedirs(data_dir, exist_ok=True)
+        if not resume: shutil.rmtree(checkpoint.CHECKPOINT_DIR, ignore_errors=True)
+        module.model_cache.clear()
+        run_quiet(module.run_backtest, inputs)
+
+    dirs = {}
+    for engine in ("python", "kernel"):
+        dirs[engine] = os.path.join(workdir, f"{prefix}_{engine}")
+        run(engine, dirs[engine])
+        # 接續時 event_log 會重寫 CSV (浮點數末位可能和一次跑完不同)，所以和 Python 迴圈的接續結果比
+        dirs[engine + "_resumed"] = os.path.join(workdir, f"{prefix}_{engine}_resumed")
+        run(engine, dirs[engine + "_resumed"], end=dates[len(dates) // 2])
+        run(engine, dirs[engine + "_resumed"], resume=True)
+    return {prefix: same_files(dirs["python"], dirs["kernel"], names),
+            f"{prefix} (檢查點接續)": same_files(dirs["python_resumed"], dirs["kernel_resumed"], names)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sim_kernel 與 Python 日迴圈的逐筆比對")
+    parser.add_argument("--tickers", type=int, default=10)
+    parser.add_argument("--days", type=int, default=500)
+    args = parser.parse_args()
+
+    import feature_panel
+    import sim_kernel
+    market = {t: feature_panel.add_technical_indicators(df) for t, df in synthetic_market.make_market(args.tickers, args.days).items()}
+    index_df = synthetic_market.make_index(args.days)
+    index_df['EMA60'] = index_df['Close'].ewm(span=60, adjust=False).mean()
+    dates = index_df.index[-SIM_DAYS:]
+    print(f"⚡ numba: {'啟用' if sim_kernel.HAS_NUMBA and os.environ.get('NUMBA_DISABLE_JIT', '0') != '1' else '未啟用 (純 Python 核心)'}")
+
+    workdir = tempfile.mkdtemp(prefix="check_kernel_")
+    # 回測模組在 import 時會建立 data/、saved_models/，切到暫存目錄避免污染專案
+    os.chdir(workdir)
+    results = {}
+    try:
+        results.update(check_vulture(market, dates[0].strftime("%Y-%m-%d"), dates[-1].strftime("%Y-%m-%d"), workdir))
+        import ai_backtest_2
+        import ai_backtest_ma30_2
+        for module in (ai_backtest_2, ai_backtest_ma30_2):
+            results.update(check_ai(module, market, index_df, dates, workdir))
+    finally:
+        os.chdir(ROOT_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for name, bad in results.items():
+        print(f"{'✅' if not bad else '❌'} {name}: {'逐筆相同' if not bad else '不同: ' + ', '.join(bad)}")
+    if any(results.values()): sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
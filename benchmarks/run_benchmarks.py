@@ -0,0 +1,366 @@
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+import io
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import argparse
+import datetime
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+# ===========================
+# 📊 離線基準測試套件
+# ===========================
+# 全部使用 synthetic_market 產生的合成行情，不需要網路。
+#   python benchmarks/run_benchmarks.py                      # 預設 N=20,100,500
+#   python benchmarks/run_benchmarks.py --sizes 20           # 只跑小規模 (快速檢查)
+#   python benchmarks/run_benchmarks.py --full               # 另外跑一整年的 AI 回測 (很慢)
+#   python benchmarks/run_benchmarks.py --save-baseline      # 把這次結果存成基準線
+#   python benchmarks/run_benchmarks.py --cases rolling_study --save-baseline   # 只更新這個案例的基準
+# 每次結果寫到 benchmarks/results/latest.json，並和 benchmarks/baseline.json 比較。
+# 新增或加速一個案例時要一起更新它的基準線；沒有基準的案例會在最後列出 (無法抓到退步)。
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic_market
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+N_DAYS = 1000            # 約 4 年交易日，足夠 1000 天暖機 + 1 年回測
+SIM_DAYS = 252           # 回測區間長度 (最後一年)
+REGRESSION_TOLERANCE = 0.25
+
+CASES = {}
+
+
+def case(name, scaled=True, full_only=False, repeat=3):
+    # scaled=True 的案例會對每個 N 各跑一次；否則只跑一次 (與股票數無關)
+    def register(fn):
+        CASES[name] = {"fn": fn, "scaled": scaled, "full_only": full_only, "repeat": repeat}
+        return fn
+    return register
+
+
+def measure(run, repeat):
+    samples = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            run()
+            samples.append(time.perf_counter() - t0)
+    arr = np.asarray(samples)
+    return {"min_sec": round(float(arr.min()), 4), "median_sec": round(float(np.median(arr)), 4),
+            "mean_sec": round(float(arr.mean()), 4), "repeat": repeat}
+
+
+def with_indicators(ctx):
+    import feature_panel
+    if "indicator_data" not in ctx:
+        ctx["indicator_data"] = {t: feature_panel.add_technical_indicators(df.copy()) for t, df in ctx["market"].items()}
+    return ctx["indicator_data"]
+
+
+# ===========================
+# 案例
+# ===========================
+@case("load_csv")
+def bench_load_csv(ctx):
+    csv_dir = os.path.join(ctx["workdir"], f"csv_{ctx['n']}")
+    os.makedirs(csv_dir, exist_ok=True)
+    paths = []
+    for t, df in ctx["market"].items():
+        path = os.path.join(csv_dir, f"{t}.csv")
+        df.to_csv(path)
+        paths.append(path)
+
+    def run():
+        for path in paths:
+            pd.read_csv(path, index_col=0, parse_dates=True)
+    return run
+
+
+@case("load_panel")
+def bench_load_panel(ctx):
+    import feature_panel
+    panel_dir = os.path.join(ctx["workdir"], f"panel_{ctx['n']}")
+    feature_panel.build_panel(with_indicators(ctx), panel_dir)
+    tickers = list(ctx["market"].keys())
+
+    def run():
+        full_data = feature_panel.load_full_data(tickers, panel_dir)
+        for df in full_data.values():
+            float(df['Close'].iloc[-1])
+    return run
+
+
+@case("indicators")
+def bench_indicators(ctx):
+    import feature_panel
+
+    def run():
+        for df in ctx["market"].values():
+            feature_panel.add_technical_indicators(df.copy())
+    return run
+
+
+@case("windows")
+def bench_windows(ctx):
+    import ai_backtest_2
+    import feature_panel
+    data = with_indicators(ctx)
+    # 與回測相同: 標籤在迴圈外算一次
+    for df in data.values(): feature_panel.add_labels(df, ai_backtest_2.PREDICT_DAYS, ai_backtest_2.TARGET_ROI_CLASS)
+
+    def run():
+        for df in data.values():
+            ai_backtest_2.prepare_data(df, ai_backtest_2.LOOK_BACK)
+    return run
+
+
+@case("momentum_ranking")
+def bench_ranking(ctx):
+    import ranking
+    data = with_indicators(ctx)
+    dates = next(iter(data.values())).index[-SIM_DAYS:]
+
+    def run():
+        rank = ranking.from_full_data(data, list(data.keys()), 3)
+        for d in dates:
+            ranking.prices_on(rank, d)
+            ranking.top_tickers(rank, d)
+    return run
+
+
+@case("train_predict", scaled=False, repeat=1)
+def bench_train_predict(ctx):
+    import ai_backtest_2
+    df = next(iter(with_indicators(ctx).values()))
+    x_train, y_train, _, scaled_data = ai_backtest_2.prepare_data(df, ai_backtest_2.LOOK_BACK)
+    curr_input = scaled_data[-ai_backtest_2.LOOK_BACK:][np.newaxis]
+
+    def run():
+        model = ai_backtest_2.build_model((x_train.shape[1], x_train.shape[2]))
+        model.fit(x_train, y_train, batch_size=32, epochs=10, verbose=0)
+        model.predict(curr_input, verbose=0)
+    return run
+
+
+@case("vulture_simulation", repeat=1)
+def bench_vulture(ctx):
+    import run_backtest
+    dates = next(iter(ctx["market"].values())).index
+    start, end = dates[-SIM_DAYS].strftime("%Y-%m-%d"), dates[-1].strftime("%Y-%m-%d")
+
+    def run():
+        run_backtest.DATA_DIR = ctx["workdir"]
+        run_backtest.TICKERS = list(ctx["market"].keys())
+        run_backtest.data_cache.clear()
+        run_backtest.data_cache.update(ctx["market"])
+        run_backtest.run_simulation("super", start, end, f"bench_super_{ctx['n']}", resume=False)
+    return run
+
+
+@case("vulture_kernel", repeat=1)
+def bench_vulture_kernel(ctx):
+    # 與 vulture_simulation 相同的回測，改走 sim_kernel (沒裝 numba 時是 NumPy 訊號 + Python 狀態機)
+    import sim_kernel
+    simulate = bench_vulture(ctx)
+
+    def run():
+        enabled = sim_kernel.ENABLED
+        sim_kernel.ENABLED = True
+        try:
+            simulate()
+        finally:
+            sim_kernel.ENABLED = enabled
+    run()   # numba 第一次呼叫要編譯 (或載入快取)，先跑一次不計時
+    return run
+
+
+@case("vulture_lockstep", repeat=1)
+def bench_vulture_lockstep(ctx):
+    # classic / super 各兩個區間共 4 個實例，在同一份對齊面板上同步跑一次
+    import sim_kernel
+    dates = next(iter(ctx["market"].values())).index
+    half = SIM_DAYS // 2
+    periods = [(dates[-SIM_DAYS], dates[-half - 1]), (dates[-half], dates[-1])]
+
+    def run():
+        instances = [{"name": f"{s}_{k}", "strategy": s, "start": a.strftime("%Y-%m-%d"), "end": b.strftime("%Y-%m-%d"),
+                      "portfolio": {"cash": 1000, "holdings": []}} for s in sim_kernel.STRATEGIES for k, (a, b) in enumerate(periods)]
+        sim_kernel.run_lockstep(instances, ctx["market"], list(ctx["market"].keys()), 2)
+    run()   # numba 第一次呼叫要編譯 (或載入快取)，先跑一次不計時
+    return run
+
+
+@case("rolling_study", repeat=1)
+def bench_rolling_study(ctx):
+    # 最後 SIM_DAYS 個交易日的每一天起跑 x 所有持有期間 x 兩種策略
+    import rolling_study
+    dates = next(iter(ctx["market"].values())).index
+    output_file = os.path.join(ctx["workdir"], f"rolling_study_{ctx['n']}.json")
+
+    def run():
+        rolling_study.run_study(ctx["market"], list(ctx["market"].keys()), start=dates[-SIM_DAYS].strftime("%Y-%m-%d"),
+                                end=dates[-1].strftime("%Y-%m-%d"), output_file=output_file)
+    return run
+
+
+def dashboard_case(ctx, parquet):
+    import dashboard_data
+    import event_log
+    out_dir = os.path.join(ctx["workdir"], f"dash_{ctx['n']}_{'parquet' if parquet else 'csv'}")
+    os.makedirs(out_dir, exist_ok=True)
+    dates = next(iter(ctx["market"].values())).index[-SIM_DAYS:]
+    rng = np.random.default_rng(0)
+    files = []
+    for k in range(10):
+        b_file = os.path.join(out_dir, f"s{k}_balance.csv")
+        l_file = os.path.join(out_dir, f"s{k}_log.csv")
+        pd.DataFrame({"Date": dates.strftime("%Y-%m-%d"), "Equity": 10000 * np.cumprod(1 + rng.normal(0, 0.01, len(dates)))}).to_csv(b_file, index=False)
+        pd.DataFrame({"Date": dates[::5].strftime("%Y-%m-%d"), "Action": "BUY", "Ticker": "SYN000", "Price": 100.0,
+                      "Reason": "bench", "Balance": 1000.0}).to_csv(l_file, index=False)
+        files.append((b_file, l_file))
+        if parquet:
+            event_log.compact(b_file)
+            event_log.compact(l_file)
+    signals_file = os.path.join(out_dir, "latest_signals.json")
+    rows = [{"ticker": t, "price": 100.0, "probability": 60.0, "ma30_distance": 1.0} for t in ctx["market"]]
+    with open(signals_file, "w") as f:
+        json.dump({"scan_time": "bench", "market_bullish": True, "strategy_1_top3": rows[:3], "strategy_2_ma30": rows}, f, indent=4)
+
+    def run():
+        for b_file, l_file in files:
+            dashboard_data.load_balance(b_file)
+            dashboard_data.load_log(l_file)
+        dashboard_data.load_signals(signals_file)
+    return run
+
+
+@case("dashboard_loaders")
+def bench_dashboard(ctx):
+    return dashboard_case(ctx, parquet=False)
+
+
+@case("dashboard_loaders_parquet")
+def bench_dashboard_parquet(ctx):
+    return dashboard_case(ctx, parquet=True)
+
+
+@case("ai_backtest_year", scaled=False, full_only=True, repeat=1)
+def bench_ai_backtest_year(ctx):
+    import ai_backtest_2
+    market = dict(list(with_indicators(ctx).items())[:20])
+    index_df = synthetic_market.make_index(N_DAYS)
+    index_df['EMA60'] = index_df['Close'].ewm(span=60, adjust=False).mean()
+    dates = index_df.index
+
+    def run():
+        ai_backtest_2.DATA_DIR = ctx["workdir"]
+        ai_backtest_2.TICKERS = list(market.keys())
+        ai_backtest_2.START_DATE = dates[-SIM_DAYS].strftime("%Y-%m-%d")
+        ai_backtest_2.END_DATE = dates[-1].strftime("%Y-%m-%d")
+        ai_backtest_2.model_cache.clear()
+        ai_backtest_2.download_data = lambda download_start: (dict(market), index_df.copy())
+        ai_backtest_2.run_backtest()
+    return run
+
+
+# ===========================
+# 執行 / 比較
+# ===========================
+def environment_info():
+    info = {"python": platform.python_version(), "platform": platform.platform(),
+            "numpy": np.__version__, "pandas": pd.__version__}
+    try:
+        import tensorflow as tf
+        info["tensorflow"] = tf.__version__
+    except ImportError:
+        pass
+    return info
+
+
+def compare(results, baseline):
+    regressions, missing = [], []
+    print(f"\n{'案例':<34}{'中位數(s)':>12}{'基準(s)':>12}{'變化':>10}")
+    for key, r in results.items():
+        base = baseline.get("results", {}).get(key)
+        if base:
+            ratio = r["median_sec"] / base["median_sec"] - 1 if base["median_sec"] > 0 else 0.0
+            flag = " ⚠️" if ratio > REGRESSION_TOLERANCE else ""
+            print(f"{key:<34}{r['median_sec']:>12.4f}{base['median_sec']:>12.4f}{ratio*100:>9.1f}%{flag}")
+            if flag: regressions.append(key)
+        else:
+            print(f"{key:<34}{r['median_sec']:>12.4f}{'-':>12}{'-':>10}")
+            missing.append(key)
+    return regressions, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="離線基準測試")
+    parser.add_argument("--sizes", default="20,100,500", help="股票數 N，逗號分隔")
+    parser.add_argument("--days", type=int, default=N_DAYS)
+    parser.add_argument("--cases", default="", help="只跑指定案例，逗號分隔")
+    parser.add_argument("--full", action="store_true", help="包含一整年的 AI 回測")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    selected = [c for c in args.cases.split(",") if c] or list(CASES.keys())
+    workdir = tempfile.mkdtemp(prefix="stock_bench_")
+    # 回測模組在 import 時會建立 data/、saved_models/，切到暫存目錄避免污染專案
+    os.chdir(workdir)
+
+    results = {}
+    try:
+        for name in selected:
+            spec = CASES[name]
+            if spec["full_only"] and not args.full: continue
+            for n in (sizes if spec["scaled"] else [max(sizes[0], 20)]):
+                ctx = {"n": n, "days": args.days, "workdir": workdir,
+                       "market": synthetic_market.make_market(n, args.days)}
+                key = f"{name}[N={n}]"
+                with contextlib.redirect_stdout(io.StringIO()):
+                    run = spec["fn"](ctx)
+                results[key] = measure(run, spec["repeat"])
+                print(f"✅ {key:<34} {results[key]['median_sec']:.4f}s")
+    finally:
+        os.chdir(ROOT_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+              "days": args.days, "environment": environment_info(), "results": results}
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(os.path.join(RESULTS_DIR, "latest.json"), "w") as f:
+        json.dump(report, f, indent=4)
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r") as f:
+            baseline = json.load(f)
+    regressions, missing = compare(results, baseline)
+    if args.save_baseline:
+        # 只取代這次跑到的案例，其餘案例沿用原本的基準 (天數不同時整份重建)
+        if baseline.get("days") == args.days: report["results"] = {**baseline.get("results", {}), **results}
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"💾 基準線已更新: {BASELINE_FILE} ({len(results)} 個案例)")
+    elif missing:
+        print(f"⚠️ {len(missing)} 個案例沒有基準線，請用 --cases <案例> --save-baseline 補上: {missing}")
+    if regressions:
+        print(f"⚠️ 有 {len(regressions)} 個案例比基準線慢超過 {REGRESSION_TOLERANCE*100:.0f}%: {regressions}")
+        if args.fail_on_regression: sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
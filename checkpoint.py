@@ -0,0 +1,89 @@
+import os
+import pickle
+import datetime
+import pandas as pd
+
+# ===========================
+# ⏯️ 回測檢查點 (每晚只跑新增的交易日)
+# ===========================
+# 每次回測結束時把完整模擬狀態 (持倉、冷卻清單、下次交易日、模型快照位置與訓練日期、
+# 最後處理日的收盤價) 存到 data/checkpoints/<name>.pkl。
+# 下次執行時從最後處理日的隔天接著跑，balance / log 只追加新的列 (見 event_log)。
+#
+# 以下情況會自動改回完整回放:
+#   - 設定 FULL_REPLAY=1
+#   - 策略參數 / 起始日 / 股票池和檢查點不同
+#   - 資料源回頭修正了歷史價格 (持倉股票在檢查點當天的收盤價對不上)
+CHECKPOINT_DIR = os.path.join("data", "checkpoints")
+CHECKPOINT_VERSION = 1
+RESUME = os.environ.get("FULL_REPLAY", "") != "1"
+PRICE_TOLERANCE = 1e-6
+
+
+def checkpoint_path(name):
+    return os.path.join(CHECKPOINT_DIR, f"{name}.pkl")
+
+
+def save(name, state):
+    # 先寫暫存檔 + fsync，再 os.replace，當機時不會留下寫一半的檢查點
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = checkpoint_path(name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    state = dict(state, version=CHECKPOINT_VERSION, saved_at=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load(name, config):
+    path = checkpoint_path(name)
+    if not RESUME or not os.path.exists(path): return None
+    try:
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+    except Exception as e:
+        print(f"⚠️ 檢查點 {path} 無法讀取 ({e})，改為完整回放。")
+        return None
+    if state.get("version") != CHECKPOINT_VERSION or state.get("config") != config:
+        print(f"⚠️ 策略設定與檢查點不同，改為完整回放。")
+        return None
+    return state
+
+
+def remove(name):
+    path = checkpoint_path(name)
+    if os.path.exists(path): os.remove(path)
+
+
+def prices_match(state, prices):
+    # prices: 檢查點當天的 {ticker: close}
+    for t, p in state.get("last_prices", {}).items():
+        if t not in prices or abs(prices[t] - p) > PRICE_TOLERANCE * max(abs(p), 1.0): return False
+    return True
+
+
+def append_rows(path, rows):
+    # 檔案不存在或是空表 (原本沒有任何交易) 時才寫表頭
+    if not rows: return
+    fresh = True
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            fresh = f.readline().strip() in ("", '""')
+    pd.DataFrame(rows).to_csv(path, mode="w" if fresh else "a", header=fresh, index=False)
+
+
+def model_meta(model_cache):
+    # model 物件本身存在模型快照裡，檢查點只記訓練日期；蒸餾的老師模型不保存，接續後重訓
+    return {t: {k: v for k, v in info.items() if k not in ('model', 'teacher')} for t, info in model_cache.items()}
+
+
+def restore_model_cache(snapshot_dir, meta):
+    from tensorflow.keras.models import load_model
+    model_cache = {}
+    for t, info in meta.items():
+        model_path = os.path.join(snapshot_dir, f"{t}.keras")
+        if not os.path.exists(model_path): continue
+        model_cache[t] = {'model': load_model(model_path), **info}
+    return model_cache
@@ -0,0 +1,59 @@
+import os
+import json
+import pandas as pd
+import event_log
+import signals_store
+
+# ===========================
+# 📂 儀表板資料讀取
+# ===========================
+# app.py 每次 rerun 都會呼叫這些函數；獨立成模組後可以單獨做基準測試。
+# 交易紀錄 / 資產曲線透過 event_log 讀取: 壓縮過的 CSV + 還沒壓縮的事件尾巴，
+# 回測還在跑的時候也能看到最新進度，而且只需要讀那一小段尾巴。
+# 旁邊有最新的 .parquet 時直接讀 Parquet (Date 已經是日期型別)，否則退回 CSV。
+
+
+def load_balance(path):
+    # 回傳以 Date 為 index 的資產曲線；檔案不存在回傳 None，空檔案回傳空 DataFrame
+    df = event_log.read_table(path)
+    if df is None or df.empty: return df
+    df['Date'] = pd.to_datetime(df['Date'])
+    return df.set_index('Date')
+
+
+def load_log(path):
+    return event_log.read_table(path)
+
+
+_memo = {}
+
+
+def _file_key(path):
+    # 檔案沒變 (mtime + 大小) 就沿用上次解析的結果；.sig 與 .json 任一個變了都會重讀
+    key = []
+    for p in (path, signals_store.binary_path(path)):
+        if os.path.exists(p):
+            st = os.stat(p)
+            key.append((p, st.st_mtime_ns, st.st_size))
+    return tuple(key)
+
+
+def load_signals(path):
+    # Streamlit 每次 rerun 都會呼叫；模組在 rerun 之間不會重新 import，所以快取放在模組層級即可。
+    # 回傳的 dict 是共用的，呼叫端不要修改它
+    key = _file_key(path)
+    if not key: return {}
+    if _memo.get(path, (None,))[0] != key:
+        _memo[path] = (key, signals_store.read(path))
+    return _memo[path][1]
+
+
+def load_report(path):
+    # robustness.py / rolling_study.py 產生的 JSON 報告；同樣依 mtime + 大小快取，檔案不存在回傳 None
+    if not os.path.exists(path): return None
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    if _memo.get(path, (None,))[0] != key:
+        with open(path, "r") as f:
+            _memo[path] = (key, json.load(f))
+    return _memo[path][1]
@@ -0,0 +1,56 @@
+import os
+import numpy as np
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import Conv1D, Dense, GlobalAveragePooling1D, Input
+
+# ===========================
+# 🎓 知識蒸餾 (LSTM 老師 -> 小型 1D-Conv 學生)
+# ===========================
+# SIGNAL_BACKEND=student 時，AI 回測的 predict_signal 改用學生模型:
+#   - 老師 (原本的 LSTM 100->50) 每 TEACHER_REFRESH_DAYS 天才重訓一次
+#   - 每次重訓 (RETRAIN_EVERY_N_DAYS) 只用老師的機率當軟標籤，重新訓練很小的學生模型
+#   - 回測打分、模型快照、掃描器讀到的都是學生模型，可直接替換
+# 老師只在記憶體裡 (不進快照 / 檢查點)，從檢查點接續後第一次重訓會重新訓練老師。
+#   比較: python benchmarks/bench_distill.py
+BACKEND = os.environ.get("SIGNAL_BACKEND", "lstm").lower()
+TEACHER_REFRESH_DAYS = 120
+SOFT_WEIGHT = 0.7          # 目標 = 0.7 * 老師機率 + 0.3 * 真實標籤
+STUDENT_EPOCHS = 10
+STUDENT_FILTERS = 16
+
+
+def is_student_backend():
+    return BACKEND == "student"
+
+
+def build_student(input_shape):
+    model = Sequential()
+    model.add(Input(shape=input_shape))
+    model.add(Conv1D(STUDENT_FILTERS, kernel_size=5, activation='relu'))
+    model.add(GlobalAveragePooling1D())
+    model.add(Dense(16, activation='relu'))
+    model.add(Dense(1, activation='sigmoid'))
+    model.compile(optimizer='adam', loss='binary_crossentropy')
+    return model
+
+
+def soft_targets(teacher, x_train, y_train):
+    probs = teacher.predict(x_train, batch_size=256, verbose=0)[:, 0]
+    return SOFT_WEIGHT * probs + (1 - SOFT_WEIGHT) * np.asarray(y_train, dtype=np.float64)
+
+
+def fit_student(teacher, x_train, y_train, epochs=STUDENT_EPOCHS):
+    student = build_student((x_train.shape[1], x_train.shape[2]))
+    student.fit(x_train, soft_targets(teacher, x_train, y_train), batch_size=32, epochs=epochs, verbose=0)
+    return student
+
+
+def retrain(model_info, build_teacher, x_train, y_train, current_date):
+    # 回傳要寫回 model_cache 的欄位: 學生模型 + 目前的老師與老師訓練日
+    model_info = model_info or {}
+    teacher, teacher_date = model_info.get('teacher'), model_info.get('teacher_date')
+    if teacher is None or (current_date - teacher_date).days >= TEACHER_REFRESH_DAYS:
+        teacher = build_teacher((x_train.shape[1], x_train.shape[2]))
+        teacher.fit(x_train, y_train, batch_size=32, epochs=10, verbose=0)
+        teacher_date = current_date
+    return {'model': fit_student(teacher, x_train, y_train), 'teacher': teacher, 'teacher_date': teacher_date}
@@ -0,0 +1,289 @@
+import os
+import json
+import glob
+import time
+import contextlib
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 flock，退回不上鎖 (單一寫入者仍然安全)
+    fcntl = None
+
+try:
+    import pyarrow.parquet as pq  # streamlit 已經依賴 pyarrow
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# ===========================
+# 📝 只追加的事件日誌 (交易紀錄 / 資產曲線)
+# ===========================
+# 每個 CSV (例如 data/ai_backtest_log.csv) 旁邊有三個檔:
+#   <csv>.events        還沒壓縮的新事件，一行一筆 JSON，只會往後追加
+#   <csv>.compact.json  壓縮進度 {"seq", "prev_seq", "csv_rows"}
+#   <csv>.lock          寫入鎖 (flock)
+#   <name>.parquet      與 CSV 同內容的 Parquet (Date 為日期型別、zstd 壓縮)，儀表板優先讀這個
+#
+# 寫入端邊跑邊 append，每 FSYNC_EVERY 筆或 FSYNC_INTERVAL 秒 fsync 一次；
+# 累積 COMPACT_EVERY 筆 (以及關閉時) 把事件併進 CSV 並清空 .events。
+# 中途當機最多只損失最後一批還沒 fsync 的事件，不會像整檔重寫那樣全部消失。
+# 讀取端不必上鎖: 讀 CSV + .events 裡還沒壓縮的尾巴，寫到一半的最後一行直接忽略。
+FSYNC_EVERY = 64
+FSYNC_INTERVAL = 1.0
+COMPACT_EVERY = 1000
+COMPACT_BYTES = 256 * 1024   # 單筆寫入者 (網頁) 不會累積計數，改看 .events 檔案大小
+WRITE_PARQUET = HAS_PARQUET and os.environ.get("WRITE_PARQUET", "1") != "0"
+PARQUET_COMPRESSION = "zstd"
+
+
+def events_path(path):
+    return f"{path}.events"
+
+
+def _state_path(path):
+    return f"{path}.compact.json"
+
+
+def parquet_path(path):
+    return os.path.splitext(path)[0] + ".parquet"
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    # flock 綁在這次 open 上: 同一個行程不要巢狀呼叫同一個檔的 file_lock
+    with open(f"{path}.lock", "a") as f:
+        if fcntl: fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl: fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _json_default(obj):
+    # numpy 純量 / Timestamp / date
+    if hasattr(obj, "item"): return obj.item()
+    return str(obj)
+
+
+def _read_state(path):
+    try:
+        with open(_state_path(path), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"seq": 0, "prev_seq": 0, "csv_rows": None}
+
+
+def _write_state(path, state):
+    tmp_path = f"{_state_path(path)}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, _state_path(path))
+
+
+def _read_csv(path):
+    if not os.path.exists(path): return pd.DataFrame()
+    try:
+        return pd.read_csv(path)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+
+
+def typed(df):
+    # CSV 裡的日期是字串；Parquet 存成真正的日期型別，讀取端不必再 pd.to_datetime
+    if "Date" in df.columns and not pd.api.types.is_datetime64_any_dtype(df["Date"]):
+        try:
+            df = df.assign(Date=pd.to_datetime(df["Date"]))
+        except (ValueError, TypeError):
+            pass
+    return df
+
+
+def _write_tmp(path, df):
+    # 先把 CSV (+ Parquet) 寫成暫存檔並 fsync，回傳 [(暫存檔, 正式檔)]，由呼叫端在更新進度檔後換上
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.to_csv(tmp_path, index=False)
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    pending = [(tmp_path, path)]
+    if WRITE_PARQUET:
+        tmp_parquet = f"{parquet_path(path)}.{os.getpid()}.tmp"
+        try:
+            typed(df).to_parquet(tmp_parquet, index=False, compression=PARQUET_COMPRESSION)
+            pending.append((tmp_parquet, parquet_path(path)))
+        except Exception as e:
+            # Parquet 只是加速用的副本；失敗時讀取端會發現列數/時間對不上，自動退回讀 CSV
+            print(f"⚠️ {parquet_path(path)} 寫入失敗 ({e})，只保留 CSV。")
+            if os.path.exists(tmp_parquet): os.remove(tmp_parquet)
+    return pending
+
+
+def _read_base(path, state):
+    # Parquet 必須比 CSV 新、列數又和進度檔一致才用，否則退回 CSV
+    p_path = parquet_path(path)
+    if HAS_PARQUET and state["csv_rows"] is not None and os.path.exists(p_path) and \
+            (not os.path.exists(path) or os.path.getmtime(p_path) >= os.path.getmtime(path)):
+        # 直接用 ParquetFile: 先看 metadata 的列數，小檔案也比 pd.read_parquet 少一層開銷
+        parquet_file = pq.ParquetFile(p_path)
+        if parquet_file.metadata.num_rows == state["csv_rows"]: return parquet_file.read().to_pandas(), True
+    return _read_csv(path), False
+
+
+def _compacted_seq(state, csv_rows):
+    # 進度檔比 CSV 先換上；CSV 列數對不上代表上次壓縮在換 CSV 之前中斷，只算到 prev_seq
+    if state["csv_rows"] is None or csv_rows == state["csv_rows"]: return state["seq"]
+    return state["prev_seq"]
+
+
+def read_events(path, after_seq=0):
+    # 回傳 [(seq, row)]；只讀完整的行，寫到一半的最後一行留給下次
+    try:
+        with open(events_path(path), "rb") as f:
+            data = f.read()
+    except OSError:
+        return []
+    events = []
+    for line in data[:data.rfind(b"\n") + 1].splitlines():
+        if not line.strip(): continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            continue
+        seq = row.pop("_seq", 0)
+        if seq > after_seq: events.append((seq, row))
+    return events
+
+
+def _last_seq(path):
+    events = read_events(path)
+    return max([_read_state(path)["seq"]] + [seq for seq, _ in events])
+
+
+def _merge(df, tail):
+    # 保留 CSV 原本的欄位順序 (只有表頭的空表也一樣)，新欄位接在後面
+    columns = list(df.columns) + [c for c in tail.columns if c not in df.columns]
+    if df.empty: return tail.reindex(columns=columns)
+    return pd.concat([df, tail], ignore_index=True)[columns]
+
+
+def read_table(path):
+    # 壓縮過的表 (有 Parquet 就讀 Parquet) + 還沒壓縮的事件；都不存在時回傳 None
+    has_events = os.path.exists(events_path(path))
+    if not os.path.exists(path) and not has_events: return None
+    state = _read_state(path)
+    df, from_parquet = _read_base(path, state)
+    if not has_events: return df
+    events = read_events(path, _compacted_seq(state, len(df)))
+    if not events: return df
+    tail = pd.DataFrame([row for _, row in events])
+    return _merge(df, typed(tail) if from_parquet else tail)
+
+
+def compact(path):
+    with file_lock(path):
+        state = _read_state(path)
+        df = _read_csv(path)
+        done = _compacted_seq(state, len(df))
+        events = read_events(path, done)
+        if events:
+            merged = _merge(df, pd.DataFrame([row for _, row in events]))
+            pending = _write_tmp(path, merged)
+            _write_state(path, {"seq": events[-1][0], "prev_seq": done, "csv_rows": len(merged)})
+            for tmp_path, final_path in pending: os.replace(tmp_path, final_path)
+        elif WRITE_PARQUET and os.path.exists(path) and not df.empty and not _read_base(path, state)[1]:
+            # 舊的 CSV (或 Parquet 過期): 補一份 Parquet
+            pending = _write_tmp(path, df)
+            _write_state(path, {"seq": done, "prev_seq": done, "csv_rows": len(df)})
+            for tmp_path, final_path in pending: os.replace(tmp_path, final_path)
+        if os.path.exists(events_path(path)):
+            with open(events_path(path), "w") as f:
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def truncate_after(path, last_date, column="Date"):
+    # 接續檢查點前，移除 last_date 之後的列 (上次中途當機或週末補的列，這次會重新產生)
+    if not os.path.exists(path) and not os.path.exists(events_path(path)): return
+    compact(path)
+    with file_lock(path):
+        df = _read_csv(path)
+        if df.empty or column not in df.columns: return
+        keep = df[column].astype(str) <= last_date
+        if keep.all(): return
+        df = df[keep]
+        state = _read_state(path)
+        pending = _write_tmp(path, df)
+        _write_state(path, {"seq": state["seq"], "prev_seq": state["seq"], "csv_rows": len(df)})
+        for tmp_path, final_path in pending: os.replace(tmp_path, final_path)
+
+
+def open_stream(path, reset=False):
+    # reset=True: 完整回放，清掉舊的 CSV 與事件
+    with file_lock(path):
+        if reset:
+            for p in (path, events_path(path), _state_path(path), parquet_path(path)):
+                if os.path.exists(p): os.remove(p)
+    return {"path": path, "buffer": [], "last_sync": time.monotonic(), "since_compact": 0}
+
+
+def append(stream, row):
+    stream["buffer"].append(row)
+    if len(stream["buffer"]) >= FSYNC_EVERY or time.monotonic() - stream["last_sync"] >= FSYNC_INTERVAL:
+        flush(stream)
+
+
+def flush(stream):
+    path, rows = stream["path"], stream["buffer"]
+    if rows:
+        with file_lock(path):
+            # 序號在鎖內才分配，多個寫入者 (例如網頁手動日誌) 也不會重號
+            seq = _last_seq(path)
+            lines = []
+            for row in rows:
+                seq += 1
+                lines.append(json.dumps({"_seq": seq, **row}, ensure_ascii=False, default=_json_default) + "\n")
+            with open(events_path(path), "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+        stream["since_compact"] += len(rows)
+        stream["buffer"] = []
+    stream["last_sync"] = time.monotonic()
+    if stream["since_compact"] >= COMPACT_EVERY or \
+            (os.path.exists(events_path(path)) and os.path.getsize(events_path(path)) >= COMPACT_BYTES):
+        compact(path)
+        stream["since_compact"] = 0
+
+
+def close(stream):
+    flush(stream)
+    compact(stream["path"])
+    # 整段都沒有事件 (例如沒有任何交易) 時，照舊留下一個空表，讀取端才知道這次跑過了
+    if not os.path.exists(stream["path"]): pd.DataFrame().to_csv(stream["path"], index=False)
+
+
+def append_row(path, row):
+    # 單筆寫入 (網頁手動日誌): 立即 fsync，不等批次
+    stream = open_stream(path)
+    stream["buffer"].append(row)
+    flush(stream)
+
+
+def compact_dir(directory):
+    # 把資料夾內所有交易紀錄 / 資產曲線的事件併進 CSV (並補上 Parquet)
+    paths = sorted(glob.glob(os.path.join(directory, "*_log.csv")) + glob.glob(os.path.join(directory, "*_balance.csv")))
+    for path in paths:
+        compact(path)
+    return len(paths)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="壓縮事件日誌並產生 Parquet")
+    parser.add_argument("--dir", default="data")
+    args = parser.parse_args()
+
+    print(f"✅ 已壓縮 {compact_dir(args.dir)} 個檔案 (Parquet: {'開' if WRITE_PARQUET else '關'})")
@@ -0,0 +1,202 @@
+import os
+import json
+import datetime
+from collections import deque
+import numpy as np
+import pandas as pd
+import ta
+import universe
+
+# ===========================
+# 🧱 共享特徵面板 (Memory-Mapped)
+# ===========================
+# 指標只在建檔時算一次，存成 (股票數, 交易日數, 特徵數) 的 .npy。
+# 各回測行程用 mmap 唯讀開啟，作業系統會共用同一份 page cache，
+# 多開 worker 不會讓記憶體倍增，也不必每個行程重跑 add_technical_indicators。
+#
+#   建檔: python feature_panel.py --start 2022-04-07
+#   使用: FEATURE_PANEL=data/feature_panel python ai_backtest_2.py
+PANEL_DIR = os.environ.get("FEATURE_PANEL", "")
+DEFAULT_PANEL_DIR = os.path.join("data", "feature_panel")
+
+VALUES_FILE = "values.npy"
+DATES_FILE = "dates.npy"
+META_FILE = "meta.json"
+
+LABEL_HORIZON = 10   # 與 AI 回測的 PREDICT_DAYS 相同
+
+FEATURES = ['Close', 'Volume', 'RSI', 'MACD', 'ATR', 'EMA20', 'EMA60', 'MA30', 'MA30_Slope', 'Price_Change',
+            f'Future_Max_{LABEL_HORIZON}']
+
+# 所有引擎用到的股票聯集 + 大盤
+PANEL_TICKERS = universe.all_listed_tickers() + ['QQQ']
+
+
+def add_technical_indicators(df):
+    # 與 ai_market_scanner / ai_backtest_ma30_2 相同的指標定義
+    df['RSI'] = ta.momentum.rsi(df['Close'], window=14)
+    macd = ta.trend.MACD(df['Close'])
+    df['MACD'] = macd.macd()
+    df['ATR'] = ta.volatility.average_true_range(df['High'], df['Low'], df['Close'], window=14)
+    df['EMA20'] = ta.trend.ema_indicator(df['Close'], window=20)
+    df['EMA60'] = ta.trend.ema_indicator(df['Close'], window=60)
+    df['MA30'] = ta.trend.sma_indicator(df['Close'], window=30)
+    df['MA30_Slope'] = df['MA30'].diff()
+    df['Price_Change'] = df['Close'].diff()
+    df.bfill(inplace=True)
+    return df
+
+
+# ===========================
+# 🏷️ 訓練標籤 (未來 N 天最高收盤價)
+# ===========================
+def future_max(values, horizon):
+    # out[i] = max(values[i+1 : i+1+horizon])；後面不足 horizon 天的位置為 NaN
+    # 由後往前掃，deque 保持「索引遞增、數值遞減」，每個元素只進出一次，整條序列 O(n)
+    n = len(values)
+    out = np.full(n, np.nan)
+    window = deque()
+    for i in range(n - 2, -1, -1):
+        while window and values[window[-1]] <= values[i + 1]: window.pop()
+        window.append(i + 1)
+        if window[0] > i + horizon: window.popleft()
+        if i + horizon < n: out[i] = values[window[0]]
+    return out
+
+
+def future_max_column(horizon):
+    return f'Future_Max_{horizon}'
+
+
+def label_column(horizon, target_roi):
+    return f'Label_{horizon}d_{target_roi:g}'
+
+
+def add_labels(df, horizon=LABEL_HORIZON, target_roi=None):
+    # 必須在該股票自己的交易日上算 (不是對齊後的聯集日期)，才和 prepare_data 逐列切片的結果一致
+    # 面板已經存了 Future_Max_<horizon> 就直接沿用；target_roi 給了才加二元標籤欄位
+    close = df['Close'].to_numpy(dtype=np.float64)
+    column = future_max_column(horizon)
+    if column not in df.columns: df[column] = future_max(close, horizon)
+    if target_roi is not None:
+        high = df[column].to_numpy()
+        label = np.where(np.isnan(high), np.nan, ((high - close) / close > target_roi).astype(np.float64))
+        df[label_column(horizon, target_roi)] = label
+    return df
+
+
+def label_slice(df, start, end, horizon, target_roi, cutoff=None):
+    # 回傳第 start ~ end-1 列的標籤；第 i 列的標籤用到第 i+1 ~ i+horizon 列的收盤價
+    # 防呆: 最後一個標籤的未來區間必須落在 df 內、而且早於訓練截止日，否則就是偷看未來
+    if end <= start: return np.array([], dtype=np.int64)
+    last_used = end - 1 + horizon
+    if last_used >= len(df) or (cutoff is not None and df.index[last_used] >= cutoff):
+        raise ValueError(f"標籤用到訓練截止日之後的資料 ({df.index[-1]})")
+    column = label_column(horizon, target_roi)
+    if column not in df.columns: df = add_labels(df.copy(), horizon, target_roi)
+    labels = df[column].to_numpy()[start:end]
+    if np.isnan(labels).any(): raise ValueError("標籤缺值: 事先算好的標籤與這段資料對不上")
+    return labels.astype(np.int64)
+
+
+def build_panel(full_data, panel_dir=DEFAULT_PANEL_DIR, extra_meta=None):
+    # full_data: {ticker: 已含指標欄位的 DataFrame}；日期取所有股票的聯集並對齊
+    tickers = sorted(full_data.keys())
+    dates = pd.DatetimeIndex(sorted(set().union(*[df.index for df in full_data.values()])))
+
+    os.makedirs(panel_dir, exist_ok=True)
+    tmp_values = os.path.join(panel_dir, f".{VALUES_FILE}.{os.getpid()}.tmp")
+    values = np.lib.format.open_memmap(tmp_values, mode="w+", dtype=np.float64,
+                                       shape=(len(tickers), len(dates), len(FEATURES)))
+    for j, t in enumerate(tickers):
+        aligned = add_labels(full_data[t], LABEL_HORIZON).reindex(dates)[FEATURES]
+        values[j] = aligned.to_numpy(dtype=np.float64)
+    values.flush()
+    del values
+
+    tmp_dates = os.path.join(panel_dir, f".{DATES_FILE}.{os.getpid()}.tmp.npy")
+    np.save(tmp_dates, dates.asi8)
+
+    meta = {
+        "tickers": tickers,
+        "features": FEATURES,
+        "label_horizon": LABEL_HORIZON,
+        "start": dates[0].strftime("%Y-%m-%d") if len(dates) else None,
+        "end": dates[-1].strftime("%Y-%m-%d") if len(dates) else None,
+        "built_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    if extra_meta: meta.update(extra_meta)
+    tmp_meta = os.path.join(panel_dir, f".{META_FILE}.{os.getpid()}.tmp")
+    with open(tmp_meta, "w") as f:
+        json.dump(meta, f, indent=4)
+
+    # meta 最後才換上，讀取端看到新 meta 時 values/dates 一定已經就緒
+    os.replace(tmp_values, os.path.join(panel_dir, VALUES_FILE))
+    os.replace(tmp_dates, os.path.join(panel_dir, DATES_FILE))
+    os.replace(tmp_meta, os.path.join(panel_dir, META_FILE))
+    return panel_dir
+
+
+def open_panel(panel_dir=None):
+    panel_dir = panel_dir or PANEL_DIR
+    if not panel_dir or not os.path.exists(os.path.join(panel_dir, META_FILE)): return None
+    with open(os.path.join(panel_dir, META_FILE), "r") as f:
+        meta = json.load(f)
+    return {
+        "values": np.load(os.path.join(panel_dir, VALUES_FILE), mmap_mode="r"),
+        "dates": pd.DatetimeIndex(np.load(os.path.join(panel_dir, DATES_FILE))),
+        "tickers": meta["tickers"],
+        "features": meta["features"],
+        "meta": meta,
+    }
+
+
+def panel_frame(panel, ticker):
+    # 每檔股票在 (交易日, 特徵) 維度上是連續記憶體，切片就是 mmap 的 view，不會複製
+    j = panel["tickers"].index(ticker)
+    block = panel["values"][j]
+    valid = ~np.isnan(block[:, 0])
+    if not valid.any(): return None
+    first, last = np.flatnonzero(valid)[[0, -1]]
+    block = block[first:last + 1]
+    dates = panel["dates"][first:last + 1]
+    df = pd.DataFrame(block, index=dates, columns=panel["features"], copy=False)
+    # 中間有缺值 (停牌等) 時才需要複製一份去掉空列，維持與原本下載資料相同的 index
+    if not valid[first:last + 1].all(): df = df[valid[first:last + 1]]
+    return df
+
+
+def load_full_data(tickers, panel_dir=None):
+    # 回傳 {ticker: DataFrame}；沒有設定面板或檔案不存在時回傳 None，呼叫端改走原本的下載流程
+    panel = open_panel(panel_dir)
+    if panel is None: return None
+    full_data = {}
+    for t in tickers:
+        if t not in panel["tickers"]: continue
+        df = panel_frame(panel, t)
+        if df is not None: full_data[t] = df
+    return full_data
+
+
+def build_from_download(tickers, start, end, panel_dir=DEFAULT_PANEL_DIR):
+    print(f"📥 下載 {len(tickers)} 檔數據 ({start} ~ {end})...")
+    raw_data = universe.download_universe(tickers, start, end)
+    full_data = {t: add_technical_indicators(df) for t, df in raw_data.items()}
+
+    build_panel(full_data, panel_dir, extra_meta={"download_start": start})
+    print(f"✅ 特徵面板已建立: {panel_dir} ({len(full_data)} 檔)")
+    return panel_dir
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="建立共享特徵面板")
+    parser.add_argument("--start", default="2022-04-07", help="下載起點 (應與回測的 download_start 一致，指標暖機期才相同)")
+    parser.add_argument("--end", default=datetime.datetime.now().strftime("%Y-%m-%d"))
+    parser.add_argument("--out", default=DEFAULT_PANEL_DIR)
+    parser.add_argument("--universe", default="", help="只建指定股票池 (例如 sp500)，預設為 universe.json 所有固定清單")
+    args = parser.parse_args()
+
+    tickers = universe.get_tickers(args.universe, name=args.universe) + ['QQQ'] if args.universe else PANEL_TICKERS
+    build_from_download(tickers, args.start, args.end, args.out)
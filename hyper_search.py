@@ -0,0 +1,270 @@
+import os
+import json
+import sqlite3
+import hashlib
+import datetime
+import itertools
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import feature_panel
+import scaling
+import walk_forward
+
+# ===========================
+# 🎛️ LSTM 超參數搜尋 (successive halving)
+# ===========================
+# LOOK_BACK / LSTM 單元數 / 訓練 epochs / TARGET_ROI_CLASS 原本是手調常數，每試一組就要整段重跑回測。
+# 這裡用 walk_forward 的切折 (expanding + PREDICT_DAYS 隔離) 評分，分數 = 各股票各折 AUC 的平均。
+# TARGET_ROI_CLASS 只決定訓練標籤: 不同 target_roi 的 AUC 各自對不同標籤算沒辦法比，所以所有組合的測試期
+# 一律對同一個固定標籤 (策略目前的 TARGET_ROI_CLASS) 算 AUC，比的是「誰最會排出真的會漲到目前門檻的日子」。
+#   第 0 輪所有組合只訓練 EPOCH_RUNGS[0] 個 epoch，每輪保留前 1/ETA，存活的組合改用下一個 epochs 重新評分。
+#   壞組合在幾個 epoch 後就被淘汰；epochs 本身也是搜尋維度: 每一輪的 (組合, epochs) 分數都留下來，
+#   最後取全部裡分數最高的一對 (不是只比最後一輪)。目前手調的參數 (模組常數 + 10 epochs) 一定會評分當對照組，
+#   而且也是候選之一，匯出的最佳組合不會比目前設定差。
+# 每一輪的 (組合, 股票, 折) 丟給多個子行程平行訓練；每個折的結果寫進 data/hyper_search.sqlite，
+# 鍵包含策略、組合、epochs 與資料指紋 (每檔最後日期與列數)，資料沒變就不會重算，中斷後重跑只補缺的。
+# 最後用最佳組合在每檔最近的資料上訓練 (與 predict_signal 相同的 500 天視窗)，
+# 透過 model_store 存成快照 <時間>_HPSEARCH (含 config.json / scalers.json)，加 --switch-ref 才會把該策略的 ref
+# (model_store.STRATEGY_REFS，ma30 即掃描器使用的模型) 切到新快照。
+#   python hyper_search.py
+#   python hyper_search.py --strategy ma30 --tickers NVDA,AMD --workers 4 --switch-ref
+SEARCH_SPACE = {
+    "look_back": (30, 60, 90),
+    "units": ((64, 32), (100, 50), (128, 64)),
+    "target_roi": (0.02, 0.03, 0.05),
+}
+EPOCH_RUNGS = (2, 5, 10, 20)   # 各輪的訓練 epochs，包含目前 predict_signal 用的 10
+ETA = 2
+N_FOLDS = 3
+TEST_DAYS = walk_forward.TEST_DAYS
+TRAIN_DAYS = 500    # 匯出模型的訓練視窗，與 prepare_data 的 start_idx 相同
+DB_PATH = os.path.join("data", "hyper_search.sqlite")
+
+
+def grid(space=SEARCH_SPACE):
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+
+def config_name(config):
+    return f"lb{config['look_back']}_u{config['units'][0]}-{config['units'][1]}_roi{config['target_roi']}"
+
+
+def data_key(full_data, tickers):
+    # 資料指紋: 每檔的最後日期與列數；資料更新後舊結果自動失效
+    return ",".join(f"{t}:{full_data[t].index[-1]:%Y-%m-%d}:{len(full_data[t])}" for t in tickers)
+
+
+def trial_key(strategy, config, epochs, fingerprint, n_folds, test_days, eval_roi):
+    payload = json.dumps({"strategy": strategy, "config": config, "epochs": epochs, "data": fingerprint,
+                          "folds": n_folds, "test_days": test_days, "eval_roi": eval_roi, "seed": walk_forward.SEED}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ===========================
+# 結果資料庫
+# ===========================
+def open_db(path=DB_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE IF NOT EXISTS folds (
+        trial TEXT, ticker TEXT, fold INTEGER, strategy TEXT, config TEXT, epochs INTEGER,
+        auc REAL, precision REAL, signals INTEGER, base_rate REAL, n INTEGER, created_at TEXT,
+        PRIMARY KEY (trial, ticker, fold))""")
+    return conn
+
+
+def load_folds(conn, trial):
+    rows = conn.execute("SELECT ticker, fold, auc, precision, signals, base_rate, n FROM folds WHERE trial = ?", (trial,))
+    return {(t, k): {"auc": auc, "precision": p, "signals": s, "base_rate": b, "n": n} for t, k, auc, p, s, b, n in rows}
+
+
+def save_fold(conn, trial, ticker, fold, strategy, config, epochs, m):
+    conn.execute("INSERT OR REPLACE INTO folds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                 (trial, ticker, fold, strategy, json.dumps(config), epochs, m["auc"], m["precision"], m["signals"],
+                  m["base_rate"], m["n"], datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    conn.commit()
+
+
+# ===========================
+# 子行程
+# ===========================
+def _fit_trial(module_name, trial, config, epochs, ticker, fold, prepared, train_rows, test_rows, eval_labels):
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')
+    import tensorflow as tf
+    module = importlib.import_module(module_name)
+    tf.keras.utils.set_random_seed(walk_forward.SEED + fold)
+
+    x_train = walk_forward.scaled_windows(prepared, train_rows, fit_rows=test_rows[0])
+    model = module.build_model((x_train.shape[1], x_train.shape[2]), tuple(config["units"]))
+    model.fit(x_train, prepared["labels"][train_rows], batch_size=32, epochs=epochs, verbose=0)
+    probs = model.predict(walk_forward.scaled_windows(prepared, test_rows), batch_size=256, verbose=0)[:, 0]
+    # 用固定的評分標籤 (不是這組自己的 target_roi)，各組合的 AUC 才能互相比較
+    return trial, ticker, fold, walk_forward.metrics(probs.astype(float), eval_labels, module.BUY_PROB_THRESHOLD)
+
+
+def _fit_final(module_name, config, epochs, ticker, prepared):
+    # 與 predict_signal 相同: 最近 TRAIN_DAYS 天的視窗，縮放參數用整段資料 fit
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')
+    import tensorflow as tf
+    module = importlib.import_module(module_name)
+    tf.keras.utils.set_random_seed(walk_forward.SEED)
+
+    n_rows, look_back = len(prepared["data"]), prepared["look_back"]
+    rows = np.arange(max(look_back, n_rows - TRAIN_DAYS), n_rows - prepared["horizon"])
+    x_train = walk_forward.scaled_windows(prepared, rows, fit_rows=n_rows)
+    model = module.build_model((x_train.shape[1], x_train.shape[2]), tuple(config["units"]))
+    model.fit(x_train, prepared["labels"][rows], batch_size=32, epochs=epochs, verbose=0)
+    return ticker, model, scaling.to_json(scaling.at(prepared["running"], n_rows))
+
+
+# ===========================
+# 搜尋
+# ===========================
+def score(fold_metrics):
+    aucs = [m["auc"] for m in fold_metrics.values() if m["auc"] is not None]
+    return float(np.mean(aucs)) if aucs else float("-inf")
+
+
+def evaluate(conn, pool, strategy, configs, epochs, full_data, tickers, n_folds, test_days, prepared_cache):
+    # 回傳 {組合名稱: {(股票, 折): 指標}}；資料庫已有的折直接讀，其餘平行訓練後寫回
+    module_name = walk_forward.STRATEGY_MODULES[strategy]
+    module = importlib.import_module(module_name)
+    fingerprint = data_key(full_data, tickers)
+    eval_roi = module.TARGET_ROI_CLASS
+    results, tasks = {}, []
+    for config in configs:
+        trial = trial_key(strategy, config, epochs, fingerprint, n_folds, test_days, eval_roi)
+        results[config_name(config)] = done = load_folds(conn, trial)
+        for t in tickers:
+            cache_key = (t, config["look_back"], config["target_roi"])
+            if cache_key not in prepared_cache:
+                prepared_cache[cache_key] = walk_forward.prepare_ticker(full_data[t].copy(), module.FEATURES, config["look_back"],
+                                                                        module.PREDICT_DAYS, config["target_roi"])
+            prepared = prepared_cache[cache_key]
+            if prepared is None: continue
+            label_key = (t, "eval", eval_roi)
+            if label_key not in prepared_cache:
+                df = full_data[t].copy()
+                feature_panel.add_labels(df, module.PREDICT_DAYS, eval_roi)
+                prepared_cache[label_key] = df[feature_panel.label_column(module.PREDICT_DAYS, eval_roi)].to_numpy(dtype=np.float64)
+            eval_labels = prepared_cache[label_key]
+            folds = walk_forward.make_folds(len(prepared["data"]), config["look_back"], module.PREDICT_DAYS, n_folds, test_days)
+            for k, (train_rows, test_rows) in enumerate(folds):
+                if (t, k) in done: continue
+                tasks.append((module_name, trial, config, epochs, t, k, prepared, train_rows, test_rows, eval_labels[test_rows]))
+
+    names = {trial_key(strategy, c, epochs, fingerprint, n_folds, test_days, eval_roi): (config_name(c), c) for c in configs}
+    cached = sum(len(r) for r in results.values())
+    print(f"🎛️ {epochs} epochs: {len(configs)} 組，訓練 {len(tasks)} 個模型 (資料庫已有 {cached} 個)")
+    for trial, ticker, fold, m in pool.map(_fit_trial, *zip(*tasks)) if tasks else []:
+        name, config = names[trial]
+        save_fold(conn, trial, ticker, fold, strategy, config, epochs, m)
+        results[name][(ticker, fold)] = m
+    return results
+
+
+def search(strategy="top3", tickers=None, full_data=None, space=SEARCH_SPACE, epoch_rungs=EPOCH_RUNGS, eta=ETA,
+           n_folds=N_FOLDS, test_days=TEST_DAYS, workers=None, db_path=DB_PATH):
+    module = importlib.import_module(walk_forward.STRATEGY_MODULES[strategy])
+    if full_data is None:
+        full_data = feature_panel.load_full_data(module.TICKERS)
+        if not full_data:
+            download_start = (datetime.datetime.strptime(module.START_DATE, "%Y-%m-%d") - datetime.timedelta(days=1000)).strftime("%Y-%m-%d")
+            full_data, _ = module.download_data(download_start)
+    tickers = [t for t in (tickers or module.TICKERS) if t in full_data]
+
+    configs = grid(space)
+    baseline = {"look_back": module.LOOK_BACK, "units": tuple(module.LSTM_UNITS), "target_roi": module.TARGET_ROI_CLASS}
+    trials = []   # 每一輪每個 (組合, epochs) 的分數
+    conn = open_db(db_path)
+    ctx = multiprocessing.get_context("spawn")   # TensorFlow 不適合 fork
+    try:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=ctx) as pool:
+            prepared_cache = {}
+            for epochs in epoch_rungs:
+                results = evaluate(conn, pool, strategy, configs, epochs, full_data, tickers, n_folds, test_days, prepared_cache)
+                ranked = sorted(((score(results[config_name(c)]), c) for c in configs), key=lambda x: x[0], reverse=True)
+                trials += [{"config": c, "epochs": epochs, "score": v} for v, c in ranked]
+                for v, c in ranked[:5]:
+                    print(f"   {config_name(c):<24} AUC {v:.4f}")
+                configs = [c for _, c in ranked[:max(1, len(ranked) // eta)]]
+            # 對照組 (已經在某一輪算過時直接讀資料庫)
+            results = evaluate(conn, pool, strategy, [baseline], walk_forward.EPOCHS, full_data, tickers, n_folds, test_days, prepared_cache)
+    finally:
+        conn.close()
+
+    # 對照組也是候選: 搜尋沒找到更好的就匯出目前的設定
+    base = {"config": baseline, "epochs": walk_forward.EPOCHS, "score": score(results[config_name(baseline)])}
+    if not any(t["config"] == baseline and t["epochs"] == base["epochs"] for t in trials): trials.append(base)
+    best = max(trials, key=lambda t: t["score"])
+    return {"strategy": strategy, "tickers": tickers, "best": best["config"], "epochs": best["epochs"], "best_score": best["score"],
+            "baseline": base,
+            "trials": sorted(trials, key=lambda t: t["score"], reverse=True), "full_data": full_data}
+
+
+def export_snapshot(result, workers=None, ref=None):
+    # 用最佳組合重新訓練每檔模型，存成 model_store 快照 (config.json 記錄搜尋到的參數)
+    import model_store
+    strategy, config, epochs = result["strategy"], result["best"], result["epochs"]
+    module_name = walk_forward.STRATEGY_MODULES[strategy]
+    module = importlib.import_module(module_name)
+    tasks = []
+    for t in result["tickers"]:
+        prepared = walk_forward.prepare_ticker(result["full_data"][t].copy(), module.FEATURES, config["look_back"],
+                                               module.PREDICT_DAYS, config["target_roi"])
+        if prepared is not None: tasks.append((module_name, config, epochs, t, prepared))
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=ctx) as pool:
+        trained = list(pool.map(_fit_final, *zip(*tasks))) if tasks else []
+    models = {t: model for t, model, _ in trained}
+    scalers = {t: params for t, _, params in trained}
+    snapshot_config = {
+        "LOOK_BACK": config["look_back"],
+        "PREDICT_DAYS": module.PREDICT_DAYS,
+        "MIN_ROI_THRESHOLD": 0,
+        "TICKERS": list(models),
+        "TARGET_ROI_CLASS": config["target_roi"],
+        "LSTM_UNITS": list(config["units"]),
+        "EPOCHS": epochs,
+        "SEARCH": {"strategy": strategy, "score_auc": result["best_score"], "baseline_auc": result["baseline"]["score"],
+                   "eval_roi": module.TARGET_ROI_CLASS,
+                   "generated_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")},
+    }
+    snapshot_id = datetime.datetime.now().strftime("%Y%m%d_%H%M") + "_HPSEARCH"
+    return model_store.save_snapshot(models, snapshot_config, snapshot_id=snapshot_id, ref=ref, scalers=scalers)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import model_store
+
+    parser = argparse.ArgumentParser(description="LSTM 超參數 successive halving 搜尋")
+    parser.add_argument("--strategy", default="top3", choices=list(walk_forward.STRATEGY_MODULES))
+    parser.add_argument("--tickers", default="", help="只用指定股票評分，逗號分隔")
+    parser.add_argument("--folds", type=int, default=N_FOLDS)
+    parser.add_argument("--test-days", type=int, default=TEST_DAYS)
+    parser.add_argument("--epochs", default=",".join(map(str, EPOCH_RUNGS)), help="各輪的訓練 epochs，逗號分隔")
+    parser.add_argument("--eta", type=int, default=ETA, help="每輪保留 1/eta 的組合")
+    parser.add_argument("--workers", type=int, default=0, help="平行訓練的行程數 (預設 CPU 核心數)")
+    parser.add_argument("--switch-ref", action="store_true", help="匯出後把該策略的 ref 指到新快照；預設不切換")
+    parser.add_argument("--no-export", action="store_true", help="只搜尋，不訓練匯出最佳組合")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    result = search(args.strategy, [t for t in args.tickers.split(",") if t] or None, n_folds=args.folds,
+                    test_days=args.test_days, epoch_rungs=[int(e) for e in args.epochs.split(",")], eta=args.eta,
+                    workers=args.workers or None)
+    base = result["baseline"]
+    print(f"🏆 最佳組合: {config_name(result['best'])} ({result['epochs']} epochs)，平均 AUC {result['best_score']:.4f} "
+          f"(目前 {config_name(base['config'])} / {base['epochs']} epochs: {base['score']:.4f})")
+    if not args.no_export:
+        snapshot_dir = export_snapshot(result, args.workers or None,
+                                       model_store.STRATEGY_REFS[args.strategy] if args.switch_ref else None)
+        print(f"💾 已匯出 {snapshot_dir}")
+    print(f"✅ 完成 ({time.perf_counter() - t0:.1f}s)")
@@ -0,0 +1,340 @@
+import os
+import json
+import glob
+import shutil
+import hashlib
+import tempfile
+import datetime
+
+# ===========================
+# 💾 模型快照倉庫 (原子切換 + 內容定址去重)
+# ===========================
+# 目錄結構:
+#   saved_models/objects/<sha256>.keras      -> 實際模型檔 (內容定址，只寫一次)
+#   saved_models/snapshots/<run_id>/          -> 快照 (每個 .keras 都是 objects 的硬連結)
+#   saved_models/refs/<name>                  -> 指標檔，內容是快照名稱 (例如 latest)
+#   snapshots/<run_id>/scalers.json           -> 各模型訓練時的縮放參數 (scaling.to_json)
+#   snapshots/<run_id>/<其他檔>               -> 衍生檔 (例如 quantize.py 的 tflite_<mode>/<ticker>.tflite、quantization.json)，
+#                                                同樣存進 objects 並記在 manifest.json (鍵為相對路徑)
+#
+# 寫入流程: 先寫到 snapshots/.tmp_xxx，完成後 rename 成正式快照，
+# 最後用 os.replace 原子更新 refs/latest。讀取端永遠只會看到完整的快照。
+MODEL_BASE_DIR = "saved_models"
+OBJECTS_DIR = os.path.join(MODEL_BASE_DIR, "objects")
+SNAPSHOTS_DIR = os.path.join(MODEL_BASE_DIR, "snapshots")
+REFS_DIR = os.path.join(MODEL_BASE_DIR, "refs")
+LEGACY_LATEST_DIR = os.path.join(MODEL_BASE_DIR, "latest")
+
+DEFAULT_REF = "latest"
+# 兩個 AI 策略的特徵不同 (Top 3: 5 個，MA30: 6 個含 MA30)，各自有自己的 ref，不會互相覆蓋；
+# 掃描器 (與它的補訓練) 用 MA30 的模型
+STRATEGY_REFS = {"top3": "top3", "ma30": "ma30"}
+SCANNER_REF = STRATEGY_REFS["ma30"]
+MANIFEST_FILE = "manifest.json"
+SCALERS_FILE = "scalers.json"
+# 每次執行都會自動產生的快照 (AI 實驗室、掃描器補訓練)；gc 時每種只保留最新幾份，其餘快照 (回測 run_id 等) 不動
+AUTO_SNAPSHOT_PREFIXES = ("engine_", "lazy_")
+KEEP_AUTO_SNAPSHOTS = 5
+
+
+def _ensure_dirs():
+    for d in (OBJECTS_DIR, SNAPSHOTS_DIR, REFS_DIR):
+        os.makedirs(d, exist_ok=True)
+
+
+def model_digest(model):
+    # 只對「架構 + 權重」做雜湊；.keras 檔內含存檔時間，直接 hash 檔案會導致永遠不相等
+    h = hashlib.sha256()
+    h.update(model.to_json().encode("utf-8"))
+    for w in model.get_weights():
+        h.update(str(w.dtype).encode("utf-8"))
+        h.update(str(w.shape).encode("utf-8"))
+        h.update(w.tobytes())
+    return h.hexdigest()
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _link_or_copy(src, dst):
+    # 硬連結失敗 (跨磁碟 / 不支援的檔案系統) 時退回複製
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _store_model(model, digest):
+    obj_path = os.path.join(OBJECTS_DIR, f"{digest}.keras")
+    if os.path.exists(obj_path): return obj_path, False
+
+    # Keras 要求副檔名是 .keras，所以暫存檔也保留這個副檔名
+    tmp_path = os.path.join(OBJECTS_DIR, f".{digest}.{os.getpid()}.tmp.keras")
+    model.save(tmp_path)
+    os.replace(tmp_path, obj_path)
+    return obj_path, True
+
+
+def _store_file(path, digest, ext=".keras"):
+    obj_path = os.path.join(OBJECTS_DIR, f"{digest}{ext}")
+    if os.path.exists(obj_path): return obj_path, False
+
+    tmp_path = os.path.join(OBJECTS_DIR, f".{digest}.{os.getpid()}.tmp{ext}")
+    shutil.copy2(path, tmp_path)
+    os.replace(tmp_path, obj_path)
+    return obj_path, True
+
+
+def _write_json_atomic(path, obj, indent=4):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _commit_snapshot(tmp_dir, snapshot_id):
+    final_dir = os.path.join(SNAPSHOTS_DIR, snapshot_id)
+    suffix = 1
+    while os.path.exists(final_dir):
+        final_dir = os.path.join(SNAPSHOTS_DIR, f"{snapshot_id}_{suffix}")
+        suffix += 1
+    os.rename(tmp_dir, final_dir)
+    return final_dir
+
+
+def update_ref(snapshot_id, ref=DEFAULT_REF):
+    _ensure_dirs()
+    ref_path = os.path.join(REFS_DIR, ref)
+    tmp_path = f"{ref_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(snapshot_id + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, ref_path)
+
+
+def load_scalers(snapshot_dir):
+    # 回傳 {ticker: 縮放參數}；舊快照沒有 scalers.json 時回傳 {}
+    import scaling
+    path = os.path.join(snapshot_dir, SCALERS_FILE)
+    if not os.path.exists(path): return {}
+    with open(path, "r") as f:
+        return {t: scaling.from_json(params) for t, params in json.load(f).items()}
+
+
+def artifact_files(snapshot_dir):
+    # 快照裡模型 / 設定 / manifest / 縮放參數以外的檔案 (相對路徑)
+    core = {"config.json", MANIFEST_FILE, SCALERS_FILE}
+    files = []
+    for root, _, names in os.walk(snapshot_dir):
+        for name in names:
+            rel = os.path.relpath(os.path.join(root, name), snapshot_dir)
+            if rel in core or (rel == name and name.endswith(".keras")): continue
+            files.append(rel)
+    return sorted(files)
+
+
+def save_snapshot(models, config, snapshot_id=None, ref=DEFAULT_REF, base_dir=None, scalers=None, artifacts=None):
+    # models: {ticker: keras model}；scalers: {ticker: scaling.to_json(...)}
+    # base_dir: 以既有快照為底，沒有被 models 覆蓋的股票直接硬連結沿用 (縮放參數、衍生檔也一起沿用)；
+    #   子資料夾裡以股票命名的衍生檔 (例如 tflite_dynamic/NVDA.tflite) 是由舊模型轉出來的，該股票重新訓練時會捨棄
+    # artifacts: {相對路徑: 來源檔}，存進 objects 後連結到快照 (同路徑會取代 base_dir 的版本)
+    _ensure_dirs()
+    if snapshot_id is None:
+        snapshot_id = datetime.datetime.now().strftime("%Y%m%d_%H%M")
+
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=SNAPSHOTS_DIR)
+    manifest = {}
+    scaler_params = {}
+    dropped = []
+    written, reused = 0, 0
+    try:
+        if base_dir:
+            base_manifest = {}
+            if os.path.exists(os.path.join(base_dir, MANIFEST_FILE)):
+                with open(os.path.join(base_dir, MANIFEST_FILE), "r") as f:
+                    base_manifest = json.load(f)
+            for model_file in glob.glob(os.path.join(base_dir, "*.keras")):
+                ticker = os.path.splitext(os.path.basename(model_file))[0]
+                if ticker in models: continue
+                _link_or_copy(model_file, os.path.join(tmp_dir, f"{ticker}.keras"))
+                manifest[ticker] = base_manifest.get(ticker, file_digest(model_file))
+                reused += 1
+            if os.path.exists(os.path.join(base_dir, SCALERS_FILE)):
+                with open(os.path.join(base_dir, SCALERS_FILE), "r") as f:
+                    scaler_params = {t: v for t, v in json.load(f).items() if t not in models}
+            for rel in artifact_files(base_dir):
+                if rel in (artifacts or {}): continue
+                if os.path.dirname(rel) and os.path.splitext(os.path.basename(rel))[0] in models:
+                    dropped.append(rel)
+                    continue
+                os.makedirs(os.path.dirname(os.path.join(tmp_dir, rel)), exist_ok=True)
+                _link_or_copy(os.path.join(base_dir, rel), os.path.join(tmp_dir, rel))
+                manifest[rel] = base_manifest.get(rel) or file_digest(os.path.join(base_dir, rel))
+        scaler_params.update(scalers or {})
+
+        for rel, src in (artifacts or {}).items():
+            digest = file_digest(src)
+            obj_path, _ = _store_file(src, digest, os.path.splitext(rel)[1])
+            os.makedirs(os.path.dirname(os.path.join(tmp_dir, rel)), exist_ok=True)
+            _link_or_copy(obj_path, os.path.join(tmp_dir, rel))
+            manifest[rel] = digest
+
+        for ticker, model in models.items():
+            digest = model_digest(model)
+            obj_path, is_new = _store_model(model, digest)
+            _link_or_copy(obj_path, os.path.join(tmp_dir, f"{ticker}.keras"))
+            manifest[ticker] = digest
+            if is_new: written += 1
+            else: reused += 1
+
+        with open(os.path.join(tmp_dir, "config.json"), "w") as f:
+            json.dump(config, f, indent=4)
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=4)
+        if scaler_params:
+            with open(os.path.join(tmp_dir, SCALERS_FILE), "w") as f:
+                json.dump(scaler_params, f)
+
+        final_dir = _commit_snapshot(tmp_dir, snapshot_id)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    if ref: update_ref(os.path.basename(final_dir), ref)
+    print(f"💾 快照 {os.path.basename(final_dir)}: 新寫入 {written} 個模型，沿用 {reused} 個 (硬連結)")
+    if dropped:
+        print(f"⚠️ 捨棄 {len(dropped)} 個由舊模型轉出的衍生檔 (例如量化模型)，這些股票改用新的 .keras 推論: {dropped[:5]}")
+    return final_dir
+
+
+def resolve_ref(ref=DEFAULT_REF):
+    # O(1): 只讀一個指標檔，不需要掃描整個資料夾
+    ref_path = os.path.join(REFS_DIR, ref)
+    try:
+        with open(ref_path, "r") as f:
+            snapshot_id = f.read().strip()
+    except OSError:
+        return None
+    snapshot_dir = os.path.join(SNAPSHOTS_DIR, snapshot_id)
+    return snapshot_dir if os.path.isdir(snapshot_dir) else None
+
+
+def find_latest_model_dir(ref=DEFAULT_REF):
+    snapshot_dir = resolve_ref(ref)
+    if snapshot_dir: return snapshot_dir
+
+    # 舊版相容: 還沒有快照時，沿用 saved_models/latest 或最新的時間戳資料夾
+    if ref == DEFAULT_REF and os.path.exists(LEGACY_LATEST_DIR): return LEGACY_LATEST_DIR
+    dirs = [d for d in glob.glob(os.path.join(MODEL_BASE_DIR, "*"))
+            if os.path.isdir(d) and os.path.basename(d) not in ("objects", "snapshots", "refs")]
+    if not dirs: return None
+    return max(dirs, key=os.path.getmtime)
+
+
+def import_legacy_dir(path, snapshot_id=None, ref=None):
+    # 把舊的整份複製資料夾 (例如 20260212_0006_STRICT) 轉成快照，重複的模型只保留一份
+    # 用 model_digest (架構 + 權重) 去重；同樣的權重各自存檔後檔案雜湊不會相同
+    from tensorflow.keras.models import load_model
+    _ensure_dirs()
+    snapshot_id = snapshot_id or os.path.basename(os.path.normpath(path))
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=SNAPSHOTS_DIR)
+    manifest = {}
+    try:
+        for model_file in sorted(glob.glob(os.path.join(path, "*.keras"))):
+            ticker = os.path.splitext(os.path.basename(model_file))[0]
+            digest = model_digest(load_model(model_file, compile=False))
+            obj_path, _ = _store_file(model_file, digest)
+            _link_or_copy(obj_path, os.path.join(tmp_dir, f"{ticker}.keras"))
+            manifest[ticker] = digest
+        config_path = os.path.join(path, "config.json")
+        if os.path.exists(config_path): shutil.copy2(config_path, os.path.join(tmp_dir, "config.json"))
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=4)
+        final_dir = _commit_snapshot(tmp_dir, snapshot_id)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    if ref: update_ref(os.path.basename(final_dir), ref)
+    return final_dir
+
+
+def gc_objects():
+    # 硬連結計數 == 1 代表沒有任何快照再引用這個物件 (模型或衍生檔)，可以安全刪除
+    removed = 0
+    for obj_path in glob.glob(os.path.join(OBJECTS_DIR, "*.*")):
+        if os.stat(obj_path).st_nlink <= 1:
+            os.remove(obj_path)
+            removed += 1
+    return removed
+
+
+def referenced_snapshots():
+    referenced = set()
+    for ref_path in glob.glob(os.path.join(REFS_DIR, "*")):
+        with open(ref_path, "r") as f:
+            referenced.add(f.read().strip())
+    return referenced
+
+
+def refs_for(snapshot_id):
+    # 目前指到這個快照的 ref 名稱
+    refs = []
+    for ref_path in sorted(glob.glob(os.path.join(REFS_DIR, "*"))):
+        with open(ref_path, "r") as f:
+            if f.read().strip() == snapshot_id: refs.append(os.path.basename(ref_path))
+    return refs
+
+
+def gc(keep=KEEP_AUTO_SNAPSHOTS):
+    # 自動快照每種前綴只留最新 keep 份 (被 ref 指到的一律保留)，再清掉不再被任何快照引用的物件
+    referenced = referenced_snapshots()
+    removed_snapshots = 0
+    for prefix in AUTO_SNAPSHOT_PREFIXES:
+        snaps = sorted((d for d in glob.glob(os.path.join(SNAPSHOTS_DIR, f"{prefix}*")) if os.path.isdir(d)),
+                       key=os.path.getmtime, reverse=True)
+        for d in snaps[keep:]:
+            if os.path.basename(d) in referenced: continue
+            shutil.rmtree(d, ignore_errors=True)
+            removed_snapshots += 1
+    return removed_snapshots, gc_objects()
+
+
+def remove_snapshot(snapshot_id):
+    for ref_path in glob.glob(os.path.join(REFS_DIR, "*")):
+        with open(ref_path, "r") as f:
+            if f.read().strip() == snapshot_id:
+                print(f"⚠️ 快照 {snapshot_id} 仍被 {os.path.basename(ref_path)} 引用，略過刪除。")
+                return False
+    shutil.rmtree(os.path.join(SNAPSHOTS_DIR, snapshot_id), ignore_errors=True)
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="模型快照倉庫工具")
+    parser.add_argument("--import-legacy", action="store_true", help="把 saved_models 下的舊資料夾轉成去重快照")
+    parser.add_argument("--gc", action="store_true", help="清除舊的自動快照與沒有被任何快照引用的模型物件")
+    parser.add_argument("--keep", type=int, default=KEEP_AUTO_SNAPSHOTS, help="每種自動快照保留幾份")
+    args = parser.parse_args()
+
+    if args.import_legacy:
+        for d in sorted(glob.glob(os.path.join(MODEL_BASE_DIR, "*"))):
+            name = os.path.basename(d)
+            if not os.path.isdir(d) or name in ("objects", "snapshots", "refs"): continue
+            ref = DEFAULT_REF if name == "latest" else None
+            snap = import_legacy_dir(d, ref=ref)
+            print(f"📦 {name} -> {snap}")
+    if args.gc:
+        snapshots, objects = gc(args.keep)
+        print(f"🧹 已清除 {snapshots} 個舊的自動快照、{objects} 個未引用的模型物件")
+    print(f"🔗 目前 latest -> {find_latest_model_dir()}")
@@ -0,0 +1,299 @@
+import os
+import ast
+import sys
+import glob
+import json
+import time
+import hashlib
+import datetime
+import importlib
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# ===========================
+# 🗓️ 每日流程排程 (DAG + 內容雜湊快取)
+# ===========================
+# 一個指令跑完整個每日流程:
+#   fetch (下載 + 指標 -> 共享特徵面板) ─┬─> backtest_ai ────┐
+#                                       └─> backtest_ma30 ──┴─> scan ─┐
+#   vulture (禿鷹回測，自己下載較長的歷史) ─────────────────────────────┼─> publish -> notify
+#   engine (AI 實驗室預測) ─────────────────────────────────────────────┤
+#   robustness (vulture + 兩個 AI 回測之後，蒙地卡羅穩健度) ──────────────┘
+#
+# 每個階段的快取鍵 = 程式碼 + 設定檔內容 + 參數 (例如今天日期) + 上游輸出的雜湊。
+# 程式碼不是手寫清單: 從 calls 的入口模組沿著 import (含函式內的 import) 找出所有本專案的 .py，
+# 再加上這些模組讀取的設定檔 (DATA_FILES)，新增模組不必記得回來更新這裡。
+# 鍵沒變、輸出檔也沒被動過就直接略過；彼此無依賴的階段用多個行程同時跑。
+# 各階段耗時寫進 data/meta.json，輸出記錄在 data/pipeline_logs/<stage>.log。
+#
+#   python pipeline.py                              # 全部
+#   python pipeline.py --stages vulture,scan        # 只跑指定階段 (其餘視為沿用現有輸出)
+#   python pipeline.py --force --jobs 3 --dry-run
+DATA_DIR = "data"
+CACHE_FILE = os.path.join(DATA_DIR, "pipeline_cache.json")
+LOG_DIR = os.path.join(DATA_DIR, "pipeline_logs")
+PANEL_DIR = os.path.join(DATA_DIR, "feature_panel")
+PANEL_START = "2022-04-07"   # 與 AI 回測的 download_start (START_DATE - 1000 天) 一致，指標暖機期才相同
+
+TODAY = datetime.date.today().isoformat()
+
+# calls: 在子行程依序執行的 "module:function"；env: 子行程 import 前要設好的環境變數
+# always: 每次都跑 (不看快取)；sources: (選用) import 分析看不到的額外輸入檔
+STAGES = {
+    "fetch": {
+        "deps": [],
+        "calls": ["pipeline:build_panel"],
+        "params": {"date": TODAY, "start": PANEL_START},
+        "outputs": [os.path.join(PANEL_DIR, "*")],
+    },
+    "vulture": {
+        "deps": [],
+        "calls": ["run_backtest:download_data", "run_backtest:run_all_periods", "rolling_study:run_study"],
+        "params": {"date": TODAY},
+        "outputs": [os.path.join(DATA_DIR, "*vulture_*_log.csv"), os.path.join(DATA_DIR, "*vulture_*_balance.csv"),
+                    os.path.join(DATA_DIR, "vulture_rolling_study.json")],
+    },
+    "backtest_ai": {
+        "deps": ["fetch"],
+        "calls": ["ai_backtest_2:run_backtest"],
+        "env": {"FEATURE_PANEL": PANEL_DIR},
+        "params": {},
+        "outputs": [os.path.join(DATA_DIR, "ai_backtest_log.csv"), os.path.join(DATA_DIR, "ai_backtest_balance.csv")],
+    },
+    "backtest_ma30": {
+        "deps": ["fetch"],
+        "calls": ["ai_backtest_ma30_2:run_backtest"],
+        "env": {"FEATURE_PANEL": PANEL_DIR},
+        "params": {},
+        "outputs": [os.path.join(DATA_DIR, "ai_backtest_ma30_log.csv"), os.path.join(DATA_DIR, "ai_backtest_ma30_balance.csv")],
+    },
+    "scan": {
+        "deps": ["backtest_ai", "backtest_ma30"],
+        "calls": ["ai_market_scanner:scan_market"],
+        "params": {"date": TODAY},
+        "outputs": [os.path.join(DATA_DIR, "latest_signals.json"), os.path.join("saved_models", "refs", "ma30")],
+    },
+    "engine": {
+        "deps": [],
+        "calls": ["ai_engine:run_ai_analysis"],
+        "params": {"date": TODAY},
+        "outputs": [os.path.join(DATA_DIR, "ai_lab_result.json")],
+    },
+    "robustness": {
+        "deps": ["vulture", "backtest_ai", "backtest_ma30"],
+        "calls": ["robustness:run_all"],
+        "params": {},
+        "outputs": [os.path.join(DATA_DIR, "*_robustness.json")],
+    },
+    "publish": {
+        "deps": ["vulture", "scan", "engine", "robustness"],
+        "calls": ["pipeline:publish"],
+        "params": {},
+        "outputs": [],
+        "always": True,
+    },
+    "notify": {
+        "deps": ["publish"],
+        "calls": ["run_backtest:notify"],
+        # 交易紀錄沒變就不重寄
+        "params": {"date": TODAY},
+        "inputs": [os.path.join(DATA_DIR, "vulture_log.csv"), os.path.join(DATA_DIR, "super_vulture_2025_now_log.csv")],
+        "outputs": [],
+    },
+}
+
+
+def build_panel():
+    import feature_panel
+    return feature_panel.build_from_download(feature_panel.PANEL_TICKERS, PANEL_START, TODAY, PANEL_DIR)
+
+
+def publish():
+    # 把各回測的事件日誌併進 CSV / Parquet，儀表板和 git 看到的都是完整檔案
+    # 順便清理模型倉庫: ai_engine / 掃描器每次都會寫新快照，不清的話 saved_models/ 會一直長大
+    import event_log
+    import model_store
+    print(f"✅ 已壓縮 {event_log.compact_dir(DATA_DIR)} 個檔案")
+    snapshots, objects = model_store.gc()
+    print(f"🧹 已清除 {snapshots} 個舊的自動快照、{objects} 個未引用的模型物件")
+
+
+# 模組在執行時讀取的設定檔 (import 分析看不到)
+DATA_FILES = {"universe": ["universe.json"]}
+
+
+# ===========================
+# 雜湊
+# ===========================
+def local_imports(module, seen=None):
+    # 入口模組 + 它遞迴 import 的所有本專案頂層模組 (只看 repo 根目錄下的 .py)
+    seen = set() if seen is None else seen
+    path = f"{module}.py"
+    if module in seen or not os.path.isfile(path): return seen
+    seen.add(module)
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import): names = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module: names = [node.module]
+        else: continue
+        for name in names: local_imports(name.split(".")[0], seen)
+    return seen
+
+
+def stage_sources(name):
+    spec = STAGES[name]
+    modules = set()
+    for call in spec["calls"]:
+        local_imports(call.split(":")[0], modules)
+    files = [f"{m}.py" for m in sorted(modules)]
+    files += [f for m in sorted(modules) for f in DATA_FILES.get(m, [])]
+    return files + spec.get("sources", [])
+
+
+def hash_files(patterns):
+    h = hashlib.sha256()
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            if not os.path.isfile(path) or path.endswith((".lock", ".tmp")): continue
+            h.update(path.encode("utf-8"))
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+    return h.hexdigest()
+
+
+def stage_key(name, output_hashes):
+    spec = STAGES[name]
+    h = hashlib.sha256()
+    h.update(name.encode("utf-8"))
+    h.update(hash_files(stage_sources(name) + spec.get("inputs", [])).encode("utf-8"))
+    h.update(json.dumps(spec["params"], sort_keys=True).encode("utf-8"))
+    h.update(json.dumps(spec.get("env", {}), sort_keys=True).encode("utf-8"))
+    for dep in spec["deps"]:
+        h.update(f"{dep}={output_hashes.get(dep, '')}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def load_cache():
+    try:
+        with open(CACHE_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache):
+    tmp_path = f"{CACHE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=4)
+    os.replace(tmp_path, CACHE_FILE)
+
+
+# ===========================
+# 執行
+# ===========================
+def run_stage(name):
+    # 在子行程執行: 先設環境變數再 import，輸出導到各階段自己的 log
+    spec = STAGES[name]
+    os.environ.update(spec.get("env", {}))
+    os.makedirs(LOG_DIR, exist_ok=True)
+    t0 = time.perf_counter()
+    with open(os.path.join(LOG_DIR, f"{name}.log"), "w") as log:
+        sys.stdout = sys.stderr = log
+        try:
+            for call in spec["calls"]:
+                module_name, fn_name = call.split(":")
+                module = importlib.import_module(module_name)
+                getattr(module, fn_name)()
+            ok = True
+        except Exception:
+            traceback.print_exc()
+            ok = False
+        finally:
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+    return ok, round(time.perf_counter() - t0, 2)
+
+
+def run_pipeline(selected, force=False, jobs=2, dry_run=False):
+    import run_backtest
+
+    cache = load_cache()
+    # 沒選到的階段沿用現有輸出 (雜湊現況)，下游照樣能判斷要不要重跑
+    output_hashes = {name: hash_files(STAGES[name]["outputs"]) for name in STAGES if name not in selected}
+    status = {}
+    pending = [name for name in STAGES if name in selected]
+    running = {}
+
+    ctx = multiprocessing.get_context("spawn")   # TensorFlow 不適合 fork
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as pool:
+        while pending or running:
+            for name in list(pending):
+                deps = [d for d in STAGES[name]["deps"] if d in selected]
+                if any(status.get(d, {}).get("status") in ("failed", "skipped") for d in deps):
+                    status[name] = {"status": "skipped", "seconds": 0.0}
+                    pending.remove(name)
+                    print(f"⏭️ {name}: 上游失敗，略過")
+                    continue
+                if not all(d in status for d in deps): continue
+                pending.remove(name)
+
+                spec = STAGES[name]
+                key = stage_key(name, output_hashes)
+                cached = cache.get(name, {})
+                outputs_intact = cached.get("outputs") == hash_files(spec["outputs"])
+                if not force and not spec.get("always") and cached.get("key") == key and outputs_intact:
+                    status[name] = {"status": "cached", "seconds": 0.0}
+                    output_hashes[name] = cached["outputs"]
+                    print(f"♻️ {name}: 輸入沒變，沿用快取")
+                    continue
+                if dry_run:
+                    status[name] = {"status": "would_run", "seconds": 0.0}
+                    output_hashes[name] = ""
+                    print(f"📝 {name}: 會執行")
+                    continue
+
+                print(f"▶️ {name}: 開始")
+                running[pool.submit(run_stage, name)] = (name, key)
+
+            if not running: continue
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name, key = running.pop(future)
+                try:
+                    ok, seconds = future.result()
+                except Exception as e:
+                    ok, seconds = False, 0.0
+                    print(f"❌ {name}: 子行程異常 ({e})")
+                status[name] = {"status": "ran" if ok else "failed", "seconds": seconds}
+                if ok:
+                    output_hashes[name] = hash_files(STAGES[name]["outputs"])
+                    cache[name] = {"key": key, "outputs": output_hashes[name], "finished": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+                    save_cache(cache)
+                    print(f"✅ {name}: 完成 ({seconds:.1f}s)")
+                else:
+                    print(f"❌ {name}: 失敗，詳見 {os.path.join(LOG_DIR, name + '.log')}")
+
+    if not dry_run: run_backtest.write_meta(status)
+    return status
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="每日流程排程")
+    parser.add_argument("--stages", default="", help=f"只跑指定階段，逗號分隔 (可選: {','.join(STAGES)})")
+    parser.add_argument("--force", action="store_true", help="忽略快取，全部重跑")
+    parser.add_argument("--jobs", type=int, default=2, help="同時執行的階段數")
+    parser.add_argument("--dry-run", action="store_true", help="只列出會執行的階段")
+    args = parser.parse_args()
+
+    selected = [s for s in args.stages.split(",") if s] or list(STAGES)
+    unknown = [s for s in selected if s not in STAGES]
+    if unknown:
+        print(f"❌ 未知的階段: {unknown}")
+        sys.exit(2)
+
+    status = run_pipeline(selected, force=args.force, jobs=args.jobs, dry_run=args.dry_run)
+    if any(s["status"] == "failed" for s in status.values()): sys.exit(1)
@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import time
+import datetime
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+# ===========================
+# ⏱️ 熱點計時 (輕量 instrumentation)
+# ===========================
+# 開啟方式: 環境變數 PROFILE=1 或命令列加 --profile
+#   PROFILE_TOOL=cprofile     -> 另外輸出 cProfile 結果 (*.prof，可用 snakeviz 看)
+#   PROFILE_TOOL=pyinstrument -> 另外輸出 pyinstrument HTML (需自行安裝)
+# 關閉時 timer() 幾乎零成本，可以放心留在熱路徑上。
+_enabled = False
+_timings = defaultdict(list)
+_counters = defaultdict(int)
+_lap_marks = {}
+_started_at = None
+_tool = None
+
+
+def enable(tool=None):
+    global _enabled, _started_at, _tool
+    if _enabled: return
+    _enabled = True
+    _started_at = time.perf_counter()
+    tool = tool or os.environ.get("PROFILE_TOOL", "")
+    if tool == "cprofile":
+        import cProfile
+        _tool = ("cprofile", cProfile.Profile())
+        _tool[1].enable()
+    elif tool == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+            _tool = ("pyinstrument", Profiler())
+            _tool[1].start()
+        except ImportError:
+            print("⚠️ 未安裝 pyinstrument，只輸出階段計時。")
+
+
+def enable_from_env(argv=None):
+    argv = sys.argv if argv is None else argv
+    if os.environ.get("PROFILE", "0") == "1" or "--profile" in argv: enable()
+    return _enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+@contextmanager
+def timer(stage):
+    if not _enabled:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings[stage].append(time.perf_counter() - t0)
+
+
+def lap(stage, last=False):
+    # 給迴圈用: 每圈開頭呼叫一次，記錄與上一圈的間隔；迴圈結束後用 last=True 收尾
+    if not _enabled: return
+    now = time.perf_counter()
+    prev = _lap_marks.pop(stage, None)
+    if prev is not None: _timings[stage].append(now - prev)
+    if not last: _lap_marks[stage] = now
+
+
+def count(name, n=1):
+    if _enabled: _counters[name] += n
+
+
+def summary():
+    stages = {}
+    for stage, samples in _timings.items():
+        arr = np.asarray(samples)
+        stages[stage] = {
+            "total_sec": round(float(arr.sum()), 4),
+            "calls": int(len(arr)),
+            "mean_ms": round(float(arr.mean()) * 1000, 3),
+            "p50_ms": round(float(np.percentile(arr, 50)) * 1000, 3),
+            "p99_ms": round(float(np.percentile(arr, 99)) * 1000, 3),
+        }
+    wall = time.perf_counter() - _started_at if _started_at else 0.0
+    return {
+        "generated_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "wall_sec": round(wall, 4),
+        # 階段之間可能巢狀 (例如 day_loop 包含 model.fit)，total_sec 是含子階段的時間
+        "stages": dict(sorted(stages.items(), key=lambda kv: -kv[1]["total_sec"])),
+        "counters": dict(_counters),
+    }
+
+
+def write_report(path):
+    if not _enabled: return None
+    report = summary()
+    with open(path, "w") as f:
+        json.dump(report, f, indent=4)
+
+    base = os.path.splitext(path)[0]
+    if _tool and _tool[0] == "cprofile":
+        _tool[1].disable()
+        _tool[1].dump_stats(f"{base}.prof")
+    elif _tool and _tool[0] == "pyinstrument":
+        _tool[1].stop()
+        with open(f"{base}.html", "w") as f:
+            f.write(_tool[1].output_html())
+
+    print(f"\n⏱️ 效能剖析已輸出: {path} (總耗時 {report['wall_sec']:.1f}s)")
+    for stage, s in list(report["stages"].items())[:8]:
+        print(f"   {stage:<16} {s['total_sec']:>9.2f}s  x{s['calls']:<6} p50 {s['p50_ms']:.1f}ms  p99 {s['p99_ms']:.1f}ms")
+    return report
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import shutil
+import datetime
+import tempfile
+import numpy as np
+
+# ===========================
+# 🗜️ 量化推論 (TFLite dynamic-range / float16 / int8)
+# ===========================
+# 把快照裡的 .keras 轉成 TFLite (先寫在暫存資料夾)，再用歷史日期比對 float32 與量化版的勝率和掃描器選股。
+# 已提交的快照不再被改動: tflite_<mode>/ 與報告 quantization.json 透過 model_store 存成以原快照為底的新快照
+# <原快照>_<mode> (模型硬連結沿用，manifest 會記錄這些檔案)，之後 save_snapshot(base_dir=...) 也會一起帶著走。
+# 只有加 --enable 且兩個策略的選股完全沒變時才會啟用；原本指到原快照的 ref (例如 ma30) 會切到新快照，
+# 掃描器 / ai_predict 讀到啟用的快照才改走 TFLite。
+#
+#   python quantize.py --mode dynamic --days 20            # 只產生報告
+#   python quantize.py --mode dynamic --days 20 --enable   # 選股沒變就啟用
+#   INFERENCE=float32 python ai_market_scanner.py           # 臨時強制用原本的模型
+MODES = ("dynamic", "float16", "int8")
+QUANT_FILE = "quantization.json"
+FORCE_FLOAT = os.environ.get("INFERENCE", "") == "float32"
+CALIBRATION_WINDOWS = 100   # int8 校正激活範圍用的代表性輸入數
+LATENCY_SAMPLES = 20
+
+
+def tflite_dir(snapshot_dir, mode):
+    return os.path.join(snapshot_dir, f"tflite_{mode}")
+
+
+def read_settings(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, QUANT_FILE), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# ===========================
+# 轉換
+# ===========================
+def _unrolled(model):
+    # TFLite 轉不了 LSTM 在 while 迴圈裡讀變數的寫法: 改成展開版 (權重相同、輸出一致) 再匯出
+    from tensorflow.keras.models import Sequential
+    config = model.get_config()
+    for layer in config["layers"]:
+        if layer["class_name"] in ("LSTM", "GRU", "SimpleRNN"): layer["config"]["unroll"] = True
+    unrolled = Sequential.from_config(config)
+    unrolled.set_weights(model.get_weights())
+    return unrolled
+
+
+def convert(model, mode, representative=None):
+    # representative: int8 用的 (N, look_back, F) 輸入樣本
+    import tensorflow as tf
+    shape = [1] + list(model.input_shape[1:])
+    export_dir = tempfile.mkdtemp(prefix=".tflite_export_")
+    try:
+        _unrolled(model).export(export_dir, format="tf_saved_model",
+                                input_signature=[tf.TensorSpec(shape, tf.float32)], verbose=False)
+        converter = tf.lite.TFLiteConverter.from_saved_model(export_dir)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        if mode == "float16":
+            converter.target_spec.supported_types = [tf.float16]
+        elif mode == "int8":
+            if representative is None: raise ValueError("int8 量化需要代表性輸入")
+            samples = np.asarray(representative, dtype=np.float32)[-CALIBRATION_WINDOWS:]
+            converter.representative_dataset = lambda: ([x[np.newaxis]] for x in samples)
+        return converter.convert()
+    finally:
+        shutil.rmtree(export_dir, ignore_errors=True)
+
+
+def quantize_snapshot(snapshot_dir, work_dir, mode, tickers, representative=None):
+    # 轉好的檔案寫到 work_dir/tflite_<mode>/ (不動已提交的快照)；representative: {ticker: 輸入樣本}，只有 int8 需要
+    from tensorflow.keras.models import load_model
+    out_dir = tflite_dir(work_dir, mode)
+    os.makedirs(out_dir, exist_ok=True)
+    for t in tickers:
+        model = load_model(os.path.join(snapshot_dir, f"{t}.keras"), compile=False)
+        data = convert(model, mode, (representative or {}).get(t))
+        path = os.path.join(out_dir, f"{t}.tflite")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return out_dir
+
+
+# ===========================
+# 推論
+# ===========================
+def _tflite_predictor(path):
+    import tensorflow as tf
+    interpreter = tf.lite.Interpreter(model_path=path)
+    interpreter.allocate_tensors()
+    input_index = interpreter.get_input_details()[0]["index"]
+    output_index = interpreter.get_output_details()[0]["index"]
+
+    def predict(x):
+        # 轉出來的模型 batch 固定為 1，逐筆 invoke (單筆延遲遠低於 Keras predict)
+        probs = []
+        for row in np.asarray(x, dtype=np.float32):
+            interpreter.set_tensor(input_index, row[np.newaxis])
+            interpreter.invoke()
+            probs.append(float(interpreter.get_tensor(output_index)[0, 0]))
+        return np.array(probs)
+    return predict
+
+
+def _keras_predictor(path):
+    from tensorflow.keras.models import load_model
+    model = load_model(path, compile=False)
+    return lambda x: model.predict(x, verbose=0)[:, 0]
+
+
+def load_predictor(model_dir, ticker, mode=None):
+    # 回傳 predict(x) -> 每筆輸入的勝率陣列
+    # mode=None 時看快照設定: 啟用量化且有轉好的檔案才用 TFLite，否則用原本的 .keras
+    if mode is None:
+        settings = read_settings(model_dir)
+        mode = settings.get("mode") if settings.get("enabled") and not FORCE_FLOAT else "float32"
+    path = os.path.join(tflite_dir(model_dir, mode), f"{ticker}.tflite")
+    if mode != "float32" and os.path.exists(path): return _tflite_predictor(path)
+    return _keras_predictor(os.path.join(model_dir, f"{ticker}.keras"))
+
+
+# ===========================
+# 對照報告
+# ===========================
+def load_history(tickers, days):
+    # 有共享特徵面板就用面板，否則下載後算指標 (與掃描器相同的欄位)
+    import feature_panel
+    import universe
+    import ai_market_scanner as scanner
+    full_data = feature_panel.load_full_data(tickers)
+    if full_data: return full_data
+    start = (datetime.datetime.now() - datetime.timedelta(days=days + 400)).strftime("%Y-%m-%d")
+    raw_data = universe.download_universe(tickers, start, auto_adjust=True)
+    return {t: scanner.add_technical_indicators(df) for t, df in raw_data.items()}
+
+
+def compare(snapshot_dir, work_dir, mode, full_data, days, look_back):
+    # 最近 days 個交易日，每天用當天以前的資料跑一次掃描器的判斷，比較 float32 與量化版
+    import model_store
+    import ranking
+    import ai_market_scanner as scanner
+    scalers = model_store.load_scalers(snapshot_dir)
+    tickers = sorted(t for t in full_data if os.path.exists(os.path.join(snapshot_dir, f"{t}.keras")))
+    rank = ranking.from_full_data(full_data, tickers, 3)
+    dates = sorted(set().union(*[full_data[t].index for t in tickers]))[-days:]
+
+    inputs = {}
+    for t in tickers:
+        df = full_data[t]
+        inputs[t] = [(d, scanner.prepare_live_data(df.loc[:d], look_back, scalers.get(t))[0]) for d in dates if d in df.index]
+
+    if mode == "int8":
+        quantize_snapshot(snapshot_dir, work_dir, mode, tickers, {t: np.stack([x for _, x in rows]) for t, rows in inputs.items() if rows})
+    else:
+        quantize_snapshot(snapshot_dir, work_dir, mode, tickers)
+
+    diffs, changes = [], []
+    latency = {"float32": [], mode: []}
+    size = {"float32": 0, mode: 0}
+    picks = {"float32": set(), mode: set()}
+    for t in tickers:
+        if not inputs[t]: continue
+        x = np.stack([x for _, x in inputs[t]])
+        probs = {}
+        for name in ("float32", mode):
+            if name == "float32": predict = _keras_predictor(os.path.join(snapshot_dir, f"{t}.keras"))
+            else: predict = _tflite_predictor(os.path.join(tflite_dir(work_dir, mode), f"{t}.tflite"))
+            probs[name] = predict(x)
+            # 掃描器實際的用法是一次一筆，延遲也照這樣量
+            for row in x[:LATENCY_SAMPLES]:
+                t0 = time.perf_counter()
+                predict(row[np.newaxis])
+                latency[name].append(time.perf_counter() - t0)
+        size["float32"] += os.path.getsize(os.path.join(snapshot_dir, f"{t}.keras"))
+        size[mode] += os.path.getsize(os.path.join(tflite_dir(work_dir, mode), f"{t}.tflite"))
+        diffs.append(np.abs(probs["float32"] - probs[mode]))
+
+        for (d, _), p32, pq in zip(inputs[t], probs["float32"], probs[mode]):
+            df = full_data[t].loc[:d]
+            in_top3 = t in ranking.top_tickers(rank, d)
+            for name, p in (("float32", p32), (mode, pq)):
+                picks[name].update((d.strftime("%Y-%m-%d"), s, t) for s in scanner.strategy_hits(df, p, in_top3))
+
+    diffs = np.concatenate(diffs) if diffs else np.zeros(0)
+    changed = sorted(picks["float32"] ^ picks[mode])
+    return {
+        "mode": mode,
+        "generated_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "dates": [dates[0].strftime("%Y-%m-%d"), dates[-1].strftime("%Y-%m-%d")] if dates else [],
+        "tickers": len(tickers),
+        "max_abs_prob_diff": float(diffs.max()) if len(diffs) else 0.0,
+        "mean_abs_prob_diff": float(diffs.mean()) if len(diffs) else 0.0,
+        "picks_float32": len(picks["float32"]),
+        "pick_changes": len(changed),
+        "changed": [{"date": d, "strategy": s, "ticker": t, "only_in": "float32" if (d, s, t) in picks["float32"] else mode}
+                    for d, s, t in changed[:50]],
+        "latency_ms": {k: round(float(np.mean(v)) * 1000, 3) if v else None for k, v in latency.items()},
+        "size_bytes": size,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import model_store
+
+    parser = argparse.ArgumentParser(description="量化推論與 float32 對照報告")
+    parser.add_argument("--mode", default="dynamic", choices=MODES)
+    parser.add_argument("--snapshot", default="", help="快照資料夾，預設為掃描器用的 refs/ma30")
+    parser.add_argument("--days", type=int, default=20, help="對照最近幾個交易日")
+    parser.add_argument("--enable", action="store_true", help="選股完全沒變時啟用量化推論")
+    args = parser.parse_args()
+
+    snapshot_dir = args.snapshot or model_store.find_latest_model_dir(model_store.SCANNER_REF) or model_store.find_latest_model_dir()
+    with open(os.path.join(snapshot_dir, "config.json"), "r") as f:
+        config = json.load(f)
+    tickers = [os.path.splitext(n)[0] for n in os.listdir(snapshot_dir) if n.endswith(".keras")]
+
+    work_dir = tempfile.mkdtemp(prefix=".quantize_")
+    try:
+        report = compare(snapshot_dir, work_dir, args.mode, load_history(tickers, args.days), args.days, config["LOOK_BACK"])
+        report["enabled"] = args.enable and report["pick_changes"] == 0
+        report["source_snapshot"] = os.path.basename(os.path.normpath(snapshot_dir))
+        with open(os.path.join(work_dir, QUANT_FILE), "w") as f:
+            json.dump(report, f, indent=4)
+        artifacts = {rel: os.path.join(work_dir, rel) for rel in model_store.artifact_files(work_dir)}
+        refs = model_store.refs_for(report["source_snapshot"]) if report["enabled"] else []
+        snapshot_dir = model_store.save_snapshot({}, config, snapshot_id=f"{report['source_snapshot']}_{args.mode}", ref=None,
+                                                 base_dir=snapshot_dir, artifacts=artifacts)
+        for ref in refs: model_store.update_ref(os.path.basename(snapshot_dir), ref)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"🗜️ {args.mode}: 勝率最大差 {report['max_abs_prob_diff']:.5f}，選股變動 {report['pick_changes']} 筆 "
+          f"(float32 共 {report['picks_float32']} 筆)")
+    print(f"⏱️ 單筆延遲 {report['latency_ms']}  📦 檔案大小 {report['size_bytes']}")
+    if args.enable and not report["enabled"]: print("⚠️ 選股有變動，維持 float32 推論。")
+    print(f"{'✅ 已啟用' if report['enabled'] else '⏸️ 未啟用'}量化推論 ({snapshot_dir})")
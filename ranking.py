@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+# ===========================
+# 🏆 橫截面動能排名 (整個面板一次算完)
+# ===========================
+# 動能分數 = Close / EMA60。原本回測每天逐檔 .loc 查值再排序 list，
+# 這裡一次對 (日期 x 股票) 陣列算出分數，再用 argpartition 取每天前 N 名，
+# 回測迴圈裡查某天的 Top N 只是一次 dict 查詢 + 一列陣列讀取。
+
+
+def momentum_score(close, ema60):
+    # EMA60 <= 0 或缺值的格子不參與排名 (NaN)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(ema60 > 0, close / ema60, np.nan)
+
+
+def top_n_indices(score, n):
+    # score: (日期, 股票)，回傳每天前 n 名的欄位索引 (由高到低，不足 n 檔時補 -1)
+    score = np.where(np.isnan(score), -np.inf, np.asarray(score, dtype=np.float64))
+    n_rows, n_cols = score.shape
+    k = min(n, n_cols)
+    top = np.full((n_rows, n), -1, dtype=np.int64)
+    if k == 0: return top
+
+    if k < n_cols: part = np.argpartition(-score, k - 1, axis=1)[:, :k]
+    else: part = np.broadcast_to(np.arange(n_cols), (n_rows, n_cols))
+    part_scores = np.take_along_axis(score, part, axis=1)
+    # 只排序選出來的 k 檔；同分時依股票順序，與原本 list.sort 的穩定排序一致
+    order = np.lexsort((part, -part_scores), axis=-1)
+    picked = np.take_along_axis(part, order, axis=1)
+    picked_scores = np.take_along_axis(part_scores, order, axis=1)
+    top[:, :k] = np.where(np.isfinite(picked_scores), picked, -1)
+    return top
+
+
+def top_n_mask(score, n):
+    # 與 top_n_indices 相同的排名，轉成 (日期, 股票) 的布林遮罩
+    top = top_n_indices(score, n)
+    mask = np.zeros(score.shape, dtype=bool)
+    rows, cols = np.nonzero(top >= 0)
+    mask[rows, top[rows, cols]] = True
+    return mask
+
+
+def build_ranking(score, top_n, close=None):
+    # score / close: (日期 x 股票) 的 DataFrame
+    return {
+        "dates": score.index,
+        "tickers": list(score.columns),
+        "pos": {d: i for i, d in enumerate(score.index)},
+        "close": None if close is None else close.reindex(index=score.index, columns=score.columns).to_numpy(dtype=np.float64),
+        "top": top_n_indices(score.to_numpy(dtype=np.float64), top_n),
+    }
+
+
+def from_full_data(full_data, tickers, top_n):
+    # full_data: {ticker: 含 Close / EMA60 欄位的 DataFrame}，依 tickers 的順序排名
+    tickers = [t for t in tickers if t in full_data]
+    if not tickers: return build_ranking(pd.DataFrame(), top_n, close=pd.DataFrame())
+    close = pd.concat({t: full_data[t]['Close'] for t in tickers}, axis=1).sort_index()
+    ema60 = pd.concat({t: full_data[t]['EMA60'] for t in tickers}, axis=1).reindex(close.index)
+    score = pd.DataFrame(momentum_score(close.to_numpy(dtype=np.float64), ema60.to_numpy(dtype=np.float64)),
+                         index=close.index, columns=close.columns)
+    return build_ranking(score, top_n, close=close)
+
+
+def top_tickers(ranking, date):
+    row = ranking["pos"].get(date)
+    if row is None: return []
+    return [ranking["tickers"][j] for j in ranking["top"][row] if j >= 0]
+
+
+def prices_on(ranking, date):
+    # 當天有收盤價的股票 {ticker: close}，取代逐檔 full_data[t].loc[date]['Close']
+    row = ranking["pos"].get(date)
+    if row is None: return {}
+    closes = ranking["close"][row]
+    return {ranking["tickers"][j]: closes[j] for j in np.flatnonzero(~np.isnan(closes))}
@@ -0,0 +1,191 @@
+import os
+import json
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import event_log
+
+# ===========================
+# 🎲 蒙地卡羅穩健度分析 (block bootstrap / 交易重抽)
+# ===========================
+# 一條資產曲線只代表一種運氣。這裡把一次回測的報酬重抽上萬次，看最終資產與最大回撤的分布:
+#   block: 每日報酬做循環 block bootstrap (保留 BLOCK_DAYS 天內的自相關)
+#   trades: 每筆交易對總資產的報酬有放回重抽 (交易順序與組合都會變)
+# 全部在 NumPy 上一次對 (重抽次數 x 天數) 的陣列運算；重抽量大時分塊丟給多個行程，
+# 每個行程只回傳最終資產、最大回撤與自己那塊的逐步百分位帶 (不回傳整個資產矩陣)，
+# 合併時百分位帶按重抽次數加權平均 (單一行程時是精確值)。
+# 結果寫成 data/<prefix>_robustness.json，儀表板直接畫百分位帶。
+#   python robustness.py                              # 所有回測結果，預設 10000 次
+#   python robustness.py --prefix ai_backtest --method trades --n 20000
+N_RESAMPLES = 10000
+BLOCK_DAYS = 10
+PERCENTILES = (5, 25, 50, 75, 95)
+SEED = 42
+PARALLEL_MIN_CELLS = 50_000_000   # 重抽次數 x 天數小於這個數時單一行程就夠快，開行程反而比較慢
+DATA_DIR = "data"
+
+# 回測輸出的檔名前綴與初始資金 (與各回測程式一致)
+TARGETS = {
+    "ai_backtest": 10000,
+    "ai_backtest_ma30": 10000,
+    **{f"{prefix}_{period}": 1000 for prefix in ("vulture", "super_vulture")
+       for period in ("2022_bear", "2023_recovery", "2024_bull", "2025_now")},
+}
+
+
+def output_path(prefix, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f"{prefix}_robustness.json")
+
+
+# ===========================
+# 報酬序列
+# ===========================
+def daily_returns(balance, initial):
+    # 第一天相對於初始資金，之後是逐日變化
+    equity = balance["Equity"].to_numpy(dtype=np.float64)
+    return np.diff(equity, prepend=initial) / np.concatenate([[initial], equity[:-1]])
+
+
+def trade_returns(log, balance, initial):
+    # 每筆賣出對「總資產」的報酬:
+    #   有 Profit_USD 的 (AI 回測，部分倉位) = 損益 / 前一天的總資產
+    #   沒有的 (禿鷹，全倉進出) = 賣出後現金 / 買進前現金 - 1
+    sells = log[log["Action"] == "SELL"]
+    if sells.empty: return np.zeros(0)
+    if "Profit_USD" in log.columns:
+        equity = balance["Equity"].to_numpy(dtype=np.float64)
+        pos = pd.to_datetime(balance["Date"]).values.searchsorted(pd.to_datetime(sells["Date"]).values) - 1
+        before = np.where(pos >= 0, equity[np.maximum(pos, 0)], initial)
+        return sells["Profit_USD"].to_numpy(dtype=np.float64) / before
+    cash_before = np.concatenate([[initial], sells["Balance"].to_numpy(dtype=np.float64)[:-1]])
+    return sells["Balance"].to_numpy(dtype=np.float64) / cash_before - 1
+
+
+# ===========================
+# 重抽 (向量化)
+# ===========================
+def block_indices(rng, n_resamples, length, block):
+    # 循環 block bootstrap: 每條路徑由隨機起點的連續區塊接起來，超出尾端繞回開頭
+    n_blocks = -(-length // block)
+    starts = rng.integers(0, length, size=(n_resamples, n_blocks))
+    idx = (starts[:, :, np.newaxis] + np.arange(block)) % length
+    return idx.reshape(n_resamples, n_blocks * block)[:, :length]
+
+
+def resample(returns, n_resamples, method, block, rng):
+    if method == "block": idx = block_indices(rng, n_resamples, len(returns), block)
+    else: idx = rng.integers(0, len(returns), size=(n_resamples, len(returns)))
+    return returns[idx]
+
+
+def path_stats(paths, initial):
+    # paths: (重抽次數, 步數) 的報酬 -> 資產曲線、最終資產、最大回撤 (負數)
+    equity = initial * np.cumprod(1 + paths, axis=1)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), initial)
+    drawdown = (equity / peak - 1).min(axis=1)
+    return equity, equity[:, -1], np.minimum(drawdown, 0.0)
+
+
+def _run_chunk(returns, n_resamples, method, block, initial, seed):
+    # 子行程: 資產矩陣 (重抽次數 x 步數) 留在行程內，只回傳最終資產 / 最大回撤 / 逐步的 PERCENTILES 資產
+    rng = np.random.default_rng(seed)
+    equity, final, drawdown = path_stats(resample(returns, n_resamples, method, block, rng), initial)
+    return final, drawdown, np.percentile(equity, PERCENTILES, axis=0, overwrite_input=True)
+
+
+def simulate(returns, initial, n_resamples=N_RESAMPLES, method="block", block=BLOCK_DAYS, seed=SEED, workers=None):
+    # 回傳 (最終資產, 最大回撤, 百分位帶)，百分位帶為 (len(PERCENTILES), 步數)
+    returns = np.asarray(returns, dtype=np.float64)
+    workers = workers or os.cpu_count() or 1
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    if workers == 1 or n_resamples * len(returns) < PARALLEL_MIN_CELLS:
+        return _run_chunk(returns, n_resamples, method, block, initial, seeds[0])
+
+    sizes = [n_resamples // workers + (1 if i < n_resamples % workers else 0) for i in range(workers)]
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        parts = list(pool.map(_run_chunk, [returns] * workers, sizes, [method] * workers, [block] * workers,
+                              [initial] * workers, seeds))
+    bands = np.average([p[2] for p in parts], axis=0, weights=sizes)
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]), bands
+
+
+def summarize(final, drawdown, bands, initial):
+    pct = lambda values: {f"p{q}": float(v) for q, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+    return {
+        "final_equity": pct(final),
+        "return_pct": pct((final / initial - 1) * 100),
+        "max_drawdown_pct": pct(drawdown * 100),
+        "prob_loss": float((final < initial).mean()),
+        "bands": {f"p{q}": np.round(row, 2).tolist() for q, row in zip(PERCENTILES, bands)},
+    }
+
+
+# ===========================
+# 分析一次回測
+# ===========================
+def analyze(prefix, initial, method="block", n_resamples=N_RESAMPLES, block=BLOCK_DAYS, workers=None, data_dir=DATA_DIR):
+    balance = event_log.read_table(os.path.join(data_dir, f"{prefix}_balance.csv"))
+    if balance is None or balance.empty: return None
+    if method == "trades":
+        log = event_log.read_table(os.path.join(data_dir, f"{prefix}_log.csv"))
+        returns = trade_returns(log, balance, initial) if log is not None and not log.empty else np.zeros(0)
+        steps = list(range(1, len(returns) + 1))
+    else:
+        returns = daily_returns(balance, initial)
+        steps = [str(d)[:10] for d in balance["Date"]]
+    if len(returns) == 0: return None
+
+    final, drawdown, bands = simulate(returns, initial, n_resamples, method, block, workers=workers)
+    _, actual_final, actual_dd = path_stats(returns[np.newaxis], initial)
+    return {
+        "prefix": prefix,
+        "method": method,
+        "generated_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "n_resamples": int(n_resamples),
+        "block_days": int(block) if method == "block" else None,
+        "initial": initial,
+        "actual": {"final_equity": float(actual_final[0]), "max_drawdown_pct": float(actual_dd[0] * 100)},
+        "steps": steps,
+        **summarize(final, drawdown, bands, initial),
+    }
+
+
+def write_report(report, data_dir=DATA_DIR):
+    path = output_path(report["prefix"], data_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def run_all(method="block", n_resamples=N_RESAMPLES, workers=None, prefixes=None):
+    for prefix in prefixes or TARGETS:
+        report = analyze(prefix, TARGETS.get(prefix, 1000), method, n_resamples, workers=workers)
+        if report is None:
+            print(f"⏭️ {prefix}: 沒有資料")
+            continue
+        write_report(report)
+        band = report["final_equity"]
+        print(f"🎲 {prefix}: 最終資產 P5 ${band['p5']:,.0f} / P50 ${band['p50']:,.0f} / P95 ${band['p95']:,.0f} "
+              f"(實際 ${report['actual']['final_equity']:,.0f})，虧損機率 {report['prob_loss']*100:.1f}%")
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="回測結果的蒙地卡羅穩健度分析")
+    parser.add_argument("--prefix", default="", help=f"只分析指定回測，逗號分隔 (預設全部: {','.join(TARGETS)})")
+    parser.add_argument("--method", default="block", choices=["block", "trades"])
+    parser.add_argument("--n", type=int, default=N_RESAMPLES, help="重抽次數")
+    parser.add_argument("--workers", type=int, default=0, help="行程數 (預設 CPU 核心數)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    run_all(args.method, args.n, args.workers or None, [p for p in args.prefix.split(",") if p] or None)
+    print(f"✅ 完成 ({time.perf_counter() - t0:.1f}s)")
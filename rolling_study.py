@@ -0,0 +1,158 @@
+import os
+import json
+import datetime
+import numpy as np
+import sim_kernel
+import trading_calendar
+
+# ===========================
+# 🔁 禿鷹策略的滾動起點研究
+# ===========================
+# 固定的 TEST_PERIODS 只有四個起點，結果很看運氣。這裡把「每一個交易日起跑 x 每種持有期間 x 兩種策略」
+# 全部當成獨立的策略實例，一起在同一份對齊面板 (sim_kernel.align 的 RSI / 布林訊號) 上逐日前進:
+# 每天的規則判斷對所有實例是一次 NumPy 向量運算 (實例之間沒有共用資金，可以整批算)，
+# 規則與 run_simulation / sim_kernel 完全相同，同一個起點與期間的最終資產一致。
+# 結果 (每個持有期間的報酬分布 + 起點 x 期間的熱度圖資料) 寫到 data/vulture_rolling_study.json。
+#   python rolling_study.py
+STUDY_START = "2022-01-01"
+HORIZONS = (21, 63, 126, 252)    # 持有期間 (交易日): 約一個月 / 一季 / 半年 / 一年
+PERCENTILES = (5, 25, 50, 75, 95)
+OUTPUT_FILE = os.path.join("data", "vulture_rolling_study.json")
+
+
+def instances_for(n_days, horizons):
+    # 每個 (起點, 期間) 一個實例；只保留完整落在資料內的區間
+    first, last, horizon = [], [], []
+    for h in horizons:
+        starts = np.arange(0, n_days - h + 1)
+        first.append(starts)
+        last.append(starts + h - 1)
+        horizon.append(np.full(len(starts), h))
+    return np.concatenate(first), np.concatenate(last), np.concatenate(horizon)
+
+
+def simulate_batch(rules, first, last, arrays, commission, initial):
+    # 所有實例一起逐日前進；回傳每個實例的最終資產、最大回撤 (負數) 與交易次數
+    present, close, buy_ok, rsi, day_num = arrays["present"], arrays["close"], arrays["buy_ok"], arrays["rsi"], arrays["day_num"]
+    n = len(rules)
+    cash = np.full(n, float(initial))
+    held = np.full(n, -1, dtype=np.int64)
+    shares, entry, highest = np.zeros(n), np.zeros(n), np.zeros(n)
+    buy_day = np.zeros(n, dtype=np.int64)
+    peak = np.full(n, float(initial))
+    drawdown = np.zeros(n)
+    final = np.full(n, np.nan)
+    trades = np.zeros(n, dtype=np.int64)
+    latest = np.full(close.shape[1], np.nan)
+    classic = rules == sim_kernel.STRATEGIES["classic"]
+    rsi_rank = np.where(present & buy_ok, rsi, np.inf)
+
+    for d in range(len(close)):
+        latest[present[d]] = close[d, present[d]]
+        active = (first <= d) & (d <= last)
+
+        # --- 賣出檢查 ---
+        idx = np.flatnonzero(active & (held >= 0))
+        idx = idx[present[d, held[idx]]]
+        if len(idx):
+            price = close[d, held[idx]]
+            days = day_num[d] - buy_day[idx]
+            pnl = (price - entry[idx]) / entry[idx]
+            prev_high = highest[idx]
+            highest[idx] = np.where(price > prev_high, price, prev_high)
+            drop_from_high = (prev_high - price) / prev_high
+            stuck = (days > 15) & (pnl > -0.05)
+            sell = np.where(classic[idx],
+                            (pnl > 0.20) | (pnl < -0.15) | stuck,
+                            ((pnl > 0.05) & (drop_from_high > 0.05)) | (pnl < -0.10) | stuck)
+            sold = idx[sell]
+            cash[sold] += (shares[sold] * price[sell] - commission)
+            held[sold] = -1
+
+        # --- 買入檢查: 當天 RSI 最低的候選對所有空手的實例都一樣 ---
+        best = int(np.argmin(rsi_rank[d]))
+        if np.isfinite(rsi_rank[d, best]):
+            buyers = np.flatnonzero(active & (held < 0) & (cash > sim_kernel.MIN_CASH))
+            price = close[d, best]
+            held[buyers], entry[buyers], highest[buyers], buy_day[buyers] = best, price, price, day_num[d]
+            shares[buyers] = (cash[buyers] - commission) / price
+            cash[buyers] = 0.0
+            trades[buyers] += 1
+
+        # --- 資產結算 ---
+        idx = np.flatnonzero(active)
+        h = held[idx]
+        mark = np.where(np.isnan(latest[np.maximum(h, 0)]), entry[idx], latest[np.maximum(h, 0)])
+        equity = cash[idx] + np.where(h >= 0, shares[idx] * mark, 0.0)
+        peak[idx] = np.maximum(peak[idx], equity)
+        drawdown[idx] = np.minimum(drawdown[idx], equity / peak[idx] - 1)
+        ended = last[idx] == d
+        final[idx[ended]] = equity[ended]
+
+    return final, drawdown, trades
+
+
+def run_study(data_cache=None, tickers=None, horizons=HORIZONS, start=STUDY_START, end=None, output_file=OUTPUT_FILE):
+    import run_backtest
+    data_cache = run_backtest.data_cache if data_cache is None else data_cache
+    tickers = run_backtest.TICKERS if tickers is None else tickers
+    end = end or run_backtest.TODAY
+    dates = trading_calendar.sessions([data_cache[t] for t in tickers if t in data_cache], start, end)
+    horizons = [h for h in horizons if h <= len(dates)]
+    if not horizons:
+        print("⏭️ 資料太短，無法做滾動起點研究")
+        return None
+
+    arrays = sim_kernel.align(data_cache, tickers, dates)
+    first, last, horizon = instances_for(len(dates), horizons)
+    names = list(sim_kernel.STRATEGIES)
+    rules = np.repeat([sim_kernel.STRATEGIES[s] for s in names], len(first))
+    final, drawdown, trades = simulate_batch(rules, np.tile(first, len(names)), np.tile(last, len(names)), arrays,
+                                             run_backtest.COMMISSION, run_backtest.INITIAL_CASH)
+    returns = final / run_backtest.INITIAL_CASH - 1
+
+    report = {
+        "generated_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "dates": [d.strftime("%Y-%m-%d") for d in dates],
+        "horizons": [int(h) for h in horizons],
+        "strategies": {},
+    }
+    for k, name in enumerate(names):
+        block = slice(k * len(first), (k + 1) * len(first))
+        per_horizon = {}
+        for h in horizons:
+            sel = np.flatnonzero(horizon == h)
+            r = returns[block][sel] * 100
+            per_horizon[str(h)] = {
+                "summary": {
+                    **{f"p{q}": float(v) for q, v in zip(PERCENTILES, np.percentile(r, PERCENTILES))},
+                    "mean": float(r.mean()),
+                    "win_rate": float((r > 0).mean()),
+                    "worst_drawdown_pct": float(drawdown[block][sel].min() * 100),
+                    "avg_trades": float(trades[block][sel].mean()),
+                    "n_starts": int(len(sel)),
+                },
+                # 熱度圖: 第 i 個值是從 dates[i] 起跑的報酬 (%)
+                "returns_pct": np.round(r, 2).tolist(),
+            }
+        report["strategies"][name] = per_horizon
+
+    tmp_path = f"{output_file}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f)
+    os.replace(tmp_path, output_file)
+    for name in names:
+        line = " / ".join(f"{h}天 P50 {report['strategies'][name][str(h)]['summary']['p50']:+.1f}%" for h in horizons)
+        print(f"🔁 {name}: {line}")
+    return report
+
+
+if __name__ == "__main__":
+    import time
+    import run_backtest
+
+    t0 = time.perf_counter()
+    run_backtest.download_data()
+    t1 = time.perf_counter()
+    run_study()
+    print(f"✅ 滾動起點研究完成 (下載 {t1 - t0:.1f}s，模擬 {time.perf_counter() - t1:.1f}s)")
@@ -3,6 +3,12 @@ import json
 import os
 import yfinance as yf
 import datetime # 確保引入 datetime
+import profiler
+import universe
+import checkpoint
+import event_log
+import trading_calendar
+import sim_kernel
 
 # ===========================
 # 1. 全局設定
@@ -10,20 +16,26 @@ import datetime # 確保引入 datetime
 DATA_DIR = "data"
 if not os.path.exists(DATA_DIR): os.makedirs(DATA_DIR)
 
-TICKERS = ['MSFT', 'GOOGL', 'AMZN', 'COST', 'PEP', 'KO', 'JPM', 'UNH', 'TSLA', 'NVDA', 'AMD', 'META', 'NFLX']
+TICKERS = universe.get_tickers("vulture")
 DOWNLOAD_START = "2021-06-01"
 
 # 🔥 [修改這裡] 讓它自動抓取程式執行當下的日期
 TODAY = datetime.datetime.now().strftime("%Y-%m-%d")
 
-print(f"📥 正在下載長歷史數據 ({DOWNLOAD_START} ~ {TODAY})...")
+INITIAL_CASH = 1000
+COMMISSION = 2
+
 data_cache = {}
-for t in TICKERS:
-    try:
-        df = yf.download(t, start=DOWNLOAD_START, end=TODAY, progress=False)
-        if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
-        data_cache[t] = df
-    except: pass
+
+def download_data():
+    print(f"📥 正在下載長歷史數據 ({DOWNLOAD_START} ~ {TODAY})...")
+    for t in TICKERS:
+        try:
+            with profiler.timer("download"):
+                df = yf.download(t, start=DOWNLOAD_START, end=TODAY, progress=False)
+            if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
+            data_cache[t] = df
+        except: pass
 
 # 定義測試區間 (平行宇宙)
 TEST_PERIODS = {
@@ -37,26 +49,57 @@ TEST_PERIODS = {
 # ===========================
 # 2. 回測核心
 # ===========================
-def run_simulation(strategy_type, start_date, end_date, file_prefix):
+def run_simulation(strategy_type, start_date, end_date, file_prefix, resume=checkpoint.RESUME):
     print(f"🚀 執行：{file_prefix} ({start_date} ~ {end_date})")
     
     LOG_FILE = os.path.join(DATA_DIR, f"{file_prefix}_log.csv")
     BALANCE_FILE = os.path.join(DATA_DIR, f"{file_prefix}_balance.csv")
-    portfolio = {"cash": 1000, "holdings": []}
+    portfolio = {"cash": INITIAL_CASH, "holdings": []}
     trade_logs = []
     balance_history = []
     latest_prices = {}
-    commission = 2
+    commission = COMMISSION
     
-    dates = pd.date_range(start=start_date, end=end_date)
+    # 📅 只迭代有 K 線的交易日 (不再跑週末 / 休市日)，當天有資料的股票事先整理好
+    dates = trading_calendar.sessions([data_cache[t] for t in TICKERS if t in data_cache], start_date, end_date)
+    on_date = trading_calendar.members(data_cache, dates, TICKERS)
+
+    # ⏯️ 檢查點: 已經跑完的區間直接略過，進行中的區間從最後一個有資料的日子之後接著跑
+    config = {"strategy": strategy_type, "start": start_date, "tickers": TICKERS}
+    state = checkpoint.load(file_prefix, config) if resume else None
+    if state:
+        last_prices = {t: data_cache[t].loc[state["last_date"]]['Close'] for t in state["last_prices"]
+                       if t in data_cache and state["last_date"] in data_cache[t].index}
+        if not checkpoint.prices_match(state, last_prices):
+            print("⚠️ 持倉股票的歷史價格已被修正，改為完整回放。")
+            state = None
+    if state:
+        portfolio, latest_prices = state["portfolio"], state["latest_prices"]
+        dates = dates[dates > state["last_date"]]
+        # 上次在最後一個有資料的日子之後補的權益列 (舊版逐日曆日迭代時) 或當機前寫了一半的列，這次會重新產生
+        event_log.truncate_after(LOG_FILE, state["last_date"].strftime("%Y-%m-%d"))
+        event_log.truncate_after(BALANCE_FILE, state["last_date"].strftime("%Y-%m-%d"))
+    last_date = state["last_date"] if state else None
+    log_stream = event_log.open_stream(LOG_FILE, reset=not state)
+    balance_stream = event_log.open_stream(BALANCE_FILE, reset=not state)
+
+    if sim_kernel.ENABLED and len(dates):
+        # ⚡ SIM_KERNEL=1: 同一套規則改由編譯核心一次跑完 (portfolio / latest_prices 會更新成跑完後的狀態)
+        with profiler.timer("sim_kernel"):
+            trade_logs, balance_history = sim_kernel.run_vulture(strategy_type, data_cache, TICKERS, dates, portfolio, latest_prices, commission)
+        for row in trade_logs: event_log.append(log_stream, row)
+        for row in balance_history: event_log.append(balance_stream, row)
+        last_date = dates[-1]
+        dates = dates[:0]   # 下面的逐日迴圈不必再跑
 
     for date in dates:
+        profiler.lap("day_loop")
         date_str = date.strftime("%Y-%m-%d")
         
         # 更新價格
-        for t in TICKERS:
-            if t in data_cache and date in data_cache[t].index:
-                latest_prices[t] = data_cache[t].loc[date]['Close']
+        for t in on_date[date]:
+            latest_prices[t] = data_cache[t].loc[date]['Close']
+        if on_date[date]: last_date = date
         
         # --- 賣出檢查 ---
         for i in range(len(portfolio['holdings']) - 1, -1, -1):
@@ -104,31 +147,31 @@ def run_simulation(strategy_type, start_date, end_date, file_prefix):
                         "Price": round(price, 2), "Reason": sell_reason,
                         "Balance": round(portfolio['cash'], 2)
                     })
+                    event_log.append(log_stream, trade_logs[-1])
                     portfolio['holdings'].pop(i)
 
         # --- 買入檢查 ---
         if len(portfolio['holdings']) < 1:
             candidates = []
-            for t in TICKERS:
+            for t in on_date[date]:
                 if any(h['Ticker'] == t for h in portfolio['holdings']): continue
                 
-                if t in data_cache and date in data_cache[t].index:
-                    idx = data_cache[t].index.get_loc(date)
-                    if idx > 20:
-                        subset = data_cache[t].iloc[:idx+1]
-                        close = subset['Close'].iloc[-1]
-                        
-                        delta = subset['Close'].diff()
-                        gain = (delta.where(delta > 0, 0)).rolling(14).mean()
-                        loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-                        rsi = 100 - (100 / (1 + gain/loss))
-                        
-                        ma20 = subset['Close'].rolling(20).mean()
-                        std = subset['Close'].rolling(20).std()
-                        lower = ma20 - (2*std)
-                        
-                        if rsi.iloc[-1] < 35 and close < lower.iloc[-1]:
-                            candidates.append((t, close, rsi.iloc[-1]))
+                idx = data_cache[t].index.get_loc(date)
+                if idx > 20:
+                    subset = data_cache[t].iloc[:idx+1]
+                    close = subset['Close'].iloc[-1]
+                    
+                    delta = subset['Close'].diff()
+                    gain = (delta.where(delta > 0, 0)).rolling(14).mean()
+                    loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
+                    rsi = 100 - (100 / (1 + gain/loss))
+                    
+                    ma20 = subset['Close'].rolling(20).mean()
+                    std = subset['Close'].rolling(20).std()
+                    lower = ma20 - (2*std)
+                    
+                    if rsi.iloc[-1] < 35 and close < lower.iloc[-1]:
+                        candidates.append((t, close, rsi.iloc[-1]))
             
             if candidates:
                 candidates.sort(key=lambda x: x[2])
@@ -146,6 +189,7 @@ def run_simulation(strategy_type, start_date, end_date, file_prefix):
                         "Price": round(best_p, 2), "Reason": f"RSI: {best_r:.1f}",
                         "Balance": round(0, 2)
                     })
+                    event_log.append(log_stream, trade_logs[-1])
 
         # --- 資產結算 ---
         equity = portfolio['cash']
@@ -155,37 +199,74 @@ def run_simulation(strategy_type, start_date, end_date, file_prefix):
             else: equity += h['Shares'] * h['Entry']
         
         balance_history.append({"Date": date_str, "Equity": round(equity, 2)})
+        event_log.append(balance_stream, balance_history[-1])
+
+    profiler.lap("day_loop", last=True)
+    event_log.close(log_stream)
+    event_log.close(balance_stream)
 
-    pd.DataFrame(trade_logs).to_csv(LOG_FILE, index=False)
-    pd.DataFrame(balance_history).to_csv(BALANCE_FILE, index=False)
+    if resume and last_date is not None:
+        held = {h['Ticker'] for h in portfolio['holdings']}
+        checkpoint.save(file_prefix, {
+            "config": config,
+            "last_date": last_date,
+            "portfolio": portfolio,
+            "latest_prices": latest_prices,
+            "last_prices": {t: p for t, p in latest_prices.items() if t in held and last_date in data_cache[t].index},
+        })
 
 # ===========================
 # 3. 執行所有組合
 # ===========================
-for name, (start, end) in TEST_PERIODS.items():
-    # 跑 Tab 1 的策略 (Classic)
-    run_simulation("classic", start, end, f"vulture_{name}")
-    
-    # 跑 Tab 2 的策略 (Super)
-    run_simulation("super", start, end, f"super_vulture_{name}")
+def run_lockstep_periods():
+    # 🔀 SIM_KERNEL=1: 所有區間 x 兩種禿鷹在同一份對齊面板上同步前進，資料只走訪一次
+    # (完整重播，不讀檢查點；輸出檔與逐一跑 run_simulation 相同)
+    instances = []
+    for name, (start, end) in TEST_PERIODS.items():
+        for strategy_type, prefix in (("classic", "vulture"), ("super", "super_vulture")):
+            instances.append({"name": f"{prefix}_{name}", "strategy": strategy_type, "start": start, "end": end,
+                              "portfolio": {"cash": INITIAL_CASH, "holdings": []}})
+    print(f"🔀 同步執行 {len(instances)} 個策略實例")
+    with profiler.timer("sim_kernel"):
+        results = sim_kernel.run_lockstep(instances, data_cache, TICKERS, COMMISSION)
+    for file_prefix, (trade_logs, balance_history) in results.items():
+        for suffix, rows in (("log", trade_logs), ("balance", balance_history)):
+            stream = event_log.open_stream(os.path.join(DATA_DIR, f"{file_prefix}_{suffix}.csv"), reset=True)
+            for row in rows: event_log.append(stream, row)
+            event_log.close(stream)
+
 
-print("✅ 所有回測完成！")
+def run_all_periods():
+    if sim_kernel.ENABLED:
+        run_lockstep_periods()
+        print("✅ 所有回測完成！")
+        return
+
+    for name, (start, end) in TEST_PERIODS.items():
+        # 跑 Tab 1 的策略 (Classic)
+        run_simulation("classic", start, end, f"vulture_{name}")
+        
+        # 跑 Tab 2 的策略 (Super)
+        run_simulation("super", start, end, f"super_vulture_{name}")
+
+    print("✅ 所有回測完成！")
 
 # ===========================
 # 4. 記錄最後更新時間 (新增功能)
 # ===========================
-import datetime
-
-# 取得現在時間 (你的 Mac 時間)
-now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-meta_info = {"last_updated": now}
+def write_meta(stages=None):
+    # 取得現在時間 (你的 Mac 時間)
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    meta_info = {"last_updated": now}
+    # pipeline.py 會帶入每個階段的狀態與耗時
+    if stages: meta_info["stages"] = stages
 
-# 寫入 meta.json
-META_FILE = os.path.join(DATA_DIR, "meta.json")
-with open(META_FILE, 'w') as f:
-    json.dump(meta_info, f)
+    # 寫入 meta.json
+    META_FILE = os.path.join(DATA_DIR, "meta.json")
+    with open(META_FILE, 'w') as f:
+        json.dump(meta_info, f)
 
-print(f"✅ 所有回測完成！更新時間已記錄：{now}")
+    print(f"✅ 所有回測完成！更新時間已記錄：{now}")
 
 
 # ===========================
@@ -194,7 +275,6 @@ print(f"✅ 所有回測完成！更新時間已記錄：{now}")
 import smtplib
 from email.mime.text import MIMEText
 from email.header import Header
-import datetime # 確保有 import 這個
 
 def send_email_notification(strategies_to_check):
     gmail_user = os.environ.get("EMAIL_USER")
@@ -256,5 +336,15 @@ check_list = {
     "🚀 超級禿鷹": os.path.join(DATA_DIR, "super_vulture_2025_now_log.csv")
 }
 
-# 執行寄信檢查 (這一行最重要！沒有它，函數就不會動)
-send_email_notification(check_list)
\ No newline at end of file
+def notify():
+    send_email_notification(check_list)
+
+if __name__ == "__main__":
+    profiler.enable_from_env()
+    download_data()
+    run_all_periods()
+    write_meta()
+    profiler.write_report(os.path.join(DATA_DIR, "vulture_profile.json"))
+
+    # 執行寄信檢查 (這一行最重要！沒有它，函數就不會動)
+    send_email_notification(check_list)
\ No newline at end of file
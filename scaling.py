@@ -0,0 +1,70 @@
+import numpy as np
+
+# ===========================
+# 📏 MinMax 縮放 (取代每次重建的 sklearn MinMaxScaler)
+# ===========================
+# 參數就是 {"features", "data_min", "data_max", "scale", "min"} 幾個陣列，公式與
+# MinMaxScaler(feature_range=(0, 1)) 完全相同: X * scale + min，數值逐位元一致。
+#
+# 回測每天的 past_df 都是同一檔股票完整資料的前綴，所以每檔股票先算一次
+# 「逐日累積」的最小/最大值 (expanding)，之後任一天的參數都是查表 O(F)，
+# 只縮放需要的那一段 transform(params, data[start:end])，O(window × F)，不必每天對整段前綴重新 fit。
+# 訓練時用的參數會跟模型一起存進快照 (scalers.json)，掃描器直接沿用，不再用最近 200 天重新 fit。
+FEATURE_RANGE = (0.0, 1.0)
+
+
+def _params(data_min, data_max, features=None):
+    # 與 sklearn 相同: 區間太小 (常數欄位) 時除以 1，避免除以零
+    data_range = data_max - data_min
+    data_range = np.where(data_range < 10 * np.finfo(np.float64).eps, 1.0, data_range)
+    scale = (FEATURE_RANGE[1] - FEATURE_RANGE[0]) / data_range
+    return {
+        "features": list(features) if features is not None else None,
+        "data_min": data_min,
+        "data_max": data_max,
+        "scale": scale,
+        "min": FEATURE_RANGE[0] - data_min * scale,
+    }
+
+
+def fit(data, features=None):
+    data = np.asarray(data, dtype=np.float64)
+    return _params(np.nanmin(data, axis=0), np.nanmax(data, axis=0), features)
+
+
+def transform(params, data):
+    return np.asarray(data, dtype=np.float64) * params["scale"] + params["min"]
+
+
+def fit_transform(data, features=None):
+    params = fit(data, features)
+    return transform(params, data), params
+
+
+def inverse_transform(params, values, column=0):
+    # 把模型輸出 (第 column 個特徵的縮放值) 換回原始價格
+    values = np.asarray(values, dtype=np.float64)
+    return (values - params["min"][column]) / params["scale"][column]
+
+
+def expanding(data, features=None):
+    # 第 k 列 = 前 k+1 列的最小/最大值；NaN 不參與 (同 nanmin / nanmax)
+    data = np.asarray(data, dtype=np.float64)
+    return {
+        "features": list(features) if features is not None else None,
+        "data_min": np.fmin.accumulate(data, axis=0),
+        "data_max": np.fmax.accumulate(data, axis=0),
+    }
+
+
+def at(running, n):
+    # 前 n 列資料 fit 出來的參數
+    return _params(running["data_min"][n - 1], running["data_max"][n - 1], running["features"])
+
+
+def to_json(params):
+    return {k: (v.tolist() if isinstance(v, np.ndarray) else v) for k, v in params.items()}
+
+
+def from_json(obj):
+    return {k: (np.asarray(v, dtype=np.float64) if k != "features" else v) for k, v in obj.items()}
@@ -0,0 +1,96 @@
+import os
+import json
+import struct
+import numpy as np
+
+# ===========================
+# 📦 訊號檔 (精簡二進位格式)
+# ===========================
+# latest_signals.json / ai_lab_result.json 旁邊多寫一份 .sig:
+#   b"SIG1" | uint32 表頭長度 | JSON 表頭 (對齊 4 bytes) | float32 資料區
+# 預測曲線 (History_Curve / Forecast_Curve) 不再是幾十個 JSON 浮點數字串，
+# 表頭只記 {"__array__": [起點, 長度]}，讀取時用 np.frombuffer 直接切出 float32 陣列。
+# 兩個檔都先寫暫存檔 + fsync 再 os.replace，儀表板永遠不會讀到寫一半的檔案。
+MAGIC = b"SIG1"
+ARRAY_KEYS = ("History_Curve", "Forecast_Curve")
+WRITE_JSON = os.environ.get("SIGNALS_JSON", "1") != "0"   # 相容舊讀取端，預設照樣輸出 JSON
+
+
+def binary_path(path):
+    return os.path.splitext(path)[0] + ".sig"
+
+
+def _json_default(obj):
+    if isinstance(obj, np.ndarray): return obj.tolist()
+    if hasattr(obj, "item"): return obj.item()
+    return str(obj)
+
+
+def _split(obj, arrays, cursor):
+    # 把曲線搬到 arrays，表頭裡換成 (起點, 長度)
+    if isinstance(obj, dict):
+        out = {}
+        for k, v in obj.items():
+            if k in ARRAY_KEYS and v is not None:
+                arr = np.asarray(v, dtype="<f4").ravel()
+                out[k] = {"__array__": [cursor[0], len(arr)]}
+                arrays.append(arr)
+                cursor[0] += len(arr)
+            else:
+                out[k] = _split(v, arrays, cursor)
+        return out
+    if isinstance(obj, list): return [_split(v, arrays, cursor) for v in obj]
+    return obj
+
+
+def _join(obj, payload):
+    if isinstance(obj, dict):
+        if "__array__" in obj and len(obj) == 1:
+            start, length = obj["__array__"]
+            return payload[start:start + length]
+        return {k: _join(v, payload) for k, v in obj.items()}
+    if isinstance(obj, list): return [_join(v, payload) for v in obj]
+    return obj
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write(path, obj, write_json=WRITE_JSON):
+    # path 是原本的 .json 路徑；二進位檔放在同一個資料夾的 .sig
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    arrays = []
+    header = json.dumps(_split(obj, arrays, [0]), ensure_ascii=False, separators=(",", ":"),
+                        default=_json_default).encode("utf-8")
+    header += b" " * (-len(header) % 4)
+    payload = np.concatenate(arrays) if arrays else np.empty(0, dtype="<f4")
+    # JSON 先寫、.sig 後寫: 讀取端用「.sig 不比 JSON 舊」判斷二進位檔是最新的
+    if write_json:
+        _write_atomic(path, json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8"))
+    _write_atomic(binary_path(path), MAGIC + struct.pack("<I", len(header)) + header + payload.tobytes())
+
+
+def read_binary(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != MAGIC: raise ValueError(f"{path} 不是訊號檔")
+    header_len = struct.unpack("<I", data[4:8])[0]
+    header = json.loads(data[8:8 + header_len])
+    payload = np.frombuffer(data, dtype="<f4", offset=8 + header_len)
+    return _join(header, payload)
+
+
+def read(path):
+    # 有比 JSON 新的 .sig 就讀二進位 (曲線是 float32 陣列)，否則讀 JSON；都沒有回傳 {}
+    bin_path = binary_path(path)
+    if os.path.exists(bin_path) and (not os.path.exists(path) or os.path.getmtime(bin_path) >= os.path.getmtime(path)):
+        return read_binary(bin_path)
+    if not os.path.exists(path): return {}
+    with open(path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,531 @@
+import os
+import numpy as np
+import pandas as pd
+import trading_calendar
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:  # 沒裝 numba 時同一份迴圈直接用 Python 跑 (結果相同，只是慢)
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]): return args[0]
+        return lambda fn: fn
+
+# ===========================
+# ⚡ 策略的編譯模擬核心 (Numba @njit，沒裝時退回 NumPy + Python 迴圈)
+# ===========================
+# run_simulation 與 AI 回測的日迴圈都是數值狀態機: 先檢查賣出再挑候選買進。
+# 這裡把資料先對齊成 (交易日 x 股票) 的陣列:
+#   present / close: 當天有沒有 K 線與收盤價
+#   buy_ok / rsi:    禿鷹的買進條件 (RSI < 35 且跌破布林下軌，且已有 20 天以上歷史) 整個面板用 NumPy 一次算好
+#   prob / top / ...: AI 策略 (Top 3 / MA30) 每個模型一層: 勝率表、動能前 N 名、大盤濾網、EMA20 / ATR / MA30
+# 核心只剩逐日的持股狀態更新，回傳交易事件與每天的權益陣列，逐筆交易與原本的 Python 迴圈一致
+# (benchmarks/check_kernel.py 會逐位元組比對兩邊寫出的 CSV)。
+#
+# 🔀 多策略同步 (lockstep): 多個策略實例 (規則 x 回測區間) 在同一份對齊面板上一起逐日前進，
+# 各自保有持股；面板、買進訊號與勝率表只算一次，多一個策略只多一份規則判斷。
+# 每個實例掛在一個錢包 (wallet) 上: 各自獨立就是一個實例一個錢包；共用資金池就是全部掛同一個，
+# 買進時把錢包裡的現金平分給還能買的實例 (獨立錢包時等於全部現金，與單獨回測完全相同)。
+#   SIM_KERNEL=1 python run_backtest.py              # 所有區間 x 兩種禿鷹一次跑完 (pip install numba 才有加速)
+#   SIM_KERNEL=1 python ai_backtest_2.py             # 勝率表沿固定排程填好後，出場規則由核心跑完
+#   python sim_kernel.py --period 2025_now           # classic / super 各自獨立 vs 共用資金池對照
+#   python sim_kernel.py --period 2025_now --ai      # 四個策略 (含 Top 3 / MA30) 在同一份面板上同步
+ENABLED = os.environ.get("SIM_KERNEL", "") == "1"
+STRATEGIES = {"classic": 0, "super": 1}
+AI_STRATEGIES = {"top3": 2, "ma30": 3}
+RULES = {**STRATEGIES, **AI_STRATEGIES}
+CLASSIC, SUPER, TOP3, MA30 = 0, 1, 2, 3
+BUY, SELL = 1, 2
+# 賣出原因代碼 (value 欄位放格式化要用的數字)
+TAKE_PROFIT, STOP_LOSS, STUCK, PEAK_LOCK, STRICT_STOP = 0, 1, 2, 3, 4
+ATR_STOP, STRONG_PULLBACK, WEAK_BOUNCE, TIME_STOP = 5, 6, 7, 8
+MIN_HISTORY = 20
+RSI_BUY = 35
+MIN_CASH = 100
+AI_MAX_HOLDINGS = 3   # 與 AI 回測的 len(portfolio["holdings"]) < 3 相同
+# AI 規則的參數欄位 (每個實例一列，取自各自回測模組的常數)
+P_THRESHOLD, P_ATR_MULT, P_STRONG, P_WEAK, P_TIME_STOP, P_ALLOC, P_COOLDOWN, P_FEE, P_BUFFER = range(9)
+N_PARAMS = 9
+
+
+# ===========================
+# 資料對齊 (NumPy)
+# ===========================
+def buy_signals(df):
+    # 與 run_simulation 對 iloc[:idx+1] 子集算的指標相同 (rolling 只看過去，前綴與全段在該日的值一致)
+    delta = df['Close'].diff()
+    gain = (delta.where(delta > 0, 0)).rolling(14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
+    rsi = 100 - (100 / (1 + gain/loss))
+    ma20 = df['Close'].rolling(20).mean()
+    std = df['Close'].rolling(20).std()
+    lower = ma20 - (2*std)
+    ok = (np.arange(len(df)) > MIN_HISTORY) & (rsi < RSI_BUY).to_numpy() & (df['Close'] < lower).to_numpy()
+    return rsi.to_numpy(dtype=np.float64), ok
+
+
+def align(data_cache, tickers, dates, signal_tickers=None):
+    # signal_tickers: 要算禿鷹買進訊號的股票 (預設全部)；其他股票只對齊收盤價
+    n_days, n_tickers = len(dates), len(tickers)
+    signal_tickers = set(tickers if signal_tickers is None else signal_tickers)
+    present = np.zeros((n_days, n_tickers), dtype=np.bool_)
+    close = np.full((n_days, n_tickers), np.nan)
+    rsi = np.full((n_days, n_tickers), np.nan)
+    buy_ok = np.zeros((n_days, n_tickers), dtype=np.bool_)
+    for j, t in enumerate(tickers):
+        df = data_cache.get(t)
+        if df is None or df.empty: continue
+        rows = df.index.get_indexer(dates)
+        hit = rows >= 0
+        present[hit, j] = True
+        close[hit, j] = df['Close'].to_numpy(dtype=np.float64)[rows[hit]]
+        if t not in signal_tickers: continue
+        t_rsi, t_ok = buy_signals(df)
+        rsi[hit, j] = t_rsi[rows[hit]]
+        buy_ok[hit, j] = t_ok[rows[hit]]
+    return {"present": present, "close": close, "rsi": rsi, "buy_ok": buy_ok,
+            "day_num": day_numbers(dates)}
+
+
+def ai_model(module, full_data, market_df, rank):
+    # AI 回測模組 (ai_backtest_2 / ai_backtest_ma30_2) 的一個模型: 規則參數取模組常數，勝率查 module.prob_table
+    # (核心不會訓練模型，表要先用 ai_training.fill_prob_table 填好；表裡沒有的格子當作勝率 0)
+    params = np.zeros(N_PARAMS)
+    params[[P_THRESHOLD, P_ATR_MULT, P_STRONG, P_WEAK, P_TIME_STOP, P_ALLOC, P_COOLDOWN, P_FEE, P_BUFFER]] = [
+        module.BUY_PROB_THRESHOLD, module.ATR_STOP_LOSS_MULTIPLIER, module.STRONG_DROP_TOLERANCE, module.WEAK_DROP_TOLERANCE,
+        module.TIME_STOP_DAYS, module.ALLOCATION_PCT, module.STOP_LOSS_COOLDOWN_DAYS, module.TRANSACTION_FEE,
+        getattr(module, "MA30_BREAKOUT_BUFFER", 1.0)]
+    return {"full_data": full_data, "market_df": market_df, "rank": rank, "prob_table": module.prob_table, "params": params}
+
+
+def align_model(model, dates, tickers, close, present):
+    # 把一個 AI 模型的排名 / 濾網 / 指標 / 勝率表對齊到面板的 (交易日 x 股票)
+    n_days, n_tickers = len(dates), len(tickers)
+    col = {t: j for j, t in enumerate(tickers)}
+    columns = {name: np.full((n_days, n_tickers), np.nan) for name in ("EMA20", "ATR", "MA30", "MA30_Slope")}
+    for t, df in model["full_data"].items():
+        if t not in col: continue
+        rows = df.index.get_indexer(dates)
+        hit = rows >= 0
+        for name, arr in columns.items():
+            if name in df.columns: arr[hit, col[t]] = df[name].to_numpy(dtype=np.float64)[rows[hit]]
+
+    prob = np.zeros((n_days, n_tickers))
+    pos = {d: k for k, d in enumerate(dates)}
+    for (d, t), p in model["prob_table"].items():
+        if d in pos and t in col: prob[pos[d], col[t]] = p
+
+    rank = model["rank"]
+    rank_cols = np.array([col[t] for t in rank["tickers"]], dtype=np.int64)
+    top = np.full((n_days, rank["top"].shape[1]), -1, dtype=np.int64)
+    rows = pd.DatetimeIndex(rank["dates"]).get_indexer(dates)
+    hit = rows >= 0
+    if len(rank_cols):
+        picked = rank["top"][rows[hit]]
+        top[hit] = np.where(picked >= 0, rank_cols[np.maximum(picked, 0)], -1)
+
+    # 與 market_df.loc[d]['Close'] > market_df.loc[d]['EMA60'] 相同 (大盤當天沒有 K 線或缺值時為 False)
+    market = model["market_df"].reindex(dates)
+    bullish = (market['Close'] > market['EMA60']).to_numpy(dtype=np.bool_)
+    # 當天股票池裡有任何收盤價 (= ranking.prices_on 不是空的) 才是這個策略的交易日
+    priced = present & ~np.isnan(close)
+    active = priced[:, rank_cols].any(axis=1) if len(rank_cols) else np.zeros(n_days, dtype=np.bool_)
+    return {"prob": prob, "top": top, "bullish": bullish, "active": active, "ema20": columns["EMA20"],
+            "atr": columns["ATR"], "ma30": columns["MA30"], "ma30_slope": columns["MA30_Slope"], "params": model["params"]}
+
+
+def day_numbers(dates):
+    return pd.DatetimeIndex(dates).values.astype("datetime64[D]").astype(np.int64)
+
+
+# ===========================
+# 核心 (狀態機)
+# ===========================
+@njit(cache=True)
+def lockstep_kernel(rules, models, universe, first, last, wallet, params, present, close, active, buy_ok, rsi, day_num, commission,
+                    prob, top, bullish, ema20, atr, ma30, ma30_slope,
+                    cash, n_held, held, shares, entry, highest, buy_day, stop, conf, cooldown, latest):
+    # 實例 i 只在第 first[i] ~ last[i] 個交易日、而且 active[universe[i], d] 的日子活動，規則 rules[i]，現金在 cash[wallet[i]]
+    # (禿鷹的股票池是 active[0]，AI 模型 m 的是 active[1 + m])
+    # 每個實例最多 held.shape[1] 檔持股 (禿鷹 1 檔、AI 3 檔)，held[i, :n_held[i]] 的順序就是原本 holdings list 的順序
+    # 狀態陣列、cooldown (各股票冷卻到第幾天) 與 latest (每檔最後看到的收盤價，沒看過為 NaN) 都會就地更新
+    n_days, n_tickers = close.shape
+    n_inst, n_slots = held.shape
+    n_wallets = len(cash)
+    cap = n_days * n_inst * (n_slots + 1)
+    ev_inst = np.zeros(cap, dtype=np.int64)
+    ev_day = np.zeros(cap, dtype=np.int64)
+    ev_kind = np.zeros(cap, dtype=np.int64)
+    ev_ticker = np.zeros(cap, dtype=np.int64)
+    ev_price = np.zeros(cap)
+    ev_reason = np.zeros(cap, dtype=np.int64)
+    ev_value = np.zeros(cap)
+    ev_cash = np.zeros(cap)
+    ev_profit = np.zeros(cap)
+    ev_pct = np.zeros(cap)
+    equity = np.full((n_days, n_wallets), np.nan)
+    idle = np.zeros(n_wallets, dtype=np.int64)
+    live = np.zeros(n_inst, dtype=np.bool_)
+    n_ev = 0
+
+    for d in range(n_days):
+        for j in range(n_tickers):
+            if present[d, j]: latest[j] = close[d, j]
+        for i in range(n_inst):
+            live[i] = first[i] <= d <= last[i] and active[universe[i], d]
+
+        # --- 賣出檢查 (全部實例先賣，共用資金池時賣出的錢當天就能再買) ---
+        for i in range(n_inst):
+            if not live[i]: continue
+            if rules[i] < TOP3:
+                if n_held[i] == 0: continue
+                h = held[i, 0]
+                if not present[d, h]: continue
+                price = close[d, h]
+                days = day_num[d] - buy_day[i, 0]
+                pnl = (price - entry[i, 0]) / entry[i, 0]
+                prev_high = highest[i, 0]
+                if price > highest[i, 0]: highest[i, 0] = price
+
+                reason = -1
+                value = 0.0
+                if rules[i] == CLASSIC:
+                    if pnl > 0.20:
+                        reason, value = TAKE_PROFIT, pnl
+                    elif pnl < -0.15:
+                        reason = STOP_LOSS
+                    elif days > 15 and pnl > -0.05:
+                        reason, value = STUCK, days
+                else:
+                    # 與原本的寫法相同: 回落幅度用「今天更新前」的最高價
+                    drop_from_high = (prev_high - price) / prev_high
+                    if pnl > 0.05 and drop_from_high > 0.05:
+                        reason, value = PEAK_LOCK, (prev_high - entry[i, 0]) / entry[i, 0]
+                    elif pnl < -0.10:
+                        reason = STRICT_STOP
+                    elif days > 15 and pnl > -0.05:
+                        reason, value = STUCK, days
+
+                if reason >= 0:
+                    w = wallet[i]
+                    cash[w] += (shares[i, 0] * price - commission)
+                    ev_inst[n_ev], ev_day[n_ev], ev_kind[n_ev], ev_ticker[n_ev] = i, d, SELL, h
+                    ev_price[n_ev], ev_reason[n_ev], ev_value[n_ev], ev_cash[n_ev] = price, reason, value, cash[w]
+                    n_ev += 1
+                    n_held[i] = 0
+                continue
+
+            # AI: ATR 止損 -> 依 EMA20 強弱的移動停利 -> 到期，依持股順序逐檔檢查
+            m = models[i]
+            fee = params[i, P_FEE]
+            kept = 0
+            for s in range(n_held[i]):
+                h = held[i, s]
+                reason = -1
+                price = close[d, h]
+                if present[d, h] and not np.isnan(price):
+                    if price > highest[i, s]: highest[i, s] = price
+                    drop_from_peak = (price - highest[i, s]) / highest[i, s]
+                    held_days = day_num[d] - buy_day[i, s]
+                    if price <= stop[i, s]:
+                        reason = ATR_STOP
+                        cooldown[i, h] = day_num[d] + np.int64(params[i, P_COOLDOWN])
+                    elif price > ema20[m, d, h]:
+                        if drop_from_peak <= -params[i, P_STRONG]: reason = STRONG_PULLBACK
+                    else:
+                        if drop_from_peak <= -params[i, P_WEAK]: reason = WEAK_BOUNCE
+                    if reason < 0 and held_days >= params[i, P_TIME_STOP]: reason = TIME_STOP
+
+                if reason >= 0:
+                    w = wallet[i]
+                    net_revenue = shares[i, s] * price - fee
+                    total_cost = (shares[i, s] * entry[i, s]) + fee
+                    net_profit = net_revenue - total_cost
+                    cash[w] += net_revenue
+                    ev_inst[n_ev], ev_day[n_ev], ev_kind[n_ev], ev_ticker[n_ev] = i, d, SELL, h
+                    ev_price[n_ev], ev_reason[n_ev], ev_value[n_ev], ev_cash[n_ev] = price, reason, 0.0, cash[w]
+                    ev_profit[n_ev], ev_pct[n_ev] = net_profit, (net_profit / total_cost) * 100
+                    n_ev += 1
+                else:
+                    held[i, kept], shares[i, kept], entry[i, kept], highest[i, kept] = h, shares[i, s], entry[i, s], highest[i, s]
+                    buy_day[i, kept], stop[i, kept], conf[i, kept] = buy_day[i, s], stop[i, s], conf[i, s]
+                    kept += 1
+            n_held[i] = kept
+
+        # --- 買入檢查 ---
+        idle[:] = 0
+        for i in range(n_inst):
+            if live[i] and n_held[i] < (1 if rules[i] < TOP3 else AI_MAX_HOLDINGS): idle[wallet[i]] += 1
+        # 禿鷹: RSI 最低的候選 (同分取股票順序在前的)
+        best = -1
+        for j in range(n_tickers):
+            if present[d, j] and buy_ok[d, j] and (best < 0 or rsi[d, j] < rsi[d, best]): best = j
+        for i in range(n_inst):
+            if not live[i] or n_held[i] >= (1 if rules[i] < TOP3 else AI_MAX_HOLDINGS): continue
+            w = wallet[i]
+            amount = cash[w] / idle[w]
+            idle[w] -= 1
+            if rules[i] < TOP3:
+                if best >= 0 and amount > MIN_CASH:
+                    price = close[d, best]
+                    held[i, 0], shares[i, 0], entry[i, 0], highest[i, 0], buy_day[i, 0] = best, (amount - commission) / price, price, price, day_num[d]
+                    n_held[i] = 1
+                    cash[w] -= amount
+                    ev_inst[n_ev], ev_day[n_ev], ev_kind[n_ev], ev_ticker[n_ev] = i, d, BUY, best
+                    ev_price[n_ev], ev_reason[n_ev], ev_value[n_ev], ev_cash[n_ev] = price, -1, rsi[d, best], cash[w]
+                    n_ev += 1
+                continue
+
+            # AI: 大盤站上 EMA60 時，在動能前 N 名裡挑勝率最高的 (略過已持有 / 冷卻中；MA30 另外要 MA30 向上且站上)
+            m = models[i]
+            if not bullish[m, d]: continue
+            pick, pick_prob = -1, 0.0
+            for k in range(top.shape[2]):
+                j = top[m, d, k]
+                if j < 0: continue
+                owned = False
+                for s in range(n_held[i]):
+                    if held[i, s] == j: owned = True
+                if owned or day_num[d] < cooldown[i, j]: continue
+                if rules[i] == MA30 and not (ma30_slope[m, d, j] > 0 and close[d, j] > (ma30[m, d, j] * params[i, P_BUFFER])): continue
+                if prob[m, d, j] > pick_prob: pick, pick_prob = j, prob[m, d, j]
+            if pick < 0 or pick_prob <= params[i, P_THRESHOLD]: continue
+
+            price = close[d, pick]
+            total_equity = amount
+            for s in range(n_held[i]):
+                h = held[i, s]
+                if present[d, h] and not np.isnan(close[d, h]): total_equity += shares[i, s] * close[d, h]
+            invest_budget = total_equity * params[i, P_ALLOC]
+            if invest_budget > amount: invest_budget = amount
+            available = invest_budget - params[i, P_FEE]
+            if available > price:
+                s = n_held[i]
+                held[i, s], shares[i, s], entry[i, s], highest[i, s], buy_day[i, s] = pick, available / price, price, price, day_num[d]
+                stop[i, s], conf[i, s] = price - (atr[m, d, pick] * params[i, P_ATR_MULT]), pick_prob
+                n_held[i] += 1
+                cash[w] -= (shares[i, s] * price + params[i, P_FEE])
+                ev_inst[n_ev], ev_day[n_ev], ev_kind[n_ev], ev_ticker[n_ev] = i, d, BUY, pick
+                ev_price[n_ev], ev_reason[n_ev], ev_value[n_ev], ev_cash[n_ev] = price, -1, pick_prob, cash[w]
+                ev_profit[n_ev], ev_pct[n_ev] = 0.0, 0.0
+                n_ev += 1
+
+        # --- 資產結算 (每個錢包；當天沒有活動實例的錢包為 NaN) ---
+        # 禿鷹持股用最後看到的收盤價 (沒看過用成本)，AI 持股只算當天有收盤價的 (與各自的 Python 迴圈相同)
+        for i in range(n_inst):
+            if not live[i]: continue
+            w = wallet[i]
+            if np.isnan(equity[d, w]): equity[d, w] = cash[w]
+            for s in range(n_held[i]):
+                h = held[i, s]
+                if rules[i] < TOP3:
+                    equity[d, w] += shares[i, s] * (latest[h] if not np.isnan(latest[h]) else entry[i, s])
+                elif present[d, h] and not np.isnan(close[d, h]):
+                    equity[d, w] += shares[i, s] * close[d, h]
+
+    events = (ev_inst[:n_ev], ev_day[:n_ev], ev_kind[:n_ev], ev_ticker[:n_ev], ev_price[:n_ev],
+              ev_reason[:n_ev], ev_value[:n_ev], ev_cash[:n_ev], ev_profit[:n_ev], ev_pct[:n_ev])
+    return events, equity
+
+
+# ===========================
+# 與 run_simulation / AI 回測的資料格式互轉
+# ===========================
+def reason_text(rule, reason, value):
+    if reason == TAKE_PROFIT: return f"💰 獲利達標 (+{value*100:.1f}%)"
+    if reason == STOP_LOSS: return f"💀 止損 (-15%)"
+    if reason == STUCK: return f"💤 資金卡死 ({int(value)}天)"
+    if reason == PEAK_LOCK: return f"📉 高點回落鎖利 (最高+{value*100:.1f}%)"
+    if reason == STRICT_STOP: return f"🛡️ 嚴格止損 (-10%)"
+    if reason == ATR_STOP: return f"🛑 ATR止損"
+    if reason == STRONG_PULLBACK: return f"📉 強勢回調止盈" if rule == TOP3 else f"📉 強勢回調"
+    if reason == WEAK_BOUNCE: return f"🏃 弱勢反彈止盈" if rule == TOP3 else f"🏃 弱勢反彈"
+    if reason == TIME_STOP: return f"⏰ 到期"
+    if rule == TOP3: return f"AI信心 {value*100:.1f}%"
+    if rule == MA30: return f"Top3+MA30+AI {value*100:.1f}%"
+    return f"RSI: {value:.1f}"
+
+
+def run_lockstep(instances, data_cache, tickers, commission, pool=False, latest_prices=None, models=None):
+    # instances: [{"name", "strategy": classic/super/top3/ma30, "start", "end", "portfolio"}]
+    #   AI 實例可以另外帶 "cooldown" ({ticker: 冷卻到期日}，會就地更新)
+    # data_cache / tickers: 禿鷹的股票池；models: {top3/ma30: ai_model(...)}，AI 股票池裡的股票會併進同一份面板
+    # 回傳 {錢包名稱: (trade_logs, balance_history)}；獨立錢包時名稱就是實例名稱，共用資金池時只有 "pool"
+    # (共用資金池的初始現金取各實例 portfolio 現金的總和，跑完後現金留在池裡、portfolio['cash'] 為 0)。
+    # portfolio 會就地更新成跑完後的狀態
+    latest_prices = {} if latest_prices is None else latest_prices
+    models = models or {}
+    frames = {t: data_cache[t] for t in tickers if t in data_cache}
+    panel_tickers = list(tickers)
+    for model in models.values():
+        for t in model["rank"]["tickers"]:
+            if t not in frames: frames[t] = model["full_data"][t]
+            if t not in panel_tickers: panel_tickers.append(t)
+    dates = trading_calendar.sessions(list(frames.values()), min(x["start"] for x in instances), max(x["end"] for x in instances))
+    arrays = align(frames, panel_tickers, dates, signal_tickers=tickers)
+
+    # AI 模型各一層 (Top 3 與 MA30 的特徵不同，各有自己的勝率表)；同一個模型的所有實例共用
+    model_names = list(models)
+    aligned = [align_model(models[name], dates, panel_tickers, arrays["close"], arrays["present"]) for name in model_names]
+    n_days, n_tickers = arrays["close"].shape
+    n_models = max(1, len(aligned))
+
+    def stack(key, fill, dtype, shape=(n_days, n_tickers)):
+        out = np.full((n_models,) + shape, fill, dtype=dtype)
+        for m, a in enumerate(aligned): out[m] = a[key]
+        return out
+
+    top_n = max([a["top"].shape[1] for a in aligned] or [1])
+    top = np.full((n_models, n_days, top_n), -1, dtype=np.int64)
+    for m, a in enumerate(aligned): top[m, :, :a["top"].shape[1]] = a["top"]
+    active = np.zeros((1 + n_models, n_days), dtype=np.bool_)
+    active[0] = arrays["present"][:, [j for j, t in enumerate(panel_tickers) if t in frames and t in tickers]].any(axis=1)
+    for m, a in enumerate(aligned): active[1 + m] = a["active"]
+
+    n = len(instances)
+    rules = np.array([RULES[x["strategy"]] for x in instances], dtype=np.int64)
+    model_idx = np.array([model_names.index(x["strategy"]) if x["strategy"] in models else 0 for x in instances], dtype=np.int64)
+    universe = np.where(rules >= TOP3, 1 + model_idx, 0)
+    params = np.zeros((n, N_PARAMS))
+    for i, x in enumerate(instances):
+        if x["strategy"] in models: params[i] = models[x["strategy"]]["params"]
+    first = np.array([dates.searchsorted(pd.Timestamp(x["start"])) for x in instances], dtype=np.int64)
+    last = np.array([dates.searchsorted(pd.Timestamp(x["end"]), side="right") - 1 for x in instances], dtype=np.int64)
+    wallet = np.zeros(n, dtype=np.int64) if pool else np.arange(n, dtype=np.int64)
+    names = ["pool"] if pool else [x["name"] for x in instances]
+    cash = np.zeros(len(names))
+    n_slots = AI_MAX_HOLDINGS if (rules >= TOP3).any() else 1
+    n_held = np.zeros(n, dtype=np.int64)
+    held = np.full((n, n_slots), -1, dtype=np.int64)
+    shares, entry, highest, stop, conf = (np.zeros((n, n_slots)) for _ in range(5))
+    buy_day = np.zeros((n, n_slots), dtype=np.int64)
+    cooldown = np.zeros((n, n_tickers), dtype=np.int64)
+    for i, x in enumerate(instances):
+        portfolio = x["portfolio"]
+        cash[wallet[i]] += portfolio['cash']
+        limit = 1 if rules[i] < TOP3 else AI_MAX_HOLDINGS
+        if len(portfolio['holdings']) > limit: raise ValueError(f"{x['strategy']} 策略最多只持有 {limit} 檔股票")
+        for s, h in enumerate(portfolio['holdings']):
+            held[i, s], shares[i, s], entry[i, s] = panel_tickers.index(h['Ticker']), h['Shares'], h['Entry']
+            highest[i, s], buy_day[i, s] = h.get('Highest', h['Entry']), day_numbers([pd.to_datetime(h['BuyDate'])])[0]
+            stop[i, s], conf[i, s] = h.get('ATR_Stop_Price', 0), h.get('Probability', 0)
+        n_held[i] = len(portfolio['holdings'])
+        for t, until in x.get("cooldown", {}).items():
+            if t in panel_tickers: cooldown[i, panel_tickers.index(t)] = day_numbers([until])[0]
+    latest = np.array([latest_prices.get(t, np.nan) for t in panel_tickers], dtype=np.float64)
+
+    events, equity = lockstep_kernel(rules, model_idx, universe, first, last, wallet, params, arrays["present"], arrays["close"], active,
+                                     arrays["buy_ok"], arrays["rsi"], arrays["day_num"], float(commission),
+                                     stack("prob", 0.0, np.float64), top, stack("bullish", False, np.bool_, (n_days,)),
+                                     stack("ema20", np.nan, np.float64), stack("atr", np.nan, np.float64),
+                                     stack("ma30", np.nan, np.float64), stack("ma30_slope", np.nan, np.float64),
+                                     cash, n_held, held, shares, entry, highest, buy_day, stop, conf, cooldown, latest)
+
+    date_strs = [d.strftime("%Y-%m-%d") for d in dates]
+    results = {name: ([], []) for name in names}
+    for i, d, kind, j, price, reason, value, ev_cash, profit, pct in zip(*events):
+        action = "BUY" if kind == BUY else "SELL"
+        if rules[i] < TOP3:
+            row = {"Date": date_strs[d], "Action": action, "Ticker": panel_tickers[j], "Price": round(price, 2),
+                   "Reason": reason_text(rules[i], reason, value), "Balance": round(ev_cash, 2)}
+        else:
+            # AI 回測的列不四捨五入；買進列的損益寫 0 (整數，與原本的 CSV 相同)
+            row = {"Date": date_strs[d], "Action": action, "Ticker": panel_tickers[j], "Price": price,
+                   "Reason": reason_text(rules[i], reason, value), "Profit_USD": profit if kind == SELL else 0,
+                   "Profit_Pct": pct if kind == SELL else 0, "Balance": ev_cash}
+        if pool: row["Strategy"] = instances[i]["name"]   # 共用資金池時標明是哪個實例的交易
+        results[names[wallet[i]]][0].append(row)
+    for w, name in enumerate(names):
+        rows = np.flatnonzero(~np.isnan(equity[:, w]))
+        rounded = all(rules[i] < TOP3 for i in range(n) if wallet[i] == w)
+        results[name][1].extend({"Date": date_strs[d], "Equity": round(equity[d, w], 2) if rounded else equity[d, w]} for d in rows)
+
+    end_day = arrays["day_num"][-1] if len(dates) else 0
+    for i, x in enumerate(instances):
+        portfolio = x["portfolio"]
+        portfolio['cash'] = float(cash[wallet[i]]) if not pool else 0.0
+        if rules[i] < TOP3:
+            portfolio['holdings'] = [{
+                "Ticker": panel_tickers[held[i, s]], "Shares": float(shares[i, s]), "Entry": float(entry[i, s]),
+                "BuyDate": str(np.datetime64(int(buy_day[i, s]), "D")), "Highest": float(highest[i, s])
+            } for s in range(n_held[i])]
+        else:
+            portfolio['holdings'] = [{
+                "Ticker": panel_tickers[held[i, s]], "Shares": float(shares[i, s]), "Entry": float(entry[i, s]),
+                "Highest": float(highest[i, s]), "BuyDate": pd.Timestamp(np.datetime64(int(buy_day[i, s]), "D")),
+                "Probability": float(conf[i, s]), "ATR_Stop_Price": float(stop[i, s])
+            } for s in range(n_held[i])]
+            # 已經過期的冷卻不必留著 (原本的迴圈是下次檢查到才刪，效果相同)
+            if "cooldown" in x:
+                x["cooldown"].clear()
+                x["cooldown"].update({panel_tickers[j]: pd.Timestamp(np.datetime64(int(cooldown[i, j]), "D"))
+                                      for j in np.flatnonzero(cooldown[i] > end_day)})
+    for j, t in enumerate(panel_tickers):
+        if not np.isnan(latest[j]): latest_prices[t] = latest[j]
+    return results
+
+
+def run_vulture(strategy_type, data_cache, tickers, dates, portfolio, latest_prices, commission):
+    # 單一實例的 lockstep: 回傳 (trade_logs, balance_history)，格式與 run_simulation 逐日迴圈寫出的列相同；
+    # portfolio / latest_prices 會就地更新成跑完後的狀態 (檢查點照常存)
+    instance = {"name": strategy_type, "strategy": strategy_type, "portfolio": portfolio,
+                "start": dates[0].strftime("%Y-%m-%d"), "end": dates[-1].strftime("%Y-%m-%d")}
+    return run_lockstep([instance], data_cache, tickers, commission, latest_prices=latest_prices)[strategy_type]
+
+
+def run_ai(strategy_type, model, dates, portfolio, cooldown_list):
+    # AI 回測的單一實例: 回傳 (trade_log, balance_history)，與原本日迴圈寫出的列相同；
+    # portfolio / cooldown_list 會就地更新成跑完後的狀態
+    instance = {"name": strategy_type, "strategy": strategy_type, "portfolio": portfolio, "cooldown": cooldown_list,
+                "start": dates[0].strftime("%Y-%m-%d"), "end": dates[-1].strftime("%Y-%m-%d")}
+    return run_lockstep([instance], {}, [], 0, models={strategy_type: model})[strategy_type]
+
+
+def load_ai_model(module, start, end):
+    # 載入 AI 回測模組 (ai_backtest_2 / ai_backtest_ma30_2) 在 [start, end] 的資料，沿固定排程填好勝率表
+    # (表裡沒有的格子會訓練 LSTM，很慢)；回傳的模型給同一策略的所有實例共用
+    import ai_training
+    import ranking
+    module.START_DATE, module.END_DATE = start, end
+    full_data, market_df = module.load_inputs()
+    rank = ranking.from_full_data(full_data, module.TICKERS, module.TOP_N_MOMENTUM)
+    dates = trading_calendar.sessions(list(full_data.values()) + [market_df], start, end)
+    ai_training.fill_prob_table(module.predict_signal, module.prob_table, rank, dates, full_data)
+    return ai_model(module, full_data, market_df, rank)
+
+
+if __name__ == "__main__":
+    import argparse
+    import run_backtest
+
+    parser = argparse.ArgumentParser(description="多策略同步回測: 各自獨立 vs 共用資金池")
+    parser.add_argument("--period", default="2025_now", choices=list(run_backtest.TEST_PERIODS))
+    parser.add_argument("--ai", action="store_true", help="連 Top 3 / MA30 一起同步 (要先填勝率表，會訓練 LSTM，很慢)")
+    args = parser.parse_args()
+
+    run_backtest.download_data()
+    start, end = run_backtest.TEST_PERIODS[args.period]
+    initial_cash = {s: run_backtest.INITIAL_CASH for s in STRATEGIES}
+    models = {}
+    if args.ai:
+        import ai_backtest_2
+        import ai_backtest_ma30_2
+        for name, module in (("top3", ai_backtest_2), ("ma30", ai_backtest_ma30_2)):
+            print(f"🤖 {name}: 載入資料並填勝率表...")
+            models[name] = load_ai_model(module, start, end)
+            initial_cash[name] = module.INITIAL_CASH
+
+    def instances():
+        return [{"name": s, "strategy": s, "start": start, "end": end, "cooldown": {},
+                 "portfolio": {"cash": cash, "holdings": []}} for s, cash in initial_cash.items()]
+
+    separate = run_lockstep(instances(), run_backtest.data_cache, run_backtest.TICKERS, run_backtest.COMMISSION, models=models)
+    pooled = run_lockstep(instances(), run_backtest.data_cache, run_backtest.TICKERS, run_backtest.COMMISSION, pool=True, models=models)
+
+    print(f"\n{'錢包':<10}{'起始資金':>10}{'最終資產':>12}{'報酬%':>9}{'交易數':>8}")
+    for name, (trade_logs, balance_history) in list(separate.items()) + list(pooled.items()):
+        initial = sum(initial_cash.values()) if name == "pool" else initial_cash[name]
+        final = balance_history[-1]["Equity"] if balance_history else initial
+        print(f"{name:<10}{initial:>10}{final:>12.2f}{(final / initial - 1) * 100:>9.2f}{len(trade_logs):>8}")
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+# ===========================
+# 📅 交易日曆 (由已存的 K 線推出)
+# ===========================
+# 回測原本逐日迭代 (禿鷹用 pd.date_range 每個日曆日、AI 回測用 freq='B' 工作日)，
+# 週末與交易所休市日也要跑一圈，每圈還要對每檔股票做一次 date in index 檢查。
+# 這裡直接取所有股票 (與大盤) K 線日期的聯集當作交易日，各引擎都只迭代真正開市的日子，
+# 資產列也只落在交易日上。某天只有部分股票有資料 (停牌 / 新上市) 仍算交易日，
+# 當天哪些股票有 K 線用 members 事先整理好，迴圈內只做一次 dict 查詢。
+
+
+def sessions(frames, start=None, end=None):
+    # frames: {ticker: DataFrame} 或 DataFrame 的 list；回傳 [start, end] 內排序好的 DatetimeIndex
+    if isinstance(frames, dict): frames = list(frames.values())
+    indexes = [df.index.values for df in frames if df is not None and len(df)]
+    if not indexes: return pd.DatetimeIndex([])
+    dates = pd.DatetimeIndex(np.unique(np.concatenate(indexes)))
+    if start is not None: dates = dates[dates >= pd.Timestamp(start)]
+    if end is not None: dates = dates[dates <= pd.Timestamp(end)]
+    return dates
+
+
+def members(frames, dates, tickers):
+    # {交易日: 當天有 K 線的股票}，每天的股票順序與 tickers 相同
+    on_date = {d: [] for d in dates}
+    for t in tickers:
+        if t not in frames: continue
+        for d in frames[t].index.intersection(dates):
+            on_date[d].append(t)
+    return on_date
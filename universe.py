@@ -0,0 +1,142 @@
+import os
+import json
+import datetime
+import pandas as pd
+import ranking
+
+# ===========================
+# 🌐 股票池設定 + 第一階段向量化篩選
+# ===========================
+# 股票清單統一放在 universe.json，各腳本用名稱取用；環境變數 UNIVERSE 可以覆蓋預設清單:
+#   UNIVERSE=sp500 python ai_backtest_ma30_2.py
+# 動態清單 (sp500) 只從快取檔讀取；快取要先用 python universe.py --refresh-sp500 建立 (需要網路與 lxml)，
+# import 模組時絕不上網，離線環境也能 import 回測腳本。
+#
+# 大股票池的流程分兩階段:
+#   1. 第一階段 (便宜): 只用收盤價，一次對整個 (日期 x 股票) 面板算 EMA60 動能與 MA30 斜率/突破
+#   2. 第二階段 (昂貴): 只有通過第一階段的股票才計算完整指標並交給 LSTM 評分
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UNIVERSE_FILE = os.path.join(BASE_DIR, "universe.json")
+SP500_URL = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
+DOWNLOAD_CHUNK = 100
+
+
+def load_config():
+    with open(UNIVERSE_FILE, "r") as f:
+        return json.load(f)
+
+
+def refresh_sp500(cache_path):
+    # 從維基百科抓最新成分股；Yahoo 代號用 '-' 取代 '.' (例如 BRK.B -> BRK-B)
+    table = pd.read_html(SP500_URL)[0]
+    tickers = sorted(table['Symbol'].astype(str).str.replace('.', '-', regex=False).tolist())
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, "w") as f:
+        json.dump({"updated": datetime.datetime.now().strftime("%Y-%m-%d"), "tickers": tickers}, f, indent=4)
+    return tickers
+
+
+def get_tickers(default, name=None):
+    name = name or os.environ.get("UNIVERSE") or default
+    entry = load_config()[name]
+    if isinstance(entry, list): return list(entry)
+
+    cache_path = os.path.join(BASE_DIR, entry["cache"])
+    if not os.path.exists(cache_path):
+        raise FileNotFoundError(f"找不到股票池 {name} 的快取 {cache_path}，請先執行 python universe.py --refresh-sp500")
+    with open(cache_path, "r") as f:
+        return json.load(f)["tickers"]
+
+
+def all_listed_tickers():
+    # universe.json 中所有固定清單的聯集 (不含需要上網抓的動態清單)
+    tickers = []
+    for entry in load_config().values():
+        if isinstance(entry, list):
+            tickers += [t for t in entry if t not in tickers]
+    return tickers
+
+
+def download_universe(tickers, start, end=None, **kwargs):
+    # 大股票池用批次下載 (一次 100 檔)，比逐檔呼叫 yf.download 快很多
+    import yfinance as yf
+    full_data = {}
+    for i in range(0, len(tickers), DOWNLOAD_CHUNK):
+        chunk = tickers[i:i + DOWNLOAD_CHUNK]
+        try:
+            raw = yf.download(chunk, start=start, end=end, progress=False, group_by='ticker', threads=True, **kwargs)
+        except Exception as e:
+            print(f"❌ 批次下載失敗 ({chunk[0]}...): {e}")
+            continue
+        for t in chunk:
+            if isinstance(raw.columns, pd.MultiIndex):
+                if t not in raw.columns.get_level_values(0): continue
+                df = raw[t]
+            else:
+                df = raw
+            df = df.dropna(how='all').copy()
+            if not df.empty: full_data[t] = df
+    return full_data
+
+
+def close_panel(full_data):
+    return pd.concat({t: df['Close'] for t, df in full_data.items()}, axis=1).sort_index()
+
+
+def stage_one(close):
+    # close: (日期 x 股票) 的收盤價。與 ta 的 ema_indicator / sma_indicator + bfill 數值完全一致
+    ema60 = close.ewm(span=60, min_periods=60, adjust=False).mean()
+    ma30 = close.rolling(window=30, min_periods=30).mean()
+    ma30_slope = ma30.diff()
+    valid = close.notna()
+    stage = {
+        "Close": close,
+        "EMA60": ema60.bfill().where(valid),
+        "MA30": ma30.bfill().where(valid),
+        "MA30_Slope": ma30_slope.bfill().where(valid),
+        "Price_Change": close.diff().bfill().where(valid),
+    }
+    stage["Momentum"] = (stage["Close"] / stage["EMA60"]).where(stage["EMA60"] > 0)
+    return stage
+
+
+def momentum_top_n(stage, top_n):
+    # 每天動能分數前 N 名 (整個面板一次算完)
+    momentum = stage["Momentum"]
+    return pd.DataFrame(ranking.top_n_mask(momentum.to_numpy(dtype=float), top_n), index=momentum.index, columns=momentum.columns)
+
+
+def ma30_trend(stage, buffer):
+    return (stage["MA30_Slope"] > 0) & (stage["Close"] > stage["MA30"] * buffer)
+
+
+def ma30_breakout(stage, buffer):
+    return ma30_trend(stage, buffer) & (stage["Price_Change"] > 0)
+
+
+def shortlisted_tickers(mask, start=None, end=None):
+    # 回傳在 [start, end] 期間內至少通過一次篩選的股票
+    window = mask.loc[start:end]
+    return [t for t in window.columns if bool(window[t].any())]
+
+
+def stage_one_frame(stage, ticker, columns):
+    # 沒進入短名單的股票只保留排序/估值需要的欄位，不必跑完整 add_technical_indicators
+    df = pd.DataFrame({c: stage[c][ticker] for c in columns})
+    return df[stage["Close"][ticker].notna()]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="股票池工具")
+    parser.add_argument("--refresh-sp500", action="store_true", help="重新抓取 S&P 500 成分股")
+    args = parser.parse_args()
+
+    if args.refresh_sp500:
+        entry = load_config()["sp500"]
+        tickers = refresh_sp500(os.path.join(BASE_DIR, entry["cache"]))
+        print(f"✅ S&P 500 成分股已更新: {len(tickers)} 檔")
+    for name, entry in load_config().items():
+        size = len(entry) if isinstance(entry, list) else "動態"
+        print(f"🌐 {name}: {size}")
@@ -0,0 +1,178 @@
+import os
+import json
+import datetime
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import feature_panel
+import scaling
+
+# ===========================
+# 🧪 LSTM 分類器的 walk-forward 交叉驗證
+# ===========================
+# 回測的資產曲線混了模型品質和出場規則，這裡單獨量模型的樣本外表現:
+#   每檔股票的歷史切成 N_FOLDS 個連續的測試區塊 (最後 N_FOLDS x TEST_DAYS 個有標籤的交易日)，
+#   第 k 折用測試區塊之前的所有視窗訓練 (expanding)，中間隔 PREDICT_DAYS 天避免標籤偷看到測試期，
+#   再對測試區塊算 AUC 與 BUY_PROB_THRESHOLD 下的精確率。
+# 特徵矩陣、標籤、逐日累積縮放範圍每檔只準備一次；視窗是 sliding_window_view (不複製)，
+# MinMax 是逐特徵的仿射轉換，所以每一折只要對要用的視窗乘上該折的 scale / min，加折數不必重新準備資料。
+# 各折在多個子行程平行訓練，縮放方式與 predict_signal / score_block 相同 (訓練用截止日的參數，測試逐日查表)。
+#   python walk_forward.py                       # Top 3 策略 (ai_backtest_2) 的模型
+#   python walk_forward.py --strategy ma30 --folds 8 --workers 4
+STRATEGY_MODULES = {"top3": "ai_backtest_2", "ma30": "ai_backtest_ma30_2"}
+N_FOLDS = 5
+TEST_DAYS = 60
+EPOCHS = 10
+SEED = 42
+DATA_DIR = "data"
+
+
+def output_path(strategy):
+    return os.path.join(DATA_DIR, f"walk_forward_{strategy}.json")
+
+
+# ===========================
+# 共用資料 (每檔一次)
+# ===========================
+def prepare_ticker(df, features, look_back, horizon, target_roi):
+    # 回傳子行程需要的全部陣列: 原始特徵、標籤、逐日累積 min/max
+    if not all(f in df.columns for f in features): return None
+    feature_panel.add_labels(df, horizon, target_roi)
+    data = df[features].to_numpy(dtype=np.float64)
+    labels = df[feature_panel.label_column(horizon, target_roi)].to_numpy(dtype=np.float64)
+    return {"data": data, "labels": labels, "running": scaling.expanding(data, features),
+            "dates": df.index, "look_back": look_back, "horizon": horizon}
+
+
+def make_folds(n_rows, look_back, horizon, n_folds=N_FOLDS, test_days=TEST_DAYS):
+    # 第 i 列的視窗 = data[i - look_back : i]，標籤在 i + horizon 天內才確定，所以可用的列是 [look_back, n_rows - horizon)
+    # 回傳 [(訓練列, 測試列)]；訓練列到測試起點前 horizon 列為止 (標籤不跨進測試期)
+    end = n_rows - horizon
+    first_test = end - n_folds * test_days
+    if first_test - horizon <= look_back: return []
+    folds = []
+    for k in range(n_folds):
+        t0 = first_test + k * test_days
+        folds.append((np.arange(look_back, t0 - horizon), np.arange(t0, t0 + test_days)))
+    return folds
+
+
+def scaled_windows(prepared, rows, fit_rows=None):
+    # fit_rows=None: 每個視窗用「該列之前」的資料縮放 (測試期逐日查表，與 score_block 相同)
+    # fit_rows=n: 全部用前 n 列 fit 的參數 (訓練時的截止日，與 prepare_data 相同)
+    look_back = prepared["look_back"]
+    windows = np.lib.stride_tricks.sliding_window_view(prepared["data"], look_back, axis=0).transpose(0, 2, 1)
+    params = scaling.at(prepared["running"], rows if fit_rows is None else fit_rows)
+    scale, shift = params["scale"], params["min"]
+    if fit_rows is None: scale, shift = scale[:, np.newaxis, :], shift[:, np.newaxis, :]
+    return windows[rows - look_back] * scale + shift
+
+
+# ===========================
+# 子行程: 訓練一折
+# ===========================
+def _fit_fold(module_name, ticker, fold, prepared, train_rows, test_rows):
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')
+    import tensorflow as tf
+    import distill
+    module = importlib.import_module(module_name)
+    tf.keras.utils.set_random_seed(SEED + fold)
+
+    x_train = scaled_windows(prepared, train_rows, fit_rows=test_rows[0])
+    y_train = prepared["labels"][train_rows]
+    x_test = scaled_windows(prepared, test_rows)
+    if distill.is_student_backend():
+        model = distill.retrain(None, module.build_model, x_train, y_train, prepared["dates"][test_rows[0]])['model']
+    else:
+        model = module.build_model((x_train.shape[1], x_train.shape[2]))
+        model.fit(x_train, y_train, batch_size=32, epochs=EPOCHS, verbose=0)
+    probs = model.predict(x_test, batch_size=256, verbose=0)[:, 0]
+    return ticker, fold, probs.astype(float), prepared["labels"][test_rows]
+
+
+# ===========================
+# 指標
+# ===========================
+def metrics(probs, labels, threshold):
+    from sklearn.metrics import roc_auc_score
+    picked = probs > threshold
+    return {
+        "auc": float(roc_auc_score(labels, probs)) if 0 < labels.sum() < len(labels) else None,
+        "precision": float(labels[picked].mean()) if picked.any() else None,
+        "signals": int(picked.sum()),
+        "base_rate": float(labels.mean()),
+        "n": int(len(labels)),
+    }
+
+
+def run_cv(strategy="top3", tickers=None, full_data=None, n_folds=N_FOLDS, test_days=TEST_DAYS, workers=None):
+    module_name = STRATEGY_MODULES[strategy]
+    module = importlib.import_module(module_name)
+    if full_data is None:
+        full_data = feature_panel.load_full_data(module.TICKERS)
+        if not full_data:
+            download_start = (datetime.datetime.strptime(module.START_DATE, "%Y-%m-%d") - datetime.timedelta(days=1000)).strftime("%Y-%m-%d")
+            full_data, _ = module.download_data(download_start)
+    tickers = [t for t in (tickers or module.TICKERS) if t in full_data]
+
+    tasks = []
+    for t in tickers:
+        prepared = prepare_ticker(full_data[t].copy(), module.FEATURES, module.LOOK_BACK, module.PREDICT_DAYS, module.TARGET_ROI_CLASS)
+        if prepared is None: continue
+        for k, (train_rows, test_rows) in enumerate(make_folds(len(prepared["data"]), module.LOOK_BACK, module.PREDICT_DAYS, n_folds, test_days)):
+            tasks.append((module_name, t, k, prepared, train_rows, test_rows))
+    print(f"🧪 {strategy}: {len({task[1] for task in tasks})} 檔 x {n_folds} 折 = {len(tasks)} 個模型")
+
+    results = {}
+    ctx = multiprocessing.get_context("spawn")   # TensorFlow 不適合 fork
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=ctx) as pool:
+        for ticker, fold, probs, labels in pool.map(_fit_fold, *zip(*tasks)) if tasks else []:
+            results.setdefault(ticker, {})[fold] = (probs, labels)
+
+    threshold = module.BUY_PROB_THRESHOLD
+    report = {"strategy": strategy, "generated_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+              "threshold": threshold, "folds": n_folds, "test_days": test_days, "tickers": {}}
+    all_probs, all_labels = [], []
+    for ticker in sorted(results):
+        folds = [results[ticker][k] for k in sorted(results[ticker])]
+        probs = np.concatenate([p for p, _ in folds])
+        labels = np.concatenate([y for _, y in folds])
+        all_probs.append(probs)
+        all_labels.append(labels)
+        report["tickers"][ticker] = {**metrics(probs, labels, threshold),
+                                     "per_fold": [metrics(p, y, threshold) for p, y in folds]}
+    if all_probs: report["overall"] = metrics(np.concatenate(all_probs), np.concatenate(all_labels), threshold)
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="LSTM 分類器 walk-forward 交叉驗證")
+    parser.add_argument("--strategy", default="top3", choices=list(STRATEGY_MODULES))
+    parser.add_argument("--tickers", default="", help="只跑指定股票，逗號分隔")
+    parser.add_argument("--folds", type=int, default=N_FOLDS)
+    parser.add_argument("--test-days", type=int, default=TEST_DAYS)
+    parser.add_argument("--workers", type=int, default=0, help="平行訓練的行程數 (預設 CPU 核心數)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    report = run_cv(args.strategy, [t for t in args.tickers.split(",") if t] or None,
+                    n_folds=args.folds, test_days=args.test_days, workers=args.workers or None)
+    path = output_path(args.strategy)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f, indent=4)
+    os.replace(tmp_path, path)
+
+    fmt = lambda v, spec: format(v, spec) if v is not None else "-"
+    print(f"\n{'股票':<8}{'AUC':>7}{'精確率':>8}{'訊號數':>8}{'基準率':>8}")
+    for t, m in report["tickers"].items():
+        print(f"{t:<8}{fmt(m['auc'], '.3f'):>7}{fmt(m['precision'], '.3f'):>8}{m['signals']:>8}{m['base_rate']:>8.3f}")
+    if "overall" in report:
+        m = report["overall"]
+        print(f"{'全部':<8}{fmt(m['auc'], '.3f'):>7}{fmt(m['precision'], '.3f'):>8}{m['signals']:>8}{m['base_rate']:>8.3f}")
+    print(f"✅ 完成 ({time.perf_counter() - t0:.1f}s)，結果寫到 {path}")